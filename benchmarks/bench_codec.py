@@ -0,0 +1,81 @@
+"""Benchmark of the commit codecs (see :mod:`pyvcsshark.codec`) against plain pickling of the commit models.
+
+Run it from the repository root via::
+
+    python -m benchmarks.bench_codec --hunks 5000 --hunk-size 400
+"""
+import argparse
+import json
+import pickle
+import random
+import timeit
+
+from pyvcsshark.codec import BaseCodec
+from pyvcsshark.parser import models
+from pyvcsshark.parser.models import CommitModel, FileModel, Hunk, PeopleModel, TagModel
+
+
+def create_commit(files, hunks_per_file, hunk_size, seed=0):
+    """ Creates a synthetic commit with the given number of files and hunks
+
+    :param files: number of changed files
+    :param hunks_per_file: number of hunks per changed file
+    :param hunk_size: number of characters of the content of each hunk
+    :param seed: seed for the random contents
+    """
+    rnd = random.Random(seed)
+    people = PeopleModel("Jane Doe", "jane@example.com")
+    changed_files = []
+    for i in range(files):
+        hunks = []
+        for j in range(hunks_per_file):
+            content = ''.join(rnd.choice('abcdefghijklmnopqrstuvwxyz \n') for k in range(hunk_size))
+            hunks.append(Hunk(j * 10, 3, j * 10, 2, content))
+        changed_files.append(FileModel("src/module%d/file%d.c" % (i % 50, i), 1000 + i, 3 * hunks_per_file,
+                                       2 * hunks_per_file, False, "M", hunks, None, "%040x" % i))
+    return CommitModel("%040x" % seed, (1 << 40) - 1, [TagModel("v1.0", "release", people, 1453380457, 60)],
+                       ["%040x" % (seed + 1)], people, people, "synthetic commit\n", changed_files, 1453380157, 60,
+                       1453380357, 60)
+
+
+def measure(name, encode, decode, commit, repeat):
+    data = encode(commit)
+    encode_time = min(timeit.repeat(lambda: encode(commit), number=1, repeat=repeat))
+    decode_time = min(timeit.repeat(lambda: decode(data), number=1, repeat=repeat))
+    return {'codec': name, 'bytes': len(data), 'encode_s': encode_time, 'decode_s': decode_time}
+
+
+def run(files, hunks_per_file, hunk_size, repeat):
+    """ Runs the benchmark and returns a list with one result dictionary per codec """
+    # Like in production runs, the models do not validate their values
+    models.set_validation(False)
+    commit = create_commit(files, hunks_per_file, hunk_size)
+    results = [measure('pickle (object graph)', lambda c: pickle.dumps(c), pickle.loads, commit, repeat)]
+    for identifier in BaseCodec.get_codec_choices():
+        codec = BaseCodec.find_correct_codec(identifier)
+        results.append(measure(identifier, codec.encode, codec.decode, commit, repeat))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the commit codecs against pickle')
+    parser.add_argument('--files', type=int, default=100, help='Number of changed files of the commit')
+    parser.add_argument('--hunks', type=int, default=50, help='Number of hunks per changed file')
+    parser.add_argument('--hunk-size', type=int, default=200, help='Number of characters per hunk')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of repetitions (the best one is reported)')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.files, args.hunks, args.hunk_size, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print("%-24s %12s %12s %12s" % ('codec', 'bytes', 'encode [ms]', 'decode [ms]'))
+    for result in results:
+        print("%-24s %12d %12.2f %12.2f" % (result['codec'], result['bytes'], result['encode_s'] * 1000,
+                                             result['decode_s'] * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""Benchmark of the parser and of whole runs on a synthetic repository (see :mod:`tests.repogen`). It measures
+
+* **initialize**: the ref walk of :func:`pyvcsshark.parser.gitparser.GitParser.initialize`
+* **parse**: :func:`pyvcsshark.parser.gitparser.GitParser.parse` with a datastore, which only encodes the commits and
+  discards them (:class:`tests.datastoremock.DiscardStore`)
+* **end-to-end (discard)**: a whole :class:`pyvcsshark.main.Application` run with the
+  :class:`tests.datastoremock.DiscardStore`
+* **end-to-end (mongo)**: a whole run with the :class:`pyvcsshark.datastores.mongostore.MongoStore`. It uses the
+  mongodb given by --db-hostname or, if mongod is on the path, a throwaway mongod with an empty database directory
+  (:class:`LocalMongo`). Otherwise, it is skipped. The round trips to the mongodb are traced (see
+  :mod:`pyvcsshark.tracing`) for the operations per commit.
+
+Every benchmark runs in a fresh child process (see :func:`isolated`), so that the peak resident set size of it and its
+workers is measured for each benchmark separately.
+
+Run it from the repository root via::
+
+    python -m benchmarks.bench_parser --commits 2000 --files 500 --json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+import timeit
+
+import pymongo
+
+from pyvcsshark.codec import BaseCodec
+from pyvcsshark.main import Application
+from pyvcsshark.memory import peak_rss
+from pyvcsshark.parser import models
+from pyvcsshark.parser.gitparser import GitParser
+from pyvcsshark.pipeline import WorkerPlan, WorkerPool
+from tests.datastoremock import DiscardStore, create_config
+from tests.repogen import RepositorySpec, generate_repository
+
+
+class LocalMongo(object):
+    """ Throwaway mongod, which is started on a free port with an empty database directory and removed afterwards
+
+    :param executable: path to mongod
+    :param timeout: seconds to wait for mongod to accept connections
+    """
+
+    def __init__(self, executable, timeout=30):
+        self.executable = executable
+        self.timeout = timeout
+        self.directory = None
+        self.process = None
+        self.port = None
+
+    def __enter__(self):
+        self.directory = tempfile.mkdtemp(prefix='bench-mongod-')
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+        self.process = subprocess.Popen([self.executable, '--dbpath', self.directory, '--port', str(self.port),
+                                         '--bind_ip', '127.0.0.1'], stdout=subprocess.DEVNULL,
+                                        stderr=subprocess.DEVNULL)
+
+        start_time = timeit.default_timer()
+        client = pymongo.MongoClient('127.0.0.1', self.port, serverSelectionTimeoutMS=500)
+        while True:
+            try:
+                client.admin.command('ping')
+                return self
+            except pymongo.errors.PyMongoError:
+                if self.process.poll() is not None or timeit.default_timer() - start_time > self.timeout:
+                    self.__exit__(None, None, None)
+                    raise Exception("mongod did not start")
+                time.sleep(0.2)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def reset_peak_rss():
+    """ Resets the peak resident set size of this process, which a forked child inherits from its parent (linux
+    only, it is kept otherwise) """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except (IOError, OSError):
+        pass
+
+
+def isolated(function, *args):
+    """ Runs the benchmark function in a fresh child process and returns its result with the peak resident set size
+    in bytes of the child and of its workers (peak_rss)
+
+    :param function: function, which returns a result dictionary (see :func:`result`)
+    :param args: arguments of the function
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+
+    def measure():
+        reset_peak_rss()
+        entry = function(*args)
+        if 'skipped' not in entry:
+            # ru_maxrss is given in kilobytes on linux
+            entry['peak_rss'] = max(peak_rss(), resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024)
+        sender.send(entry)
+
+    # The child starts the workers of the run, therefore it must not be a daemon
+    process = multiprocessing.Process(target=measure, name='benchmark')
+    process.start()
+    sender.close()
+    try:
+        return receiver.recv()
+    except EOFError:
+        process.join()
+        raise Exception("Benchmark %s failed with exit code %s" % (function.__name__, process.exitcode))
+    finally:
+        process.join()
+
+
+def result(benchmark, commits, seconds, **extra):
+    return dict({'benchmark': benchmark, 'commits': commits, 'seconds': seconds,
+                 'commits_per_s': commits / max(seconds, 1e-9)}, **extra)
+
+
+def measure_initialize(path):
+    parser = GitParser()
+    parser.detect(path)
+    start_time = timeit.default_timer()
+    parser.initialize()
+    return result('initialize', parser.get_number_of_commits(), timeit.default_timer() - start_time)
+
+
+def measure_parse(path, diff_workers, codec_identifier):
+    parser = GitParser()
+    parser.detect(path)
+    parser.initialize()
+    parser.worker_pool = WorkerPool()
+    datastore = DiscardStore()
+    datastore.codec = BaseCodec.find_correct_codec(codec_identifier)
+
+    start_time = timeit.default_timer()
+    parser.parse(path, datastore, diff_workers)
+    elapsed = timeit.default_timer() - start_time
+    parser.worker_pool.terminate()
+    return result('parse (discard)', datastore.commits.value, elapsed, diff_workers=diff_workers)
+
+
+def measure_application(benchmark, config):
+    application = Application(config)
+    extra = {}
+    if application.database_trace is not None:
+        trace = application.database_trace
+        extra['db_operations_per_commit'] = trace['commit_operations'] / max(trace['commits'], 1)
+    return result(benchmark, application.number_of_commits, application.elapsed, cores_per_job=config.cores_per_job,
+                  **extra)
+
+
+def measure_mongo(path, cores_per_job, codec_identifier, db_hostname=None, db_port=27017):
+    """ Runs the end-to-end benchmark with the mongodb (see module documentation) """
+    if db_hostname is None:
+        mongod = shutil.which('mongod')
+        if mongod is None:
+            return {'benchmark': 'end-to-end (mongo)', 'skipped': 'no mongodb given and no mongod on the path'}
+        with LocalMongo(mongod) as local_mongo:
+            return measure_mongo(path, cores_per_job, codec_identifier, '127.0.0.1', local_mongo.port)
+
+    trace_file, trace_path = tempfile.mkstemp(prefix='bench-trace-', suffix='.txt')
+    os.close(trace_file)
+    config = create_config(path, 'mongo', cores_per_job, codec_identifier, db_hostname, db_port, trace_db=trace_path)
+    client = pymongo.MongoClient(db_hostname, db_port)
+    client.drop_database(config.db_database)
+    client[config.db_database].project.insert_one({'name': config.project_name})
+    try:
+        return isolated(measure_application, 'end-to-end (mongo)', config)
+    finally:
+        client.drop_database(config.db_database)
+        os.remove(trace_path)
+
+
+def run(path, cores_per_job, codec_identifier='binary', db_hostname=None, db_port=27017):
+    """ Runs all benchmarks on the repository and returns a list with one result dictionary per benchmark """
+    # Like in production runs, the models do not validate their values
+    models.set_validation(False)
+    diff_workers = WorkerPlan(cores_per_job).diff_workers
+    return [
+        isolated(measure_initialize, path),
+        isolated(measure_parse, path, diff_workers, codec_identifier),
+        isolated(measure_application, 'end-to-end (discard)',
+                 create_config(path, 'discard', cores_per_job, codec_identifier)),
+        measure_mongo(path, cores_per_job, codec_identifier, db_hostname, db_port),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the parser and of whole runs on a synthetic repository')
+    parser.add_argument('--repository', help='Existing repository, which is used instead of a synthetic one')
+    parser.add_argument('--cores-per-job', type=int, default=4, help='Number of cores of the runs')
+    parser.add_argument('--commit-codec', default='binary', choices=BaseCodec.get_codec_choices())
+    parser.add_argument('--db-hostname', help='mongodb for the end-to-end benchmark (default: throwaway mongod)')
+    parser.add_argument('--db-port', type=int, default=27017)
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    RepositorySpec.add_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    directory = None
+    try:
+        if args.repository is not None:
+            repository = {'path': args.repository}
+        else:
+            directory = tempfile.mkdtemp(prefix='bench-repository-')
+            spec = RepositorySpec.from_arguments(args)
+            repository = dict(generate_repository(os.path.join(directory, 'repository'), spec), spec=spec.to_dict())
+
+        results = run(repository['path'], args.cores_per_job, args.commit_codec, args.db_hostname, args.db_port)
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({'repository': repository, 'results': results}, indent=2))
+        return
+
+    print("%-24s %10s %10s %12s %14s" % ('benchmark', 'commits', 'seconds', 'commits/s', 'peak RSS [MB]'))
+    for entry in results:
+        if 'skipped' in entry:
+            print("%-24s skipped: %s" % (entry['benchmark'], entry['skipped']))
+        else:
+            print("%-24s %10d %10.2f %12.1f %14.1f" % (entry['benchmark'], entry['commits'], entry['seconds'],
+                                                      entry['commits_per_s'], entry['peak_rss'] / 1024.0 / 1024.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark of the transports (see :mod:`pyvcsshark.transport`), which hand the encoded commits from the parser
+processes over to the storage processes. Large-hunk commits are used as stress case.
+
+Run it from the repository root via::
+
+    python -m benchmarks.bench_transport --commits 500 --hunks 200 --hunk-size 4000
+"""
+import argparse
+import json
+import multiprocessing
+import timeit
+
+from benchmarks.bench_codec import create_commit
+from pyvcsshark.codec import BaseCodec
+from pyvcsshark.parser import models
+from pyvcsshark.transport import TRANSPORTS, create_transport
+
+
+def produce(transport, codec_identifier, data, count):
+    codec = BaseCodec.find_correct_codec(codec_identifier)
+    commit = codec.decode(data)
+    for i in range(count):
+        transport.put(codec.encode(commit))
+
+
+def consume(transport, codec_identifier):
+    models.set_validation(False)
+    codec = BaseCodec.find_correct_codec(codec_identifier)
+    while True:
+        data = transport.get()
+        if data is None:
+            transport.task_done()
+            break
+        codec.decode(data)
+        transport.release()
+        transport.task_done()
+
+
+def measure(transport_identifier, codec_identifier, data, commits, producers, consumers, buffer_size):
+    transport = create_transport(transport_identifier, buffer_size)
+    processes = [multiprocessing.Process(target=consume, args=(transport, codec_identifier))
+                 for i in range(consumers)]
+    processes += [multiprocessing.Process(target=produce, args=(transport, codec_identifier, data,
+                                                                commits // producers))
+                  for i in range(producers)]
+
+    start = timeit.default_timer()
+    for process in processes:
+        process.start()
+    for process in processes[consumers:]:
+        process.join()
+    for i in range(consumers):
+        transport.put(None)
+    transport.join()
+    elapsed = timeit.default_timer() - start
+
+    for process in processes[:consumers]:
+        process.join()
+    transport.close()
+
+    transferred = commits // producers * producers
+    return {'transport': transport_identifier, 'commits': transferred, 'seconds': elapsed,
+            'commits_per_s': transferred / elapsed, 'mb_per_s': transferred * len(data) / elapsed / 1024 / 1024}
+
+
+def run(commits, files, hunks_per_file, hunk_size, producers, consumers, buffer_size, codec_identifier='binary'):
+    """ Runs the benchmark and returns a list with one result dictionary per transport """
+    models.set_validation(False)
+    data = BaseCodec.find_correct_codec(codec_identifier).encode(create_commit(files, hunks_per_file, hunk_size))
+    return [measure(identifier, codec_identifier, data, commits, producers, consumers, buffer_size)
+            for identifier in sorted(TRANSPORTS)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the commit transports')
+    parser.add_argument('--commits', type=int, default=400, help='Number of commits that are transferred')
+    parser.add_argument('--files', type=int, default=4, help='Number of changed files per commit')
+    parser.add_argument('--hunks', type=int, default=100, help='Number of hunks per changed file')
+    parser.add_argument('--hunk-size', type=int, default=2000, help='Number of characters per hunk')
+    parser.add_argument('--producers', type=int, default=2, help='Number of producer processes')
+    parser.add_argument('--consumers', type=int, default=2, help='Number of consumer processes')
+    parser.add_argument('--buffer-size', type=int, default=64, help='Size of the shared memory buffer in MB')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.commits, args.files, args.hunks, args.hunk_size, args.producers, args.consumers,
+                  args.buffer_size * 1024 * 1024)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print("%-10s %10s %10s %12s %10s" % ('transport', 'commits', 'seconds', 'commits/s', 'MB/s'))
+    for result in results:
+        print("%-10s %10d %10.2f %12.1f %10.1f" % (result['transport'], result['commits'], result['seconds'],
+                                                   result['commits_per_s'], result['mb_per_s']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""Regression gate of the performance. It runs the benchmarks of :mod:`benchmarks.bench_parser` on the synthetic
+repository of a checked-in baseline and compares their metrics with the baseline:
+
+* **commits_per_s**: throughput, higher is better
+* **peak_rss**: peak resident set size of the benchmark and its workers, lower is better
+* **db_operations_per_commit**: round trips to the mongodb per stored commit, lower is better (only measured by the
+  end-to-end benchmark with the mongodb)
+
+A metric regresses, if it is worse than the baseline by more than its relative tolerance. The gate also fails, if a
+benchmark processed another number of commits than in the baseline, or if a metric is missing: a metric of the
+baseline, which was not measured (e.g. the end-to-end benchmark with the mongodb was skipped), a measured metric,
+which is not in the baseline, and a metric, which no benchmark of the baseline has (the baseline must then be
+recorded again with a mongodb). Benchmarks, which are neither in the baseline nor measured, are not compared.
+
+The baseline is a JSON file::
+
+    {"spec": {...}, "cores_per_job": 4, "commit_codec": "binary",
+     "tolerances": {"commits_per_s": 0.25, "peak_rss": 0.2, "db_operations_per_commit": 0.1},
+     "benchmarks": {"parse (discard)": {"commits": 1000, "commits_per_s": 812.3, "peak_rss": 50331648}, ...}}
+
+The throughput depends on the machine, therefore the baseline must be recorded on the machine, which runs the gate.
+Run it from the repository root via::
+
+    python -m benchmarks.regression                  # compare with benchmarks/baseline.json, exit code 1 on regression
+    python -m benchmarks.regression --update         # record a new baseline
+    python -m benchmarks.regression --tolerance commits_per_s=0.1
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+from benchmarks import bench_parser
+from tests.repogen import RepositorySpec, generate_repository
+from pyvcsshark.codec import BaseCodec
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Metric -> True, if higher values are better
+METRICS = {'commits_per_s': True, 'peak_rss': False, 'db_operations_per_commit': False}
+DEFAULT_TOLERANCES = {'commits_per_s': 0.25, 'peak_rss': 0.2, 'db_operations_per_commit': 0.1}
+
+
+def create_baseline(spec, cores_per_job, commit_codec, results, tolerances=None):
+    """ Creates a baseline out of the results of the benchmarks
+
+    :param spec: object of class :class:`tests.repogen.RepositorySpec` of the repository of the results
+    :param cores_per_job: number of cores of the runs
+    :param commit_codec: identifier of the codec of the runs
+    :param results: list of result dictionaries (see :func:`benchmarks.bench_parser.run`)
+    :param tolerances: dictionary metric -> relative tolerance (default: DEFAULT_TOLERANCES)
+    """
+    benchmarks = {}
+    for entry in results:
+        if 'skipped' not in entry:
+            benchmarks[entry['benchmark']] = dict({metric: entry[metric] for metric in METRICS if metric in entry},
+                                                  commits=entry['commits'])
+    return {'spec': spec.to_dict(), 'cores_per_job': cores_per_job, 'commit_codec': commit_codec,
+            'tolerances': dict(tolerances or DEFAULT_TOLERANCES), 'benchmarks': benchmarks}
+
+
+def compare(baseline, results, tolerances=None):
+    """ Compares the results with the baseline and returns a list of comparisons, one dictionary per benchmark and
+    metric with benchmark, metric, baseline, value, change (relative, positive is better) and regressed. A missing
+    metric is reported as regressed with None as baseline or value (and as benchmark, if no benchmark of the baseline
+    has the metric).
+
+    :param baseline: dictionary of the baseline (see :func:`create_baseline`)
+    :param results: list of result dictionaries (see :func:`benchmarks.bench_parser.run`)
+    :param tolerances: dictionary metric -> relative tolerance, which overrides the tolerances of the baseline
+    """
+    tolerances = dict(DEFAULT_TOLERANCES, **dict(baseline.get('tolerances', {}), **(tolerances or {})))
+    comparisons = []
+    for metric in sorted(METRICS):
+        if not any(metric in expected for expected in baseline['benchmarks'].values()):
+            comparisons.append({'benchmark': None, 'metric': metric, 'baseline': None, 'value': None, 'change': None,
+                                'regressed': True})
+
+    for entry in results:
+        expected = baseline['benchmarks'].get(entry['benchmark'])
+        if expected is None and 'skipped' in entry:
+            continue
+        # A skipped benchmark measured none of its metrics
+        if 'skipped' in entry:
+            entry = {'benchmark': entry['benchmark'], 'commits': None}
+        if expected is None:
+            expected = {'commits': None}
+
+        if entry['commits'] != expected['commits']:
+            comparisons.append({'benchmark': entry['benchmark'], 'metric': 'commits', 'baseline': expected['commits'],
+                                'value': entry['commits'], 'change': None, 'regressed': True})
+
+        for metric, higher_is_better in sorted(METRICS.items()):
+            if metric not in expected and metric not in entry:
+                continue
+            if metric not in expected or metric not in entry:
+                comparisons.append({'benchmark': entry['benchmark'], 'metric': metric,
+                                    'baseline': expected.get(metric), 'value': entry.get(metric), 'change': None,
+                                    'regressed': True})
+                continue
+            change = (entry[metric] - expected[metric]) / max(expected[metric], 1e-9)
+            if not higher_is_better:
+                change = -change
+            comparisons.append({'benchmark': entry['benchmark'], 'metric': metric, 'baseline': expected[metric],
+                                'value': entry[metric], 'change': change, 'regressed': change < -tolerances[metric]})
+    return comparisons
+
+
+def format_comparisons(comparisons):
+    """ Returns the lines of a table of the comparisons (see :func:`compare`) """
+    lines = ["%-24s %-26s %14s %14s %9s" % ('benchmark', 'metric', 'baseline', 'current', 'change')]
+    for comparison in comparisons:
+        change = '' if comparison['change'] is None else '%+8.1f%%' % (100 * comparison['change'])
+        lines.append("%-24s %-26s %14s %14s %9s%s" % (
+            comparison['benchmark'] or '(any)', comparison['metric'], format_value(comparison['baseline']),
+            format_value(comparison['value']), change, '  REGRESSION' if comparison['regressed'] else ''))
+    return lines
+
+
+def format_value(value):
+    """ Returns the value of a comparison with two decimals or 'missing', if it is None """
+    return 'missing' if value is None else '%0.2f' % value
+
+
+def parse_tolerances(values):
+    """ Parses the tolerances given as METRIC=VALUE
+
+    :param values: list of strings
+    """
+    tolerances = {}
+    for value in values:
+        metric, separator, tolerance = value.partition('=')
+        if not separator or metric not in METRICS:
+            raise argparse.ArgumentTypeError("Tolerance must be given as METRIC=VALUE with METRIC one of %s" %
+                                             ', '.join(sorted(METRICS)))
+        tolerances[metric] = float(tolerance)
+    return tolerances
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares the benchmarks with a checked-in baseline')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Path of the baseline JSON')
+    parser.add_argument('--update', action='store_true',
+                        help='Record a new baseline instead of comparing (with the repository of the given options '
+                             'or, if they are not given, of the old baseline)')
+    parser.add_argument('--tolerance', action='append', default=[], metavar='METRIC=VALUE',
+                        help='Relative tolerance of a metric (%s)' % ', '.join(sorted(METRICS)))
+    parser.add_argument('--cores-per-job', type=int, help='Number of cores of the runs (default: of the baseline)')
+    parser.add_argument('--commit-codec', choices=BaseCodec.get_codec_choices(),
+                        help='Codec of the runs (default: of the baseline)')
+    parser.add_argument('--db-hostname', help='mongodb for the end-to-end benchmark (default: throwaway mongod)')
+    parser.add_argument('--db-port', type=int, default=27017)
+    RepositorySpec.add_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    try:
+        tolerances = parse_tolerances(args.tolerance)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    elif not args.update:
+        parser.error("Baseline %s does not exist, record it with --update" % args.baseline)
+
+    # The repository of the baseline is generated again, unless a new baseline is recorded with other options
+    spec = RepositorySpec.from_arguments(args)
+    if baseline is not None and (not args.update or spec.to_dict() == RepositorySpec().to_dict()):
+        spec = RepositorySpec(**baseline['spec'])
+    cores_per_job = args.cores_per_job or (baseline or {}).get('cores_per_job', 4)
+    commit_codec = args.commit_codec or (baseline or {}).get('commit_codec', 'binary')
+
+    directory = tempfile.mkdtemp(prefix='bench-repository-')
+    try:
+        repository = generate_repository(os.path.join(directory, 'repository'), spec)
+        results = bench_parser.run(repository['path'], cores_per_job, commit_codec, args.db_hostname, args.db_port)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if args.update:
+        old_tolerances = (baseline or {}).get('tolerances', DEFAULT_TOLERANCES)
+        baseline = create_baseline(spec, cores_per_job, commit_codec, results, dict(old_tolerances, **tolerances))
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print("Recorded the baseline of %d benchmarks in %s" % (len(baseline['benchmarks']), args.baseline))
+        return 0
+
+    comparisons = compare(baseline, results, tolerances)
+    for line in format_comparisons(comparisons):
+        print(line)
+    for entry in results:
+        if 'skipped' in entry:
+            print("%-24s skipped: %s" % (entry['benchmark'], entry['skipped']))
+
+    regressions = [comparison for comparison in comparisons if comparison['regressed']]
+    if any(comparison['baseline'] is None for comparison in regressions):
+        print("The baseline misses metrics, record it again with --update (and a mongodb for "
+              "db_operations_per_commit)")
+    if regressions:
+        print("%d metrics regressed beyond their tolerance" % len(regressions))
+        return 1
+    print("No regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,15 @@
 import argparse
 from .config import Config
-from .main import Application
+from .main import Application, BatchApplication
+from .sharding import ShardCoordinator, ShardWorker
 from .utils import *
 import json
 import logging
 import logging.config
 from pyvcsshark.datastores.basestore import BaseStore
+from pyvcsshark.codec import BaseCodec
+from pyvcsshark.transport import TRANSPORTS
+from pyvcsshark.profiling import PROFILE_MODES
 from pycoshark.utils import get_base_argparser
 
 
@@ -64,10 +68,86 @@ def start():
                         default='mongo', choices=datastore_choices)
     parser.add_argument('-d', '--log-level', help='Debug level', choices=['INFO', 'DEBUG', 'WARNING', 'ERROR'],
                         default='INFO')
-    parser.add_argument('-n', '--project-name', help='Name of the project, that is analyzed', required=True)
+    parser.add_argument('-n', '--project-name', help='Name of the project, that is analyzed. Required, if no '
+                                                     'manifest is given')
     parser.add_argument('--path', help='Path to the checked out repository directory', default=os.getcwd(),
                         type=readable_dir)
+    parser.add_argument('--manifest', help='Batch mode: file with one "<project name> <path>" pair per line. All '
+                                           'repositories are processed one after another in this process')
+    parser.add_argument('--shard-role', help='Sharded run over several nodes: the coordinator splits the commits into '
+                                             'shards, which the workers parse and store with their own clone',
+                        choices=['coordinator', 'worker'])
+    parser.add_argument('--shard-dir', help='Directory that is shared by the coordinator and the workers of a sharded '
+                                            'run')
+    parser.add_argument('--shards', help='Number of shards the coordinator creates', default=16, type=int)
+    parser.add_argument('--shard-timeout', help='Seconds the coordinator waits, while no shard is done and no worker '
+                                                'holds a living claim, and the workers wait for the plan',
+                        default=3600, type=int)
+    parser.add_argument('--shard-lease', help='Seconds after which the claim of a shard expires, if its worker does '
+                                              'not renew it (e.g., because it died)', default=60, type=int)
     parser.add_argument('--cores-per-job', help='Number of cores to use', default=4, type=int)
+    parser.add_argument('--resume', help='Resume an interrupted run, commits that were completely stored by it are '
+                                         'not parsed again', action='store_true')
+    parser.add_argument('--diff-workers', help='Number of processes that diff the commits. By default, the cores '
+                                               'per job are split between diff and write workers', type=int)
+    parser.add_argument('--write-workers', help='Number of processes that write the commits into the datastore',
+                        type=int)
+    parser.add_argument('--max-retries', help='Number of times a commit is retried after the worker processing it '
+                                              'died, before it is quarantined', default=2, type=int)
+    parser.add_argument('--autoscale', help='Move workers between the diff and write stage depending on the depth of '
+                                            'their queues', action='store_true')
+    parser.add_argument('--commit-codec', help='Serialization of the commits that are passed from the parser to the '
+                                               'datastore', default='binary', choices=BaseCodec.get_codec_choices())
+    parser.add_argument('--commit-transport', help='Transport of the commits from the parser to the storage processes. '
+                                                   'shm uses a ring buffer in shared memory (python 3.8+)',
+                        default='queue', choices=sorted(TRANSPORTS))
+    parser.add_argument('--transport-buffer-size', help='Size of the shared memory ring buffer in MB', default=64,
+                        type=int)
+    parser.add_argument('--io-threads', help='Number of threads per write worker, which store commits concurrently to '
+                                             'overlap the round trips to the datastore', default=1, type=int)
+    parser.add_argument('--topological-order', help='Store the commits in topological order (parents before children) '
+                                                    'and record the position up to which all commits are stored, so '
+                                                    'that consumers can start during the run (not for sharded runs)',
+                        action='store_true')
+    parser.add_argument('--reorder-window', help='Maximal number of commits that are buffered to store them in '
+                                                 'topological order', default=1000, type=int)
+    parser.add_argument('--streaming-walk', help='Parse the commits while the branches and tags are still walked and '
+                                                 'attach the branches and tags to the commits afterwards',
+                        action='store_true')
+    parser.add_argument('--dedup-hunks', help='Store every distinct hunk content only once and reference it from the '
+                                              'hunks', action='store_true')
+    parser.add_argument('--hunk-compression-level', help='zlib compression level for deduplicated hunk contents '
+                                                         '(0 disables the compression)', default=6, type=int,
+                        choices=range(0, 10))
+    parser.add_argument('--metrics-file', help='Prometheus textfile, into which the metrics of the run (commits per '
+                                               'second, queue depths, operations of the mongodb, memory of the '
+                                               'workers) are written periodically')
+    parser.add_argument('--metrics-interval', help='Seconds between two updates of the metrics file', default=15,
+                        type=int)
+    parser.add_argument('--profile', help='Profile every worker process and write the profiles and a merged report '
+                                          'per stage into this directory', metavar='DIR')
+    parser.add_argument('--profile-mode', help='cprofile profiles every function call, sampling samples the stacks '
+                                               'of the workers with less overhead', default='cprofile',
+                        choices=PROFILE_MODES)
+    parser.add_argument('--profile-interval', help='Milliseconds between two samples of the sampling profile mode',
+                        default=10, type=int)
+    parser.add_argument('--memory-report', help='Trace the allocations of all processes (slows the run down) and '
+                                                'write a report with the peak memory per stage, the size of the major '
+                                                'structures and the top allocation sites into this file',
+                        metavar='FILE')
+    parser.add_argument('--trace-db', help='Count and time the commands sent to the mongodb per collection and per '
+                                           'commit and write a report into this file', metavar='FILE')
+    parser.add_argument('--trace-db-threshold', help='Number of operations, above which a commit is listed in the '
+                                                     'report of --trace-db', default=50, type=int)
+    parser.add_argument('--slow-commit-report', help='Write the slowest commits to parse and to store, together '
+                                                     'with their size, as JSON into this file', metavar='FILE')
+    parser.add_argument('--slow-commits', help='Number of commits per stage in the report of --slow-commit-report',
+                        default=100, type=int)
+    parser.add_argument('--progress-interval', help='Seconds between two logged progress reports with the parsed and '
+                                                    'stored commits, their rates and the ETA (0 disables them)',
+                        default=30, type=float)
+    parser.add_argument('--progress-json', help='Append every progress report as JSON line to this file',
+                        metavar='FILE')
 
     logger.info("Reading out config from command line")
 
@@ -77,7 +157,29 @@ def start():
         logger.error(e)
         sys.exit(1)
 
-    read_config = Config(args)
+    if args.manifest is None and args.project_name is None:
+        parser.error('the following arguments are required: -n/--project-name')
+    if args.shard_role is not None and args.shard_dir is None:
+        parser.error('--shard-role requires --shard-dir')
+    if args.shard_role is not None and args.manifest is not None:
+        parser.error('--shard-role can not be combined with --manifest')
+    if args.streaming_walk and args.topological_order:
+        parser.error('--streaming-walk can not be combined with --topological-order')
+
+    try:
+        read_config = Config(args)
+    except Exception as e:
+        logger.error(e)
+        sys.exit(1)
     logger.debug('Read the following config: %s' % read_config)
 
-    Application(read_config)
+    if args.shard_role == 'coordinator':
+        ShardCoordinator(read_config)
+    elif args.shard_role == 'worker':
+        ShardWorker(read_config)
+    elif args.manifest is not None:
+        batch = BatchApplication(read_config, args.manifest)
+        if batch.failed:
+            sys.exit(1)
+    else:
+        Application(read_config)
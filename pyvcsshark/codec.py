@@ -0,0 +1,270 @@
+import abc
+import pickle
+import struct
+
+from pyvcsshark.parser.models import CommitModel, FileModel, Hunk, PeopleModel, TagModel
+
+# Precompiled structs for the binary codec
+_UINT32 = struct.Struct('<I')
+_OPTIONAL_INT = struct.Struct('<Bq')
+_HUNK = struct.Struct('<iiiiI')
+
+_NONE_LENGTH = 0xFFFFFFFF
+
+
+class BaseCodec(metaclass=abc.ABCMeta):
+    """
+    Abstract class for the codecs, which serialize objects of class :class:`pyvcsshark.parser.models.CommitModel`
+    for the way from the parser to the datastore. Datastores, which hand the commits over to other processes, can use
+    a codec instead of relying on the pickling of the whole object graph of the commit.
+
+    Based on pythons abc: :py:mod:`abc`
+
+    :param metaclass: name of the abstract metaclass
+    """
+
+    @abc.abstractproperty
+    def codec_identifier(self):
+        """Must return a string identifier for the codec (e.g. **binary**)"""
+        return
+
+    @abc.abstractmethod
+    def encode(self, commit_model):
+        """Serializes the commit and returns the resulting bytes
+
+        :param commit_model: object of class :class:`pyvcsshark.parser.models.CommitModel`
+        """
+        return
+
+    @abc.abstractmethod
+    def decode(self, data):
+        """Creates an object of class :class:`pyvcsshark.parser.models.CommitModel` out of the given bytes
+
+        :param data: bytes-like object (e.g. :class:`bytes` or :class:`memoryview`) created by :func:`encode`
+        """
+        return
+
+    @staticmethod
+    def find_correct_codec(codec_identifier):
+        """ Finds the correct codec by looking at the codec.codec_identifier property
+
+        :param codec_identifier: string that represents the correct codec (e.g. **binary**)
+        """
+        for sc in BaseCodec.__subclasses__():
+            codec = sc()
+            if codec.codec_identifier == codec_identifier:
+                return codec
+        raise Exception("No codec with identifier %s found" % codec_identifier)
+
+    @staticmethod
+    def get_codec_choices():
+        """Returns the identifiers of all available codecs"""
+        return [sc().codec_identifier for sc in BaseCodec.__subclasses__()]
+
+
+class PickleCodec(BaseCodec):
+    """Codec that pickles the whole commit. It is the fallback, if custom models are used."""
+
+    @property
+    def codec_identifier(self):
+        return 'pickle'
+
+    def encode(self, commit_model):
+        return pickle.dumps(commit_model, pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, data):
+        return pickle.loads(data)
+
+
+class BinaryCodec(BaseCodec):
+    """Codec that writes the commit as a flat sequence of struct-packed, length-prefixed records. Strings are written
+    as utf-8 bytes with their length in front, so that the hunk contents are copied only once into the record and
+    decoded directly out of the given buffer (which can be a :class:`memoryview` on a shared memory block).
+
+    The record of a commit is laid out as follows (all integers are little endian)::
+
+        commit: id, branches, parents, author, committer, message, author date, author offset,
+                committer date, committer offset, #tags, tags..., #files, files...
+        tag:    name, message, tagger, tagger date, tagger offset
+        file:   path, size, lines added, lines deleted, is binary, mode, old path, parent revision hash,
+                #hunks, hunks...
+        hunk:   new_start, new_lines, old_start, old_lines (int32), content
+
+    Strings are prefixed by their length (uint32, 0xFFFFFFFF for None), optional ints by a presence byte (int64),
+    people by a presence byte and the branch bitmap by its length in bytes.
+    """
+
+    @property
+    def codec_identifier(self):
+        return 'binary'
+
+    def encode(self, commit_model):
+        parts = []
+        append = parts.append
+        write_string = self._write_string
+        write_optional_int = self._write_optional_int
+
+        write_string(parts, commit_model.id)
+
+        branches = commit_model.branches
+        branch_bytes = branches.to_bytes((branches.bit_length() + 7) // 8, 'little')
+        append(_UINT32.pack(len(branch_bytes)))
+        append(branch_bytes)
+
+        append(_UINT32.pack(len(commit_model.parents)))
+        for parent in commit_model.parents:
+            write_string(parts, parent)
+
+        self._write_people(parts, commit_model.author)
+        self._write_people(parts, commit_model.committer)
+        write_string(parts, commit_model.message)
+        write_optional_int(parts, commit_model.authorTimestamp)
+        write_optional_int(parts, commit_model.authorOffset)
+        write_optional_int(parts, commit_model.committerTimestamp)
+        write_optional_int(parts, commit_model.committerOffset)
+
+        append(_UINT32.pack(len(commit_model.tags)))
+        for tag in commit_model.tags:
+            write_string(parts, tag.name)
+            write_string(parts, tag.message)
+            self._write_people(parts, tag.tagger)
+            write_optional_int(parts, tag.taggerTimestamp)
+            write_optional_int(parts, tag.taggerOffset)
+
+        append(_UINT32.pack(len(commit_model.changedFiles)))
+        for changed_file in commit_model.changedFiles:
+            write_string(parts, changed_file.path)
+            write_optional_int(parts, changed_file.size)
+            write_optional_int(parts, changed_file.linesAdded)
+            write_optional_int(parts, changed_file.linesDeleted)
+            write_optional_int(parts, changed_file.isBinary)
+            write_string(parts, changed_file.mode)
+            write_string(parts, changed_file.oldPath)
+            write_string(parts, changed_file.parent_revision_hash)
+
+            append(_UINT32.pack(len(changed_file.hunks)))
+            for hunk in changed_file.hunks:
+                content = hunk.content.encode('utf-8', 'surrogatepass')
+                append(_HUNK.pack(hunk.new_start, hunk.new_lines, hunk.old_start, hunk.old_lines, len(content)))
+                append(content)
+
+        return b''.join(parts)
+
+    def decode(self, data):
+        view = memoryview(data)
+        reader = _Reader(view)
+        read_string = reader.read_string
+        read_optional_int = reader.read_optional_int
+        unpack_hunk = _HUNK.unpack_from
+        hunk_size = _HUNK.size
+
+        commit_id = read_string()
+        branch_length = reader.read_uint32()
+        branches = int.from_bytes(reader.read_bytes(branch_length), 'little')
+        parents = [read_string() for i in range(reader.read_uint32())]
+        author = reader.read_people()
+        committer = reader.read_people()
+        message = read_string()
+        author_date = read_optional_int()
+        author_offset = read_optional_int()
+        committer_date = read_optional_int()
+        committer_offset = read_optional_int()
+
+        tags = []
+        for i in range(reader.read_uint32()):
+            tags.append(TagModel(read_string(), read_string(), reader.read_people(), read_optional_int(),
+                                 read_optional_int()))
+
+        changed_files = []
+        for i in range(reader.read_uint32()):
+            path = read_string()
+            size = read_optional_int()
+            lines_added = read_optional_int()
+            lines_deleted = read_optional_int()
+            is_binary = read_optional_int()
+            if is_binary is not None:
+                is_binary = bool(is_binary)
+            mode = read_string()
+            old_path = read_string()
+            parent_revision_hash = read_string()
+
+            # Hunks are the bulk of the data, therefore we read them without the helper methods of the reader
+            hunks = []
+            position = reader.position + 4
+            for j in range(_UINT32.unpack_from(view, reader.position)[0]):
+                new_start, new_lines, old_start, old_lines, length = unpack_hunk(view, position)
+                position += hunk_size
+                content = str(view[position:position + length], 'utf-8', 'surrogatepass')
+                position += length
+                hunks.append(Hunk(new_start, new_lines, old_start, old_lines, content))
+            reader.position = position
+
+            changed_files.append(FileModel(path, size, lines_added, lines_deleted, is_binary, mode, hunks, old_path,
+                                           parent_revision_hash))
+
+        return CommitModel(commit_id, branches, tags, parents, author, committer, message, changed_files, author_date,
+                           author_offset, committer_date, committer_offset)
+
+    @staticmethod
+    def _write_string(parts, value):
+        if value is None:
+            parts.append(_UINT32.pack(_NONE_LENGTH))
+            return
+        encoded = value.encode('utf-8', 'surrogatepass')
+        parts.append(_UINT32.pack(len(encoded)))
+        parts.append(encoded)
+
+    @staticmethod
+    def _write_optional_int(parts, value):
+        if value is None:
+            parts.append(_OPTIONAL_INT.pack(0, 0))
+        else:
+            parts.append(_OPTIONAL_INT.pack(1, value))
+
+    @staticmethod
+    def _write_people(parts, people):
+        if people is None:
+            parts.append(b'\x00')
+        else:
+            parts.append(b'\x01')
+            BinaryCodec._write_string(parts, people.name)
+            BinaryCodec._write_string(parts, people.email)
+
+
+class _Reader(object):
+    """Helper for the :class:`BinaryCodec`, which reads the records sequentially out of a memoryview"""
+    __slots__ = ('view', 'position')
+
+    def __init__(self, view):
+        self.view = view
+        self.position = 0
+
+    def read_uint32(self):
+        value = _UINT32.unpack_from(self.view, self.position)[0]
+        self.position += 4
+        return value
+
+    def read_bytes(self, length):
+        start = self.position
+        self.position += length
+        return self.view[start:self.position]
+
+    def read_string(self):
+        length = self.read_uint32()
+        if length == _NONE_LENGTH:
+            return None
+        return str(self.read_bytes(length), 'utf-8', 'surrogatepass')
+
+    def read_optional_int(self):
+        present, value = _OPTIONAL_INT.unpack_from(self.view, self.position)
+        self.position += _OPTIONAL_INT.size
+        if not present:
+            return None
+        return value
+
+    def read_people(self):
+        present = self.view[self.position]
+        self.position += 1
+        if not present:
+            return None
+        return PeopleModel(self.read_string(), self.read_string())
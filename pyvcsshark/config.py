@@ -1,3 +1,6 @@
+from pyvcsshark.pipeline import WorkerPlan
+
+
 class ErrorLoadingConfig(Exception):
     """Exception class, which is used for config loading exceptions. """
 
@@ -24,7 +27,38 @@ class Config(object):
         self.debug_level = args.log_level
         self.project_name = args.project_name
         self.cores_per_job = args.cores_per_job
+        self.worker_plan = WorkerPlan(self.cores_per_job, getattr(args, 'diff_workers', None),
+                                      getattr(args, 'write_workers', None))
         self.ssl_enabled = args.ssl
+        self.commit_codec = getattr(args, 'commit_codec', 'binary')
+        self.commit_transport = getattr(args, 'commit_transport', 'queue')
+        self.transport_buffer_size = getattr(args, 'transport_buffer_size', 64)
+        self.resume = getattr(args, 'resume', False)
+        self.shard_role = getattr(args, 'shard_role', None)
+        self.shard_dir = getattr(args, 'shard_dir', None)
+        self.shards = getattr(args, 'shards', 16)
+        self.shard_timeout = getattr(args, 'shard_timeout', 3600)
+        self.shard_lease = getattr(args, 'shard_lease', 60)
+        self.autoscale = getattr(args, 'autoscale', False)
+        self.max_retries = getattr(args, 'max_retries', 2)
+        self.io_threads = getattr(args, 'io_threads', 1)
+        self.topological_order = getattr(args, 'topological_order', False)
+        self.reorder_window = getattr(args, 'reorder_window', 1000)
+        self.streaming_walk = getattr(args, 'streaming_walk', False)
+        self.dedup_hunks = getattr(args, 'dedup_hunks', False)
+        self.hunk_compression_level = getattr(args, 'hunk_compression_level', 6)
+        self.metrics_file = getattr(args, 'metrics_file', None)
+        self.metrics_interval = getattr(args, 'metrics_interval', 15)
+        self.profile_dir = getattr(args, 'profile', None)
+        self.profile_mode = getattr(args, 'profile_mode', 'cprofile')
+        self.profile_interval = getattr(args, 'profile_interval', 10)
+        self.memory_report = getattr(args, 'memory_report', None)
+        self.trace_db = getattr(args, 'trace_db', None)
+        self.trace_db_threshold = getattr(args, 'trace_db_threshold', 50)
+        self.slow_commit_report = getattr(args, 'slow_commit_report', None)
+        self.slow_commits = getattr(args, 'slow_commits', 100)
+        self.progress_interval = getattr(args, 'progress_interval', 30)
+        self.progress_json = getattr(args, 'progress_json', None)
 
     def __str__(self):
         return "Driver: %s, User: %s, Password: %s, Database: %s, Hostname: %s, Port: %s, AuthenticationDB: %s, " \
@@ -7,6 +7,7 @@ Created on 09.12.2015
 import abc
 import os
 import pyvcsshark.utils
+from pyvcsshark.parser.models import BranchRegistry
 
 
 class BaseStore(metaclass=abc.ABCMeta):
@@ -19,7 +20,16 @@ class BaseStore(metaclass=abc.ABCMeta):
     :property projectName: name of the project, which should be stored
     :property projectURL: url of the repository of the project, which should be stored
     :property repositoryType: type of the repository of the project, which should be stored
-    
+    :property branch_registry: object of class :class:`pyvcsshark.parser.models.BranchRegistry` of the parser, which \
+    is set before :func:`initialize` is called. It is needed to translate the branch ids of the commits into names. \
+    A new datastore has an empty registry of its own.
+    :property codec: subclass of :class:`pyvcsshark.codec.BaseCodec`, which can be used by datastores that hand \
+    the commits over to other processes (e.g., via a :class:`multiprocessing.JoinableQueue`) to serialize them.
+    :property worker_pool: object of class :class:`pyvcsshark.pipeline.WorkerPool`, via which the datastore should \
+    start its worker processes. The number of workers is given by config.worker_plan.write_workers.
+    :property ordering_stage: object of class :class:`pyvcsshark.pipeline.OrderingStage` or None. If it is set by \
+    the application, the datastore must hand the commits to the stage in :func:`add_commit`, store them in the order \
+    the stage releases them and report every stored commit to it.
     
     
     :param metaclass: name of the abstract metaclass
@@ -38,7 +48,13 @@ class BaseStore(metaclass=abc.ABCMeta):
     projectName = None
     projectURL = None
     repositoryType = None
-    
+    codec = None
+    worker_pool = None
+    ordering_stage = None
+
+    def __init__(self):
+        self.branch_registry = BranchRegistry()
+
     @abc.abstractmethod
     def initialize(self, config, repository_url, repository_type):
         """Initializes the datastore
@@ -64,9 +80,43 @@ class BaseStore(metaclass=abc.ABCMeta):
         .. WARNING:: The commits we get here are not sorted. Furthermore, they need to be processed right away or\
             stored in a :class:`~multiprocessing.SimpleQueue`. Storing it in a normal list or dictionary can not be done,\
             as some parser (e.g. GitParser) use multiprocessing to add the commits.
+
+        .. WARNING:: This method is called concurrently by several parser processes without any synchronization.\
+            Implementations must therefore be process-safe, e.g., by only putting the commit into a\
+            :class:`~multiprocessing.JoinableQueue` or a :class:`pyvcsshark.transport.BaseTransport`.
         """
         return
+
+    def add_retried_commit(self, commit_model):
+        """Adds a commit again, which was lost together with a storage process (see
+        :func:`pyvcsshark.parser.baseparser.BaseParser.retry_commit`). The commit must be in the queue of the storage
+        processes, when the method returns, as the :class:`pyvcsshark.pipeline.Supervisor` marks the lost task as done
+        right afterwards. By default, :func:`add_commit` is called.
+
+        :param commit_model: instance of :class:`~pyvcsshark.dbmodels.models.CommitModel`
+        """
+        self.add_commit(commit_model)
     
+    def get_journaled_commits(self, config, repository_url):
+        """Returns the set of revision hashes of the commits, which were completely stored by a previous run that was
+        interrupted. It is called before :func:`initialize`, if the run is resumed (--resume). Datastores, which do not
+        keep a journal, return an empty set.
+
+        :param config: all configuration
+        :param repository_url: url of the repository, which is to be analyzed
+        """
+        return set()
+
+    def set_commit_references(self, references):
+        """Sets the branches and tags of commits, which were added via :func:`add_commit` without them, because the
+        parser walked the references while the commits were already parsed. The datastore must attach them, after all
+        commits were stored.
+
+        :param references: dictionary, which maps the revision hashes to dictionaries with the branch bitmap \
+        (key **branches**) and the list of :class:`pyvcsshark.parser.models.TagModel` (key **tags**) of the commits
+        """
+        raise NotImplementedError("%s can not attach branches and tags afterwards" % self.__class__.__name__)
+
     @abc.abstractmethod
     def finalize(self):
         """Is called in the end to finalize the datastore (e.g. closing files or connections)"""
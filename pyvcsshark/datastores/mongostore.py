@@ -1,11 +1,23 @@
+import concurrent.futures
+import hashlib
 import os
 import sys
 import tarfile
+import threading
+import timeit
+import zlib
 
-from pymongo.errors import DocumentTooLarge, DuplicateKeyError
+from pymongo import UpdateOne, WriteConcern
+from pymongo.errors import BulkWriteError, DocumentTooLarge, DuplicateKeyError
 
+from pyvcsshark import metrics, slowcommits, timing, tracing
+from pyvcsshark.codec import BaseCodec
 from pyvcsshark.datastores.basestore import BaseStore
+from pyvcsshark.parser.models import to_datetime
+from pyvcsshark.pipeline import TaskSlot, WorkerPool
+from pyvcsshark.transport import create_transport
 from mongoengine import connect, DoesNotExist, NotUniqueError
+from mongoengine.connection import get_db
 from pycoshark.mongomodels import VCSSystem, Project, Commit, Tag, File, People, FileAction, Hunk, Branch
 from pycoshark.utils import create_mongodb_uri_string
 
@@ -16,17 +28,155 @@ import datetime
 
 logger = logging.getLogger("store")
 
+# Collection, in which the deduplicated hunk contents are stored (see CommitStorageProcess.insert_deduplicated_hunks)
+HUNK_CONTENT_COLLECTION = 'hunk_content'
+
+
+class CommitJournal(object):
+    """ Journal of the commits, which were completely stored (including their file actions and hunks) into the \
+    mongodb. It is kept in the collection commit_journal, where each document holds a batch of revision hashes of a \
+    vcs system. If a run dies, the next run can be started with --resume and only parses the commits that are not \
+    in the journal. The journal is cleared, if a run completes or a run is started without --resume.
+
+    :param vcs_system_id: object id of class :class:`bson.objectid.ObjectId` from the vcs system
+    :param batch_size: number of commits, which are written as one document into the journal
+    """
+    COLLECTION = 'commit_journal'
+
+    # The journal entries must only be acknowledged, if they (and therefore all writes for the commits before them)
+    # are written to the journal of the mongodb and replicated to the majority of the replica set
+    WRITE_CONCERN = WriteConcern(w='majority', j=True)
+
+    def __init__(self, vcs_system_id, batch_size=100):
+        self.vcs_system_id = vcs_system_id
+        self.batch_size = batch_size
+        self.revision_hashes = []
+
+    def add(self, revision_hash):
+        """ Adds the commit to the journal. Must only be called after the commit was stored completely.
+
+        :param revision_hash: revision hash of the commit
+        """
+        self.revision_hashes.append(revision_hash)
+        if len(self.revision_hashes) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """ Writes the commits, which were added since the last flush, into the journal """
+        if not self.revision_hashes:
+            return
+
+        collection = get_db()[self.COLLECTION].with_options(write_concern=self.WRITE_CONCERN)
+        collection.insert_one({'vcs_system_id': self.vcs_system_id, 'revision_hashes': self.revision_hashes})
+        self.revision_hashes = []
+
+    @staticmethod
+    def load(vcs_system_id):
+        """ Returns the set of revision hashes, which are in the journal of the vcs system
+
+        :param vcs_system_id: object id of class :class:`bson.objectid.ObjectId` from the vcs system
+        """
+        revision_hashes = set()
+        for batch in get_db()[CommitJournal.COLLECTION].find({'vcs_system_id': vcs_system_id}, {'revision_hashes': 1}):
+            revision_hashes.update(batch['revision_hashes'])
+        return revision_hashes
+
+    @staticmethod
+    def clear(vcs_system_id):
+        """ Deletes the journal of the vcs system
+
+        :param vcs_system_id: object id of class :class:`bson.objectid.ObjectId` from the vcs system
+        """
+        get_db()[CommitJournal.COLLECTION].delete_many({'vcs_system_id': vcs_system_id})
+
+
+class CommitWatermark(object):
+    """ Watermark of a run in topological order (see :class:`pyvcsshark.pipeline.OrderingStage`). It is kept in the \
+    collection commit_watermark with one document per vcs system::
+
+        {'_id': <vcs system id>, 'position': <watermark>, 'revision_hash': <commit at the watermark>,
+         'commits': <number of commits of the run>, 'complete': <True, if the run stored all commits>,
+         'updated': <datetime>}
+
+    All commits up to the position in the topological order of the run (and therefore all of their ancestors) are \
+    stored. Consumers can process them while the run is still going on. The position is -1, if no commit is stored \
+    yet.
+
+    :param vcs_system_id: object id of class :class:`bson.objectid.ObjectId` from the vcs system
+    :param commits: number of commits of the run
+    """
+    COLLECTION = 'commit_watermark'
+
+    def __init__(self, vcs_system_id, commits):
+        self.vcs_system_id = vcs_system_id
+        self.commits = commits
+
+    def write(self, position, revision_hash):
+        """ Writes the watermark
+
+        :param position: position of the watermark in the topological order
+        :param revision_hash: revision hash of the commit at the position (None for position -1)
+        """
+        get_db()[self.COLLECTION].replace_one({'_id': self.vcs_system_id}, {
+            'position': position, 'revision_hash': revision_hash, 'commits': self.commits,
+            'complete': position == self.commits - 1, 'updated': datetime.datetime.utcnow()}, upsert=True)
+
+    @staticmethod
+    def load(vcs_system_id):
+        """ Returns the watermark document of the vcs system (None, if it was not run in topological order)
+
+        :param vcs_system_id: object id of class :class:`bson.objectid.ObjectId` from the vcs system
+        """
+        return get_db()[CommitWatermark.COLLECTION].find_one({'_id': vcs_system_id})
+
+
+def resolve_hunk_contents(hunks):
+    """ Sets the content of hunks, which reference the deduplicated hunk content store instead of holding their
+    content themselves. The hunks are changed in place and returned. Hunks with an inline content are not touched.
+
+    :param hunks: list of hunk documents as dictionaries, as they are returned by pymongo
+    """
+    content_hashes = {hunk['content_hash'] for hunk in hunks if 'content_hash' in hunk}
+    if not content_hashes:
+        return hunks
+
+    contents = {}
+    for hunk_content in get_db()[HUNK_CONTENT_COLLECTION].find({'_id': {'$in': list(content_hashes)}}):
+        content = hunk_content['content']
+        if hunk_content['compressed']:
+            content = zlib.decompress(content)
+        contents[hunk_content['_id']] = content.decode('utf-8', 'surrogatepass')
+
+    for hunk in hunks:
+        if 'content_hash' in hunk:
+            hunk['content'] = contents[hunk.pop('content_hash')]
+    return hunks
+
+
+def get_hunks(file_action_id):
+    """ Returns the hunks of a file action as objects of class :class:`pycoshark.mongomodels.Hunk`. In contrast to
+    querying the hunk collection directly, this also works for hunks that were stored with deduplication enabled.
+
+    :param file_action_id: object id of class :class:`bson.objectid.ObjectId` of the file action
+    """
+    hunks = list(Hunk.objects(file_action_id=file_action_id).as_pymongo())
+    return [Hunk._from_son(hunk) for hunk in resolve_hunk_contents(hunks)]
+
 
 class MongoStore(BaseStore):
     """ Datastore implementation for saving data to the mongodb. Inherits from
     :class:`pyvcsshark.datastores.basestore.BaseStore`.
 
-    :property commit_queue: instance of a :class:`multiprocessing.JoinableQueue`, which  \
-    holds objects of :class:`pyvcsshark.dbmodels.models.CommitModel`, that should be put into the mongodb
+    :property commit_queue: transport of class :class:`pyvcsshark.transport.BaseTransport`, which  \
+    holds objects of :class:`pyvcsshark.dbmodels.models.CommitModel`, that should be put into the mongodb. The commits \
+    are serialized with the codec chosen in the configuration (see :class:`pyvcsshark.codec.BaseCodec`)
     :property logger: holds the logging instance, by calling logging.getLogger("store")
+    :property commit_references: branches and tags, which are attached to the commits after they were stored (see \
+    :func:`set_commit_references`)
     """
 
     commit_queue = None
+    commit_references = None
 
     def __init__(self):
         BaseStore.__init__(self)
@@ -45,12 +195,15 @@ class MongoStore(BaseStore):
         logger.info("Initializing MongoStore...")
 
         # Create queue for multiprocessing
-        self.commit_queue = multiprocessing.JoinableQueue()
+        self.commit_queue = create_transport(config.commit_transport, config.transport_buffer_size * 1024 * 1024)
 
         # we need an extra queue for branches because all commits need to be finished before we can process branches
         self.branch_queue = multiprocessing.JoinableQueue()
         self.config = config
-        self.cores_per_job = config.cores_per_job
+        self.write_workers = config.worker_plan.write_workers
+        self.codec = BaseCodec.find_correct_codec(config.commit_codec)
+        if config.dedup_hunks:
+            logger.info("Hunk contents are deduplicated in collection %s" % HUNK_CONTENT_COLLECTION)
 
         # We define, that the user we authenticate with is in the admin database
         logger.info("Connecting to MongoDB...")
@@ -73,11 +226,57 @@ class MongoStore(BaseStore):
                                                                       project_id=project_id)
         self.vcs_system_id = vcs_system.id
 
+        # Shard workers only store the commits of their shard, the journal and repository file are handled by the
+        # coordinator (see :mod:`pyvcsshark.sharding`)
+        if config.shard_role != 'worker':
+            # If we do not resume an interrupted run, the journal of the last run is not valid anymore
+            if not config.resume:
+                CommitJournal.clear(self.vcs_system_id)
+
+            self.store_repository_file(config, vcs_system)
+
+        # Get the last commit by date of the project (if there is any)
+        last_commit = Commit.objects(vcs_system_id=self.vcs_system_id)\
+            .only('committer_date').order_by('-committer_date').first()
+
+        if last_commit is not None:
+            last_commit_date = last_commit.committer_date
+        else:
+            last_commit_date = None
+
+        # Start worker, they will wait till something comes into the queue and then process it
+        if self.worker_pool is None:
+            self.worker_pool = WorkerPool()
+
+        self.worker_pool.register('write', self.commit_queue,
+                                  lambda i: CommitStorageProcess(self.commit_queue, self.vcs_system_id,
+                                                                 last_commit_date, self.config,
+                                                                 "StorageProcess-%d" % i, self.branch_registry,
+                                                                 self.codec, self.ordering_stage))
+        for i in range(self.write_workers):
+            self.worker_pool.scale_up('write')
+
+        # The ordering stage releases the commits in topological order into the commit queue
+        if self.ordering_stage is not None:
+            watermark = CommitWatermark(self.vcs_system_id, len(self.ordering_stage.revision_hashes))
+            watermark.write(-1, None)
+            self.ordering_stage.start(self.commit_queue.put, watermark.write)
+            logger.info("Storing commits in topological order, watermark in collection %s" %
+                        CommitWatermark.COLLECTION)
+
+        logger.info("Starting storage Process...")
+
+    def store_repository_file(self, config, vcs_system):
+        """Stores the repository as tar.gz in the gridfs of the vcs system
+
+        :param config: all configuration
+        :param vcs_system: object of class :class:`pycoshark.mongomodels.VCSSystem`
+        """
         # Tar.gz name based on project name
         tar_gz_name = '{}.tar.gz'.format(config.project_name)
 
         # Tar.gz of repository folder
-        with tarfile.open(tar_gz_name, "w:gz") as tar:
+        with timing.timed('store.repository_file.tar'), tarfile.open(tar_gz_name, "w:gz") as tar:
             tar.add(config.path, arcname=config.project_name)
 
         # Add repository to gridfs if not existent
@@ -85,14 +284,14 @@ class MongoStore(BaseStore):
             logger.info('Copying project to gridfs...')
 
             # Store in gridfs
-            with open(tar_gz_name, 'rb') as tar_file:
+            with timing.timed('store.repository_file.gridfs'), open(tar_gz_name, 'rb') as tar_file:
                 vcs_system.repository_file.put(tar_file, content_type='application/gzip',
                                                filename=tar_gz_name)
                 vcs_system.save()
         else:
             # replace file if not existent
             logger.info('Replacing project file in gridfs...')
-            with open(tar_gz_name, 'rb') as tar_file:
+            with timing.timed('store.repository_file.gridfs'), open(tar_gz_name, 'rb') as tar_file:
                 vcs_system.repository_file.replace(tar_file, content_type='application/gzip',
                                                    filename=tar_gz_name)
                 vcs_system.save()
@@ -100,35 +299,57 @@ class MongoStore(BaseStore):
         # Delete tar.gz file
         os.remove(tar_gz_name)
 
-        # Get the last commit by date of the project (if there is any)
-        last_commit = Commit.objects(vcs_system_id=self.vcs_system_id)\
-            .only('committer_date').order_by('-committer_date').first()
-
-        if last_commit is not None:
-            last_commit_date = last_commit.committer_date
-        else:
-            last_commit_date = None
-
-        # Start worker, they will wait till something comes into the queue and then process it
-        for i in range(self.cores_per_job):
-            name = "StorageProcess-%d" % i
-            process = CommitStorageProcess(self.commit_queue, self.vcs_system_id, last_commit_date, self.config, name)
-            process.daemon = True
-            process.start()
-
-        logger.info("Starting storage Process...")
-
     @property
     def store_identifier(self):
         """Returns the identifier **mongo** for this datastore"""
         return 'mongo'
 
+    def get_journaled_commits(self, config, repository_url):
+        """Returns the revision hashes of the commits, which are in the :class:`CommitJournal` of the vcs system
+
+        :param config: all configuration
+        :param repository_url: url of the repository, which is to be analyzed
+        """
+        uri = create_mongodb_uri_string(config.db_user, config.db_password, config.db_hostname, config.db_port,
+                                        config.db_authentication, config.ssl_enabled)
+        connect(config.db_database, host=uri, connect=False)
+
+        vcs_system = VCSSystem.objects(url=repository_url).only('id').first()
+        if vcs_system is None:
+            return set()
+        return CommitJournal.load(vcs_system.id)
+
     def add_commit(self, commit_model):
-        """Adds commits of class :class:`pyvcsshark.dbmodels.models.CommitModel` to the commitqueue"""
+        """Adds commits of class :class:`pyvcsshark.dbmodels.models.CommitModel` to the commitqueue (or to the ordering
+        stage, which releases them into the commitqueue)"""
+        with timing.timed('store.encode'):
+            data = self.codec.encode(commit_model)
+        if self.ordering_stage is not None:
+            self.ordering_stage.add(commit_model.id, data)
+            return
+
         # add to queue
-        self.commit_queue.put(commit_model)
+        with timing.timed('store.queue_put'):
+            self.commit_queue.put(data)
         return
 
+    def add_retried_commit(self, commit_model):
+        """Puts the commit directly into the commitqueue. The ordering stage is bypassed, as it releases the commits
+        asynchronously and the retried commit was already released once."""
+        with timing.timed('store.encode'):
+            data = self.codec.encode(commit_model)
+        with timing.timed('store.queue_put'):
+            self.commit_queue.put(data)
+
+    def set_commit_references(self, references):
+        """Sets the branches and tags of commits, which were added without them. They are attached in :func:`finalize`,
+        after all commits were stored (see :class:`CommitReferenceUpdater`).
+
+        :param references: dictionary in the format of \
+        :attr:`pyvcsshark.parser.gitparser.GitParser.commits_to_be_processed`
+        """
+        self.commit_references = references
+
     def add_branch(self, branch_model):
         """Add branch to extra queue"""
         self.branch_queue.put(branch_model)
@@ -136,18 +357,35 @@ class MongoStore(BaseStore):
 
     def finalize(self):
         """As we depend on commits beeing finished with branches (for the references) we must wait first for
-        them to finish before we can start our branch processing."""
+        them to finish before we can start our branch processing. The commit storage processes are stopped before,
+        so that the branch storage processes can use their cores."""
+        if self.ordering_stage is not None:
+            self.ordering_stage.drain()
         self.commit_queue.join()
+        self.worker_pool.stop('write', self.commit_queue)
+        self.commit_queue.close()
+        if self.ordering_stage is not None:
+            self.ordering_stage.stop()
+
+        if self.commit_references is not None:
+            start_time = timeit.default_timer()
+            updated = CommitReferenceUpdater(self.vcs_system_id, self.branch_registry).update(self.commit_references)
+            logger.info("Attached the branches and tags of %d commits in %0.2f s" % (
+                updated, timeit.default_timer() - start_time))
 
         # after commits are finished, process branches
-        for i in range(self.cores_per_job):
+        for i in range(self.write_workers):
             name = "StorageProcessBranch-%d" % i
-            process = BranchStorageProcess(self.branch_queue, self.vcs_system_id, self.config, name)
-            process.daemon = True
-            process.start()
+            self.worker_pool.start('write', BranchStorageProcess(self.branch_queue, self.vcs_system_id, self.config,
+                                                                 name))
 
         # wait for branches to finish
         self.branch_queue.join()
+        self.worker_pool.stop('write', self.branch_queue)
+
+        # The run is complete, therefore nothing needs to be resumed
+        if self.config.shard_role != 'worker':
+            CommitJournal.clear(self.vcs_system_id)
         logger.info("Storing Process complete...")
         return
 
@@ -164,13 +402,16 @@ class BranchStorageProcess(multiprocessing.Process):
         self.proc_name = name
 
     def run(self):
-        """Endless loop for the processes.
+        """Loop for the processes, which ends if the poison pill (None) is read from the queue.
 
         1. Get a object of class :class:`pyvcsshark.dbmodels.models.BranchModel` from the queue
         2. Check if this branch was stored before and if so: update the branch, if not create branch
         """
         while True:
             branch = self.queue.get()
+            if branch is None:
+                self.queue.task_done()
+                break
             logger.debug("Process {} is processing branch {} -> {}".format(self.proc_name, branch.name, branch.target))
 
             # get commit OID for Target ref
@@ -188,24 +429,157 @@ class BranchStorageProcess(multiprocessing.Process):
 
             mongo_branch.commit_id = mongo_commit.id
             mongo_branch.is_origin_head = branch.is_origin_head
-            mongo_branch.save()
+            with timing.timed('store.write.branch'):
+                mongo_branch.save()
 
             logger.debug("Process %s saved branch %s. Queue size: %d" % (self.proc_name, branch.name, self.queue.qsize()))
 
             self.queue.task_done()
 
 
-class CommitStorageProcess(multiprocessing.Process):
+class TagWriter(object):
+    """ Methods for storing tags and people, which are shared by the :class:`CommitStorageProcess` and the
+    :class:`CommitReferenceUpdater`. The class must have the attributes vcs_system_id and proc_name.
+    """
+
+    def create_tags(self, commit_id, tags):
+        if tags:
+            with timing.timed('store.write.tag'):
+                return self._create_tags(commit_id, tags)
+        return []
+
+    def _create_tags(self, commit_id, tags):
+        tag_list = []
+        for tag in tags:
+            date = to_datetime(tag.taggerTimestamp)
+            if tag.tagger is not None:
+                tagger_id = self.create_people(tag.tagger.name, tag.tagger.email)
+                try:
+                    logger.debug("Process %s is creating tag %s with tagger." % (self.proc_name, tag.name))
+                    mongo_tag = Tag(commit_id=commit_id, name=tag.name, message=tag.message, tagger_id=tagger_id,
+                                    date=date, date_offset=tag.taggerOffset,
+                                    vcs_system_id=self.vcs_system_id).save()
+                except (DuplicateKeyError, NotUniqueError):
+                    logger.debug("Process %s found tag with tagger with name %s." % (self.proc_name, tag.name))
+                    mongo_tag = Tag.objects(commit_id=commit_id, name=tag.name) \
+                        .only('id', 'name').get()
+            else:
+                try:
+                    logger.debug("Process %s is creating tag %s." % (self.proc_name, tag.name))
+                    mongo_tag = Tag(commit_id=commit_id, name=tag.name, date=date,
+                                    date_offset=tag.taggerOffset, vcs_system_id=self.vcs_system_id).save()
+                except (DuplicateKeyError, NotUniqueError):
+                    logger.debug("Process %s is found tag %s." % (self.proc_name, tag.name))
+                    mongo_tag = Tag.objects(commit_id=commit_id, name=tag.name).only('id', 'name').get()
+
+            tag_list.append(mongo_tag)
+        return tag_list
+
+    def create_people(self, name, email):
+        """ Creates a people object of type People (which can be found in the pycoshark library) and returns a
+        object id of the type :class:`bson.objectid.ObjectId` of the stored object
+
+        :param name: name of the contributor
+        :param email: email of the contributor
+
+        .. NOTE:: The call to :func:`mongoengine.queryset.QuerySet.upsert_one` is thread/process safe
+        """
+        with timing.timed('store.write.people'):
+            try:
+                logger.debug("Process %s is creating person with email %s and name %s." % (self.proc_name, email,
+                                                                                             name))
+                people_id = People(name=name, email=email).save().id
+            except (DuplicateKeyError, NotUniqueError):
+                logger.debug("Process %s found person with email %s and name %s." % (self.proc_name, email, name))
+                people_id = People.objects(name=name, email=email).only('id').get().id
+        return people_id
+
+
+class CommitReferenceUpdater(TagWriter):
+    """ Attaches the branches and tags to commits, which were stored without them, because the parser walked the
+    references while the commits were already parsed (see :func:`MongoStore.set_commit_references`). The branches are
+    set with unordered bulk updates of BATCH_SIZE commits, the tags (which are only a few) are created one by one.
+
+    :param vcs_system_id: object id of class :class:`bson.objectid.ObjectId` from the vcs system
+    :param branch_registry: object of class :class:`pyvcsshark.parser.models.BranchRegistry`, which is used to get \
+    the names of the branches of the commits
+    """
+    BATCH_SIZE = 1000
+
+    def __init__(self, vcs_system_id, branch_registry):
+        self.vcs_system_id = vcs_system_id
+        self.branch_registry = branch_registry
+        self.proc_name = 'CommitReferenceUpdater'
+
+    def update(self, references):
+        """ Updates the commits and returns the number of commits, which got branches or tags
+
+        :param references: dictionary in the format of \
+        :attr:`pyvcsshark.parser.gitparser.GitParser.commits_to_be_processed`
+        """
+        collection = Commit._get_collection()
+        requests = []
+        updated = 0
+        for revision_hash, reference in references.items():
+            if reference['branches']:
+                requests.append(UpdateOne({'vcs_system_id': self.vcs_system_id, 'revision_hash': revision_hash},
+                                          {'$set': {'branches': self.branch_registry.names(reference['branches'])}}))
+                if len(requests) >= self.BATCH_SIZE:
+                    collection.bulk_write(requests, ordered=False)
+                    requests = []
+
+            if reference['tags']:
+                mongo_commit = Commit.objects(vcs_system_id=self.vcs_system_id, revision_hash=revision_hash)\
+                    .only('id').first()
+                if mongo_commit is not None:
+                    self.create_tags(mongo_commit.id, reference['tags'])
+
+            if reference['branches'] or reference['tags']:
+                updated += 1
+
+        if requests:
+            collection.bulk_write(requests, ordered=False)
+        return updated
+
+
+class CommitStorageProcess(multiprocessing.Process, TagWriter):
     """Class that inherits from :class:`multiprocessing.Process` for processing instances of class
     :class:`pyvcsshark.dbmodels.models.CommitModel` \
     and writing it into the mongodb
 
-    :param queue: queue, where the :class:`pyvcsshark.dbmodels.models.CommitModel` are stored in
+    :param queue: transport of class :class:`pyvcsshark.transport.BaseTransport`, where the \
+    :class:`pyvcsshark.dbmodels.models.CommitModel` are stored in
     :param vcs_system_id: object id of class :class:`bson.objectid.ObjectId` from the vcs system
     :param last_commit_date: object of class :class:`datetime.datetime`, which holds the last commit that was parsed
     :param config: object of class :class:`pyvcsshark.config.Config`, which holds configuration information
+    :param name: name of the process
+    :param branch_registry: object of class :class:`pyvcsshark.parser.models.BranchRegistry`, which is used to get \
+    the names of the branches of the commits
+    :param codec: subclass of :class:`pyvcsshark.codec.BaseCodec`, which is used to decode the commits of the queue
+    :param ordering_stage: object of class :class:`pyvcsshark.pipeline.OrderingStage`, to which the stored commits \
+    are reported (None, if the commits are not stored in topological order)
+
+    .. NOTE:: If the deduplication of hunks is enabled in the config, the hunk documents only hold the sha1 hash of \
+    their content in the field content_hash. The content is stored once per hash (compressed, if it gets smaller \
+    with the configured compression level) in the collection hunk_content. Use \
+    :func:`pyvcsshark.datastores.mongostore.get_hunks` or \
+    :func:`pyvcsshark.datastores.mongostore.resolve_hunk_contents` to read them.
+
+    .. NOTE:: The commits are stored by a pool of io_threads threads (see config), so that the process does not \
+    idle while it waits for the round trips to the mongodb. The process decodes the next commit while at most \
+    io_threads commits are stored. Every commit is still stored in the order file actions, hunks, commit document.
     """
-    def __init__(self, queue, vcs_system_id, last_commit_date, config, name):
+
+    # Maximal number of hunk content hashes that are remembered as already stored
+    MAX_KNOWN_HUNK_HASHES = 100000
+
+    # Set by the worker pool, if the process can be asked to leave the write stage and publish the commits it
+    # currently stores (see pyvcsshark.pipeline)
+    stage_control = None
+    task_slot = None
+
+    def __init__(self, queue, vcs_system_id, last_commit_date, config, name, branch_registry, codec,
+                 ordering_stage=None):
         multiprocessing.Process.__init__(self)
         uri = create_mongodb_uri_string(config.db_user, config.db_password, config.db_hostname, config.db_port,
                                         config.db_authentication, config.ssl_enabled)
@@ -214,9 +588,20 @@ class CommitStorageProcess(multiprocessing.Process):
         self.vcs_system_id = vcs_system_id
         self.last_commit_date = last_commit_date
         self.proc_name = name
+        self.branch_registry = branch_registry
+        self.codec = codec
+        self.dedup_hunks = config.dedup_hunks
+        self.hunk_compression_level = config.hunk_compression_level
+        self.known_hunk_hashes = set()
+        self.journal = CommitJournal(vcs_system_id)
+        self.io_threads = config.io_threads
+        self.ordering_stage = ordering_stage
+        self.lock = None
+        self.in_flight_commits = None
 
     def run(self):
-        """ Endless loop for the processes, which consists of several steps:
+        """ Loop for the processes, which ends if the poison pill (None) is read from the queue. It consists of
+        several steps:
 
         1. Get a object of class :class:`pyvcsshark.dbmodels.models.CommitModel` from the queue
         2. Check if this commit was stored before and if it is so: update branches and tags (if they have changed)
@@ -233,11 +618,96 @@ class CommitStorageProcess(multiprocessing.Process):
 
         .. WARNING:: We only look for changed tags and branches here for already processed commits!
         """
+        # The thread pool and the lock (for the journal, the in-flight commits and the known hunk hashes) must be
+        # created in the process
+        self.lock = timing.TimedLock(threading.Lock(), 'store.lock_wait')
+        self.in_flight_commits = []
+        executor = None
+        if self.io_threads > 1:
+            executor = concurrent.futures.ThreadPoolExecutor(self.io_threads)
+        in_flight = set()
+
         while True:
-            commit = self.queue.get()
-            logger.debug("Process %s is processing commit with hash %s." % (self.proc_name, commit.id))
+            # If the worker pool moves the process to another stage, it exits before it takes the next commit
+            if self.stage_control is not None and self.stage_control.leave():
+                self.wait_for_commits(in_flight, 0)
+                self.journal.flush()
+                break
+
+            with timing.timed('store.queue_get'):
+                data = self.queue.get()
+            if data is None:
+                self.wait_for_commits(in_flight, 0)
+                self.journal.flush()
+                self.queue.task_done()
+                break
+
+            self.track_commit(TaskSlot.UNKNOWN_TASK, True)
+            with timing.timed('store.decode'):
+                commit = self.codec.decode(data)
+            self.queue.release()
+            self.replace_tracked_commit(TaskSlot.UNKNOWN_TASK, commit.id)
+
+            if executor is None:
+                self.store_commit(commit)
+            else:
+                self.wait_for_commits(in_flight, self.io_threads - 1)
+                in_flight.add(executor.submit(self.store_commit, commit))
 
-            # Try to get the commit
+        if executor is not None:
+            executor.shutdown()
+
+    def track_commit(self, commit_id, in_flight):
+        """ Publishes the commits, which are taken from the queue but not stored yet, in the task slot (if any)
+
+        :param commit_id: revision hash of the commit
+        :param in_flight: True, if the commit was taken from the queue and False, if it is done
+        """
+        if self.task_slot is None:
+            return
+        with self.lock:
+            if in_flight:
+                self.in_flight_commits.append(commit_id)
+            else:
+                self.in_flight_commits.remove(commit_id)
+            self.task_slot.set(self.in_flight_commits)
+
+    def replace_tracked_commit(self, old_commit_id, new_commit_id):
+        """ Replaces a commit in the task slot (if any) with one update, so that the slot never holds both commits for
+        one task of the queue
+
+        :param old_commit_id: revision hash (or UNKNOWN_TASK), which is replaced
+        :param new_commit_id: revision hash, which replaces it
+        """
+        if self.task_slot is None:
+            return
+        with self.lock:
+            self.in_flight_commits[self.in_flight_commits.index(old_commit_id)] = new_commit_id
+            self.task_slot.set(self.in_flight_commits)
+
+    def wait_for_commits(self, in_flight, limit):
+        """ Waits until at most limit commits are stored by the thread pool. Errors of the threads are raised.
+
+        :param in_flight: set of :class:`concurrent.futures.Future` of the commits, which are stored
+        :param limit: number of commits, which may still be stored afterwards
+        """
+        while len(in_flight) > limit:
+            done, not_done = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                in_flight.remove(future)
+                future.result()
+
+    def store_commit(self, commit):
+        """ Stores the commit (steps 2 to 7 of :func:`run`) and marks it as done in the queue
+
+        :param commit: object of class :class:`pyvcsshark.parser.models.CommitModel`
+        """
+        logger.debug("Process %s is processing commit with hash %s." % (self.proc_name, commit.id))
+        start_time = timeit.default_timer()
+        tracing.start_commit(commit.id)
+
+        # Try to get the commit
+        with timing.timed('store.write.commit'):
             try:
                 mongo_commit = Commit.objects(vcs_system_id=self.vcs_system_id, revision_hash=commit.id).get()
             except DoesNotExist:
@@ -246,13 +716,24 @@ class CommitStorageProcess(multiprocessing.Process):
                     revision_hash=commit.id
                 ).save()
 
-            self.set_whole_commit(mongo_commit, commit)
+        self.set_whole_commit(mongo_commit, commit)
 
-            # Save Revision object
+        # Save Revision object
+        with timing.timed('store.write.commit'):
             mongo_commit.save()
-            logger.debug("Process %s saved commit with hash %s. Queue size: %d" % (self.proc_name, commit.id, self.queue.qsize()))
-
-            self.queue.task_done()
+        with self.lock:
+            with timing.timed('store.write.commit_journal'):
+                self.journal.add(commit.id)
+        if self.ordering_stage is not None:
+            self.ordering_stage.stored(commit.id)
+        metrics.increment(metrics.COMMITS_STORED)
+        tracing.end_commit()
+        slowcommits.record('store', commit.id, timeit.default_timer() - start_time,
+                           lambda: slowcommits.commit_features(commit))
+        logger.debug("Process %s saved commit with hash %s. Queue size: %d" % (self.proc_name, commit.id, self.queue.qsize()))
+
+        self.track_commit(commit.id, False)
+        self.queue.task_done()
 
     def set_whole_commit(self, mongo_commit, commit):
         # Create tags
@@ -266,12 +747,12 @@ class CommitStorageProcess(multiprocessing.Process):
         # Create people
         logger.debug("Process %s is setting author for commit with hash %s." % (self.proc_name, commit.id))
         mongo_commit.author_id = self.create_people(commit.author.name, commit.author.email)
-        mongo_commit.author_date = commit.authorDate
+        mongo_commit.author_date = to_datetime(commit.authorTimestamp)
         mongo_commit.author_date_offset = commit.authorOffset
 
         logger.debug("Process %s is setting committer for commit with hash %s." % (self.proc_name, commit.id))
         mongo_commit.committer_id = self.create_people(commit.committer.name, commit.committer.email)
-        mongo_commit.committer_date = commit.committerDate
+        mongo_commit.committer_date = to_datetime(commit.committerTimestamp)
         mongo_commit.committer_date_offset = commit.committerOffset
 
         # Set parent hashes
@@ -287,65 +768,19 @@ class CommitStorageProcess(multiprocessing.Process):
         self.create_file_actions(commit.changedFiles, mongo_commit.id)
 
     def create_branch_list(self, branches):
-        """Creates a list of the different branch names, where a commit belongs to. We go through the \
-        branches property of the class :class:`pyvcsshark.dbmodels.models.CommitModel`, which is a list of \
-        different branch objects of class `pyvcsshark.dbmodels.models.CommitModel`
+        """Creates a list of the different branch names, where a commit belongs to. We translate the \
+        branches property of the class :class:`pyvcsshark.dbmodels.models.CommitModel`, which is a bitmap of \
+        branch ids, with the help of the branch registry.
 
-        :param branches: list of objects of class :class:`pyvcsshark.dbmodels.models.BranchModel`
+        :param branches: bitmap of branch ids (see :class:`pyvcsshark.parser.models.BranchRegistry`)
         """
-        branch_list = []
-        for branch in branches:
-            if branch is not None:
-                branch_list.append(branch.name)
+        branch_list = self.branch_registry.names(branches)
 
         if len(branch_list) == 0:
             branch_list = None
 
         return branch_list
 
-    def create_tags(self, commit_id, tags):
-        tag_list = []
-        for tag in tags:
-            if tag.tagger is not None:
-                tagger_id = self.create_people(tag.tagger.name, tag.tagger.email)
-                try:
-                    logger.debug("Process %s is creating tag %s with tagger." % (self.proc_name, tag.name))
-                    mongo_tag = Tag(commit_id=commit_id, name=tag.name, message=tag.message, tagger_id=tagger_id,
-                                    date=tag.taggerDate, date_offset=tag.taggerOffset,
-                                    vcs_system_id=self.vcs_system_id).save()
-                except (DuplicateKeyError, NotUniqueError):
-                    logger.debug("Process %s found tag with tagger with name %s." % (self.proc_name, tag.name))
-                    mongo_tag = Tag.objects(commit_id=commit_id, name=tag.name) \
-                        .only('id', 'name').get()
-            else:
-                try:
-                    logger.debug("Process %s is creating tag %s." % (self.proc_name, tag.name))
-                    mongo_tag = Tag(commit_id=commit_id, name=tag.name, date=tag.taggerDate,
-                                    date_offset=tag.taggerOffset, vcs_system_id=self.vcs_system_id).save()
-                except (DuplicateKeyError, NotUniqueError):
-                    logger.debug("Process %s is found tag %s." % (self.proc_name, tag.name))
-                    mongo_tag = Tag.objects(commit_id=commit_id, name=tag.name).only('id', 'name').get()
-
-            tag_list.append(mongo_tag)
-        return tag_list
-
-    def create_people(self, name, email):
-        """ Creates a people object of type People (which can be found in the pycoshark library) and returns a
-        object id of the type :class:`bson.objectid.ObjectId` of the stored object
-
-        :param name: name of the contributor
-        :param email: email of the contributor
-
-        .. NOTE:: The call to :func:`mongoengine.queryset.QuerySet.upsert_one` is thread/process safe
-        """
-        try:
-            logger.debug("Process %s is creating person with email %s and name %s." % (self.proc_name, email, name))
-            people_id = People(name=name, email=email).save().id
-        except (DuplicateKeyError, NotUniqueError):
-            logger.debug("Process %s found person with email %s and name %s." % (self.proc_name, email, name))
-            people_id = People.objects(name=name, email=email).only('id').get().id
-        return people_id
-
     def create_file_actions(self, files, mongo_commit_id):
         """ Creates a list of object ids of type :class:`bson.objectid.ObjectId` for the different file actions of the
         commit by transforming the files into file actions of type FileAction, File, and Hunk (pycoshark library)
@@ -362,38 +797,33 @@ class CommitStorageProcess(multiprocessing.Process):
             old_file_id = None
             if file.oldPath is not None:
                 logger.debug("Process %s is creating old file with path %s." % (self.proc_name, file.oldPath))
-                try:
-                    old_file_id = File(vcs_system_id=self.vcs_system_id, path=file.oldPath).save().id
-                except (DuplicateKeyError, NotUniqueError):
-                    logger.debug("Process %s found old file with path %s." % (self.proc_name, file.oldPath))
-                    old_file_id = File.objects(vcs_system_id=self.vcs_system_id, path=file.oldPath).only('id').get().id
+                old_file_id = self.create_file(file.oldPath)
 
             # Create a new file object
-            try:
-                logger.debug("Process %s is creating file with path %s." % (self.proc_name, file.path))
-                new_file_id = File(vcs_system_id=self.vcs_system_id, path=file.path).save().id
-            except (DuplicateKeyError, NotUniqueError):
-                logger.debug("Process %s found file with path %s." % (self.proc_name, file.path))
-                new_file_id = File.objects(vcs_system_id=self.vcs_system_id, path=file.path).only('id').get().id
+            logger.debug("Process %s is creating file with path %s." % (self.proc_name, file.path))
+            new_file_id = self.create_file(file.path)
 
             # Create the new file action
-            try:
-                logger.debug("Process %s is creating file action with file_id %s." % (self.proc_name, new_file_id))
-                file_action_id = FileAction.objects(file_id=new_file_id, commit_id=mongo_commit_id,
-                                                    parent_revision_hash=file.parent_revision_hash).get().id
-
-                logger.debug("Process %s is deleting all hunks for file action id %s." % (self.proc_name, file_action_id))
-                Hunk.objects(file_action_id=file_action_id).all().delete()
-            except DoesNotExist:
-                file_action_id = FileAction(file_id=new_file_id,
-                                            commit_id=mongo_commit_id,
-                                            size_at_commit=file.size,
-                                            lines_added=file.linesAdded,
-                                            lines_deleted=file.linesDeleted,
-                                            is_binary=file.isBinary,
-                                            mode=file.mode,
-                                            old_file_id=old_file_id,
-                                            parent_revision_hash=file.parent_revision_hash).save().id
+            with timing.timed('store.write.file_action'):
+                try:
+                    logger.debug("Process %s is creating file action with file_id %s." % (self.proc_name,
+                                                                                          new_file_id))
+                    file_action_id = FileAction.objects(file_id=new_file_id, commit_id=mongo_commit_id,
+                                                        parent_revision_hash=file.parent_revision_hash).get().id
+
+                    logger.debug("Process %s is deleting all hunks for file action id %s." % (self.proc_name,
+                                                                                              file_action_id))
+                    Hunk.objects(file_action_id=file_action_id).all().delete()
+                except DoesNotExist:
+                    file_action_id = FileAction(file_id=new_file_id,
+                                                commit_id=mongo_commit_id,
+                                                size_at_commit=file.size,
+                                                lines_added=file.linesAdded,
+                                                lines_deleted=file.linesDeleted,
+                                                is_binary=file.isBinary,
+                                                mode=file.mode,
+                                                old_file_id=old_file_id,
+                                                parent_revision_hash=file.parent_revision_hash).save().id
 
             # Create hunk objects for bulk insert
             logger.debug("Process %s is creating hunks for bulk insert." % self.proc_name)
@@ -404,13 +834,99 @@ class CommitStorageProcess(multiprocessing.Process):
                 hunks.append(mongo_hunk)
 
             # Get hunk ids from insert if hunks is not empty
-            if hunks:
-                try:
-                    logger.debug("Process %s is inserting hunks..." % self.proc_name)
-                    Hunk.objects.insert(hunks, load_bulk=False)
-                except DocumentTooLarge:
-                    for hunk in hunks:
-                        try:
-                            hunk.save()
-                        except DocumentTooLarge:
-                            logger.info("Document was too large for commit: %s" % mongo_commit_id)
+            if hunks and self.dedup_hunks:
+                logger.debug("Process %s is inserting deduplicated hunks..." % self.proc_name)
+                self.insert_deduplicated_hunks(file_action_id, file.hunks)
+            elif hunks:
+                with timing.timed('store.write.hunk'):
+                    try:
+                        logger.debug("Process %s is inserting hunks..." % self.proc_name)
+                        Hunk.objects.insert(hunks, load_bulk=False)
+                    except DocumentTooLarge:
+                        for hunk in hunks:
+                            try:
+                                hunk.save()
+                            except DocumentTooLarge:
+                                logger.info("Document was too large for commit: %s" % mongo_commit_id)
+
+    def create_file(self, path):
+        """ Creates the file with the path (if it does not exist) and returns its object id of type \
+        :class:`bson.objectid.ObjectId`
+
+        :param path: path of the file
+        """
+        with timing.timed('store.write.file'):
+            try:
+                return File(vcs_system_id=self.vcs_system_id, path=path).save().id
+            except (DuplicateKeyError, NotUniqueError):
+                logger.debug("Process %s found file with path %s." % (self.proc_name, path))
+                return File.objects(vcs_system_id=self.vcs_system_id, path=path).only('id').get().id
+
+    def insert_deduplicated_hunks(self, file_action_id, hunks):
+        """ Inserts the hunks of a file action, whereby each distinct content is only stored once in the collection \
+        hunk_content (keyed by its sha1 hash). The hunk documents only reference their content via the field \
+        content_hash.
+
+        :param file_action_id: object id of class :class:`bson.objectid.ObjectId` of the file action
+        :param hunks: list of hunks of class :class:`pyvcsshark.parser.models.Hunk`
+        """
+        hunk_documents = []
+        contents = {}
+        for hunk in hunks:
+            content = hunk.content.encode('utf-8', 'surrogatepass')
+            content_hash = hashlib.sha1(content).hexdigest()
+            contents[content_hash] = content
+            hunk_documents.append({'file_action_id': file_action_id, 'new_start': hunk.new_start,
+                                   'new_lines': hunk.new_lines, 'old_start': hunk.old_start,
+                                   'old_lines': hunk.old_lines, 'content_hash': content_hash})
+
+        # The known hashes are shared by the io threads of the process
+        with self.lock:
+            new_contents = {content_hash: content for content_hash, content in contents.items()
+                            if content_hash not in self.known_hunk_hashes}
+
+        if new_contents:
+            requests = {}
+            for content_hash, content in new_contents.items():
+                compressed = False
+                if self.hunk_compression_level > 0:
+                    compressed_content = zlib.compress(content, self.hunk_compression_level)
+                    if len(compressed_content) < len(content):
+                        content = compressed_content
+                        compressed = True
+                requests[content_hash] = UpdateOne({'_id': content_hash},
+                                                   {'$setOnInsert': {'content': content, 'compressed': compressed}},
+                                                   upsert=True)
+            try:
+                self.write_hunk_contents(list(requests.values()))
+            except DocumentTooLarge:
+                for content_hash, request in requests.items():
+                    try:
+                        self.write_hunk_contents([request])
+                    except DocumentTooLarge:
+                        logger.info("Document was too large for file action: %s" % file_action_id)
+                        del new_contents[content_hash]
+                        hunk_documents = [hunk for hunk in hunk_documents if hunk['content_hash'] != content_hash]
+
+            with self.lock:
+                if len(self.known_hunk_hashes) > self.MAX_KNOWN_HUNK_HASHES:
+                    self.known_hunk_hashes.clear()
+                self.known_hunk_hashes.update(new_contents)
+
+        if hunk_documents:
+            with timing.timed('store.write.hunk'):
+                Hunk._get_collection().insert_many(hunk_documents, ordered=False)
+
+    def write_hunk_contents(self, requests):
+        """ Writes the upserts of hunk contents into the collection hunk_content
+
+        :param requests: list of :class:`pymongo.UpdateOne` upserts
+        """
+        try:
+            with timing.timed('store.write.hunk_content'):
+                get_db()[HUNK_CONTENT_COLLECTION].bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            # Concurrent upserts of the same content by other processes can fail with a duplicate key error,
+            # which means that the content is already stored
+            if any(error['code'] != 11000 for error in e.details['writeErrors']):
+                raise
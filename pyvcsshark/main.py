@@ -1,6 +1,16 @@
 from pyvcsshark.datastores.basestore import BaseStore
 from pyvcsshark.parser.baseparser import BaseParser
+from pyvcsshark.parser import models
+from pyvcsshark.pipeline import Autoscaler, OrderingStage, Supervisor, WorkerPool
+from pyvcsshark.memory import MemoryTracker
+from pyvcsshark.metrics import MetricsExporter
+from pyvcsshark.profiling import WorkerProfiler
+from pyvcsshark.progress import ProgressReporter
+from pyvcsshark.slowcommits import SlowCommitCatalogue
+from pyvcsshark.timing import TimingCollector, format_report
+from pyvcsshark.tracing import DatabaseTracer
 
+import copy
 import logging
 import sys
 import traceback
@@ -19,7 +29,7 @@ class Application(object):
     for the specified repository is instantiated
 
     3. :func:`pyvcsshark.parser.baseparser.BaseParser.initialize` is called (concreter: the **implemented function**
-    of the **correct parser**)
+    of the **correct parser**). With a streaming walk, the parser calls it itself in step 5.
 
     4. :func:`pyvcsshark.datastores.basestore.BaseStore.initialize` is called with the different configuration
     parameters and values from the parser (concreter: the **implemented function** of the **correct datastore**)
@@ -27,41 +37,334 @@ class Application(object):
     5. :func:`pyvcsshark.baseparser.BaseParser.parse` is called to start the parsing process of the repository
     (concreter: the **implemented function** of the **correct parser**)
 
+    The worker processes of the parser and the datastore are started via one
+    :class:`pyvcsshark.pipeline.WorkerPool`. Their number is given by the :class:`pyvcsshark.pipeline.WorkerPlan`
+    of the config, which splits the cores per job between the stages. If the commits should be stored in
+    topological order, a :class:`pyvcsshark.pipeline.OrderingStage` with the order of the parser is set at the parser
+    and the datastore.
+
     6. :func:`pyvcsshark.parser.baseparser.BaseParser.finalize` is called to finalize the parsing process
     (e.g. closing files) (concreter: the **implemented function** of the **correct parser**)
 
     7. :func:`pyvcsshark.datastores.basestore.BaseStore.finalize` is called to finalize the storing process
     (e.g. closing connections) (concreter: the **implemented function** of the **correct datastore**)
 
+    If a metrics file is configured, a :class:`pyvcsshark.metrics.MetricsExporter` writes the metrics of the run
+    into it while the run continues. If a profile directory is configured, the workers are profiled (see
+    :mod:`pyvcsshark.profiling`). If a memory report is configured, the allocations of all processes are traced (see
+    :mod:`pyvcsshark.memory`). If a database trace is configured, the round trips to the mongodb are traced (see
+    :mod:`pyvcsshark.tracing`).
+
+    At the end, the timers of the stages of all processes (see :mod:`pyvcsshark.timing`) are merged and logged
+    together with the execution time.
+
     :param config: An instance of :class:`~pyvcsshark.Config`, which contains the configuration parameters
+    :param worker_pool: object of class :class:`pyvcsshark.pipeline.WorkerPool`, which is used for the workers (a new \
+    one is created, if it is None)
+
+    :property number_of_commits: number of commits that were processed (None if the parser does not know it)
+    :property quarantined: list of (stage, task) tuples of the tasks, which were given up after their workers died \
+    too often (see :class:`pyvcsshark.pipeline.Supervisor`)
+    :property elapsed: execution time in seconds
+    :property database_trace: summary of the round trips to the mongodb (see \
+    :func:`pyvcsshark.tracing.DatabaseTracer.stop`), if they were traced (None otherwise)
+    :property slow_commits: dictionary stage -> slowest commits (see \
+    :func:`pyvcsshark.slowcommits.SlowCommitCatalogue.stop`), if they were catalogued (None otherwise)
+    :property timings: dictionary stage -> :class:`pyvcsshark.timing.Histogram` with the timers of all processes
     """
     
-    def __init__(self,config):
+    def __init__(self, config, worker_pool=None):
         logger.setLevel(config.debug_level)
+
+        # The models only validate the assigned values in debug mode, as this is too costly for large commits
+        models.set_validation(config.debug_level == 'DEBUG')
         
         # Only find correct parser and parse,
         # Measure execution time
         start_time = timeit.default_timer()
-                    
-        datastore = BaseStore.find_correct_datastore(config.db_driver)
-        logger.info("Using %s for storing the results of repository %s" % (datastore.__class__.__name__, config.path))
 
+        # The collector must be started before the workers are forked
+        timing_collector = TimingCollector()
+        timing_collector.start()
+
+        if worker_pool is None:
+            worker_pool = WorkerPool()
+        supervisor = autoscaler = metrics_exporter = progress_reporter = profiler = memory_tracker = None
+        database_tracer = slow_commit_catalogue = None
+        self.number_of_commits = None
         try:
-            parser = BaseParser.find_correct_parser(config.path)
-            logger.info("Using %s for parsing directory %s" % (parser.__class__.__name__, config.path))
-        except Exception as e:
-            traceback.print_exc()
-            logger.exception("Failed to instantiate parser.")
-            sys.exit(1)
-            
-        # Set projectName, url and repository type, as they
-        # are most likely required for storing into a datastore (e.g. creating a project table)
-        parser.initialize()
-        datastore.initialize(config, parser.get_project_url(), parser.repository_type)
-        parser.parse(config.path, datastore, config.cores_per_job)
-        parser.finalize()
-        datastore.finalize()
-            
-        elapsed = timeit.default_timer() - start_time
-        
-        logger.info("Execution time: %0.5f s" % elapsed)
\ No newline at end of file
+            datastore = BaseStore.find_correct_datastore(config.db_driver)
+            logger.info("Using %s for storing the results of repository %s" % (datastore.__class__.__name__,
+                                                                                config.path))
+
+            try:
+                parser = BaseParser.find_correct_parser(config.path)
+                logger.info("Using %s for parsing directory %s" % (parser.__class__.__name__, config.path))
+            except Exception as e:
+                traceback.print_exc()
+                logger.exception("Failed to instantiate parser.")
+                sys.exit(1)
+
+            parser.worker_pool = worker_pool
+            datastore.worker_pool = worker_pool
+            logger.info("Using workers: %s" % config.worker_plan)
+
+            # The exporter and the tracers must be started before the workers are forked
+            if config.metrics_file is not None:
+                metrics_exporter = MetricsExporter(config.metrics_file, worker_pool, config.project_name,
+                                                   config.metrics_interval)
+                metrics_exporter.start()
+
+            if config.profile_dir is not None:
+                profiler = WorkerProfiler(config.profile_dir, config.profile_mode, config.profile_interval / 1000.0)
+                worker_pool.wrappers.append(profiler.wrap)
+
+            # The tracing of the allocations must be started before the workers are forked
+            if config.memory_report is not None:
+                memory_tracker = MemoryTracker(config.memory_report)
+                memory_tracker.structures['commits_to_be_processed'] = \
+                    lambda: getattr(parser, 'commits_to_be_processed', None)
+                memory_tracker.structures['commit queue feeder buffer'] = \
+                    lambda: getattr(getattr(parser, 'commit_queue', None), '_buffer', None)
+                memory_tracker.start()
+                worker_pool.wrappers.append(memory_tracker.wrap)
+
+            if config.trace_db is not None:
+                database_tracer = DatabaseTracer(config.trace_db, config.trace_db_threshold)
+                database_tracer.start()
+                worker_pool.wrappers.append(database_tracer.wrap)
+
+            if config.slow_commit_report is not None:
+                slow_commit_catalogue = SlowCommitCatalogue(config.slow_commit_report, config.slow_commits)
+                slow_commit_catalogue.start()
+                worker_pool.wrappers.append(slow_commit_catalogue.wrap)
+
+            # The supervisor replaces dead workers and retries their commits
+            supervisor = Supervisor(worker_pool, config.max_retries)
+            supervisor.set_retry_handler('write', parser.retry_commit)
+            supervisor.start()
+
+            # Set projectName, url and repository type, as they
+            # are most likely required for storing into a datastore (e.g. creating a project table)
+            project_url = parser.get_project_url()
+            if config.resume:
+                parser.excluded_commits = datastore.get_journaled_commits(config, project_url)
+                logger.info("Resuming run, %d commits were already stored" % len(parser.excluded_commits))
+
+            # With a streaming walk, the parser walks the references in parse, while its workers already parse
+            # commits
+            if config.streaming_walk:
+                parser.streaming_walk = True
+            else:
+                parser.initialize()
+            if memory_tracker is not None:
+                memory_tracker.checkpoint('initialize')
+            self.number_of_commits = parser.get_number_of_commits()
+            if metrics_exporter is not None:
+                metrics_exporter.number_of_commits = self.number_of_commits
+            if config.topological_order:
+                ordering_stage = OrderingStage(parser.get_topological_order(), config.reorder_window)
+                parser.ordering_stage = ordering_stage
+                datastore.ordering_stage = ordering_stage
+                # A quarantined commit must not block the commits after it
+                supervisor.set_quarantine_handler('diff', ordering_stage.skip)
+            datastore.branch_registry = parser.branch_registry
+            # The progress reporter must be started before the workers are forked
+            if config.progress_interval > 0:
+                progress_reporter = ProgressReporter(config.progress_interval, config.progress_json)
+                # With a streaming walk, the number of commits is only known after parse
+                if not config.streaming_walk:
+                    progress_reporter.number_of_commits = self.number_of_commits
+                progress_reporter.start()
+            datastore.initialize(config, project_url, parser.repository_type)
+            # The autoscaler moves workers between the diff and the write stage while the commits are parsed
+            if config.autoscale:
+                autoscaler = Autoscaler(worker_pool)
+                autoscaler.start()
+            parser.parse(config.path, datastore, config.worker_plan.diff_workers)
+            if memory_tracker is not None:
+                memory_tracker.checkpoint('parse')
+            if autoscaler is not None:
+                autoscaler.stop()
+                autoscaler = None
+            if config.streaming_walk:
+                self.number_of_commits = parser.get_number_of_commits()
+                if metrics_exporter is not None:
+                    metrics_exporter.number_of_commits = self.number_of_commits
+                if progress_reporter is not None:
+                    progress_reporter.number_of_commits = self.number_of_commits
+            parser.finalize()
+            datastore.finalize()
+            if memory_tracker is not None:
+                memory_tracker.checkpoint('finalize')
+        finally:
+            # The helpers are also stopped, if the run failed, so that they do not outlive it (e.g., in a batch, whose
+            # repositories share the worker pool). The supervisor must be stopped before the workers are terminated,
+            # as it would replace them otherwise.
+            if autoscaler is not None:
+                autoscaler.stop()
+            self.quarantined = []
+            if supervisor is not None:
+                supervisor.stop()
+                self.quarantined = supervisor.quarantined
+            worker_pool.terminate()
+            if metrics_exporter is not None:
+                metrics_exporter.stop()
+            if progress_reporter is not None:
+                progress_reporter.stop()
+            if profiler is not None:
+                profiler.report()
+                worker_pool.wrappers.remove(profiler.wrap)
+            if memory_tracker is not None:
+                memory_tracker.stop()
+                worker_pool.wrappers.remove(memory_tracker.wrap)
+            self.database_trace = None
+            if database_tracer is not None:
+                self.database_trace = database_tracer.stop()
+                worker_pool.wrappers.remove(database_tracer.wrap)
+            self.slow_commits = None
+            if slow_commit_catalogue is not None:
+                self.slow_commits = slow_commit_catalogue.stop()
+                worker_pool.wrappers.remove(slow_commit_catalogue.wrap)
+
+            self.elapsed = timeit.default_timer() - start_time
+            self.timings = timing_collector.stop()
+
+            for line in format_report(self.timings, self.elapsed):
+                logger.info(line)
+
+
+class RepositoryResult(object):
+    """ Result of the processing of one repository of a batch
+
+    :param project_name: name of the project
+    :param path: path to the repository
+    :param number_of_commits: number of processed commits (None, if unknown)
+    :param elapsed: execution time in seconds
+    :param error: error message, if the processing failed (None otherwise)
+    :param quarantined: number of tasks, which were quarantined (see :class:`pyvcsshark.pipeline.Supervisor`). A \
+    repository with quarantined tasks was only processed partially.
+    """
+
+    def __init__(self, project_name, path, number_of_commits, elapsed, error=None, quarantined=0):
+        self.project_name = project_name
+        self.path = path
+        self.number_of_commits = number_of_commits
+        self.elapsed = elapsed
+        self.error = error
+        self.quarantined = quarantined
+
+    @property
+    def succeeded(self):
+        """Returns True, if the repository was processed completely"""
+        return self.error is None and not self.quarantined
+
+    @property
+    def partial(self):
+        """Returns True, if the processing finished, but tasks were quarantined"""
+        return self.error is None and bool(self.quarantined)
+
+    def __str__(self):
+        if self.partial:
+            return "%s (%s): PARTIAL after %0.2f s: %d tasks were quarantined" % (
+                self.project_name, self.path, self.elapsed, self.quarantined)
+        if not self.succeeded:
+            return "%s (%s): FAILED after %0.2f s: %s" % (self.project_name, self.path, self.elapsed, self.error)
+        if self.number_of_commits is None:
+            return "%s (%s): %0.2f s" % (self.project_name, self.path, self.elapsed)
+        return "%s (%s): %d commits in %0.2f s (%0.1f commits/s)" % (
+            self.project_name, self.path, self.number_of_commits, self.elapsed,
+            self.number_of_commits / max(self.elapsed, 1e-9))
+
+
+class BatchApplication(object):
+    """ Application, which processes several repositories one after another in the same process. Compared to one
+    run of vcsSHARK per repository, the interpreter startup, the import and discovery of the parser and datastore
+    plugins and the connection to the datastore (e.g., the client of mongoengine, which is reused when the
+    datastore connects again with the same settings) are only paid once. All repositories use the same
+    :class:`pyvcsshark.pipeline.WorkerPool`.
+
+    .. NOTE:: Nothing else is kept warm between the repositories: the parser, the datastore and the diff and write
+       workers are created anew for every repository, as they hold its state (e.g., the opened git repository, the
+       vcs system and the caches of the known people and hunks). The workers are forked from this (warm) process.
+
+    A failing repository is logged and reported, but does not stop the batch. A repository, whose tasks were
+    quarantined, is reported as partially processed and counts as failed.
+
+    The manifest is a text file with one repository per line: the project name and the path to the repository,
+    separated by whitespace. Empty lines and lines starting with # are ignored.
+
+    :param config: An instance of :class:`~pyvcsshark.Config`. The project name and path are taken from the manifest.
+    :param manifest_path: path to the manifest
+
+    :property results: list of :class:`RepositoryResult`, one per repository of the manifest
+    """
+
+    def __init__(self, config, manifest_path):
+        logger.setLevel(config.debug_level)
+        repositories = self.read_manifest(manifest_path)
+        logger.info("Processing %d repositories of manifest %s" % (len(repositories), manifest_path))
+
+        start_time = timeit.default_timer()
+        worker_pool = WorkerPool()
+        self.results = []
+        for project_name, path in repositories:
+            repository_config = copy.copy(config)
+            repository_config.project_name = project_name
+            repository_config.path = path.rstrip('/')
+
+            logger.info("Processing repository %s of project %s" % (path, project_name))
+            repository_start_time = timeit.default_timer()
+            try:
+                application = Application(repository_config, worker_pool)
+                result = RepositoryResult(project_name, path, application.number_of_commits, application.elapsed,
+                                          quarantined=len(application.quarantined))
+            # The parser and datastore exit on fatal errors (e.g., unknown project), which should only end the
+            # processing of this repository
+            except (Exception, SystemExit) as e:
+                logger.exception("Processing of repository %s failed" % path)
+                worker_pool.terminate()
+                error = str(e) if isinstance(e, Exception) else "exited with status %s" % e.code
+                result = RepositoryResult(project_name, path, None, timeit.default_timer() - repository_start_time,
+                                          error)
+            logger.info(str(result))
+            self.results.append(result)
+
+        self.elapsed = timeit.default_timer() - start_time
+        self.log_summary()
+
+    @staticmethod
+    def read_manifest(manifest_path):
+        """ Reads the manifest and returns a list of (project name, path) tuples
+
+        :param manifest_path: path to the manifest
+        """
+        repositories = []
+        with open(manifest_path, 'r') as manifest:
+            for line_number, line in enumerate(manifest, 1):
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                entry = line.split(None, 1)
+                if len(entry) != 2:
+                    raise Exception("Line %d of manifest %s must contain a project name and a path" %
+                                    (line_number, manifest_path))
+                repositories.append((entry[0], entry[1]))
+        return repositories
+
+    @property
+    def failed(self):
+        """Returns the results of the repositories, whose processing failed or was only partial"""
+        return [result for result in self.results if not result.succeeded]
+
+    def log_summary(self):
+        """Logs the result of every repository and the throughput of the batch"""
+        number_of_commits = sum(result.number_of_commits or 0 for result in self.results)
+        number_of_partial = len([result for result in self.results if result.partial])
+        logger.info("Processed %d repositories (%d failed, %d partially) with %d commits in %0.2f s "
+                    "(%0.2f repositories/s, %0.1f commits/s)" % (
+                        len(self.results), len(self.failed) - number_of_partial, number_of_partial,
+                        number_of_commits, self.elapsed, len(self.results) / max(self.elapsed, 1e-9),
+                        number_of_commits / max(self.elapsed, 1e-9)))
+        for result in self.failed:
+            logger.error(str(result))
\ No newline at end of file
@@ -0,0 +1,255 @@
+"""Memory accounting of a run. The :class:`MemoryTracker` traces the allocations of all processes with
+:mod:`tracemalloc` (which roughly doubles the run time, therefore it is opt-in) and writes a report with:
+
+* **checkpoints** of the main process at the boundaries of the stages (after initialize, after parse and after
+  finalize) and at its largest traced size during the run: resident set size, traced memory, the sizes of the
+  major in-memory structures (e.g., commits_to_be_processed of the parser, the feeder buffer of the queue of the
+  commits) and the top allocation sites
+* **workers**: for every worker process its peak resident set size, peak traced memory and the top allocation sites
+  at its largest traced size (e.g., the hunk strings of :func:`pyvcsshark.parser.gitparser.CommitParserProcess.create_hunks`)
+* **peak resident set size per stage**: maximum and sum over the workers of each stage
+
+The allocations are grouped by the line, which allocated them.
+"""
+import collections
+import functools
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import threading
+import timeit
+import tracemalloc
+
+from pyvcsshark.metrics import read_memory
+
+logger = logging.getLogger("main")
+
+MB = 1024.0 * 1024.0
+
+
+def peak_rss():
+    """ Returns the peak resident set size of this process in bytes """
+    peak = read_memory(os.getpid()).get('peak_rss')
+    if peak is None:
+        # ru_maxrss is given in kilobytes on linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return peak
+
+
+def deep_size(obj):
+    """ Returns the estimated size in bytes of the object and all objects it contains (containers, attributes of
+    objects and slots). Objects that are contained several times are counted once.
+
+    :param obj: object
+    """
+    seen = set()
+    size = 0
+    objects = [obj]
+    while objects:
+        current = objects.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+
+        if isinstance(current, (str, bytes, bytearray, int, float, bool, type(None))):
+            continue
+        if isinstance(current, dict):
+            objects.extend(current.keys())
+            objects.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset, collections.deque)):
+            objects.extend(current)
+        if hasattr(current, '__dict__'):
+            objects.append(current.__dict__)
+        for slot in getattr(type(current), '__slots__', ()):
+            if hasattr(current, slot):
+                objects.append(getattr(current, slot))
+    return size
+
+
+def take_snapshot(top):
+    """ Takes a snapshot of the traced allocations of this process and returns a dictionary with the traced size
+    (traced) and the top allocation sites (sites: list of (line, size, number of blocks))
+
+    :param top: number of allocation sites
+    """
+    snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+    statistics = snapshot.statistics('lineno')
+    return {'traced': sum(statistic.size for statistic in statistics),
+            'sites': [(str(statistic.traceback), statistic.size, statistic.count) for statistic in statistics[:top]]}
+
+
+class LargestSnapshot(threading.Thread):
+    """ Thread, which checks the traced memory of its process every interval and takes a snapshot (see
+    :func:`take_snapshot`), whenever it grew by GROWTH since the largest snapshot. Only the summary of the largest
+    snapshot is kept.
+
+    :param interval: seconds between two checks
+    :param top: number of allocation sites of the snapshot
+    """
+    GROWTH = 1.2
+
+    def __init__(self, interval, top):
+        threading.Thread.__init__(self, name='LargestSnapshot', daemon=True)
+        self.interval = interval
+        self.top = top
+        self.largest = None
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def check(self):
+        current, peak = tracemalloc.get_traced_memory()
+        if self.largest is None or current > self.largest['traced'] * self.GROWTH:
+            self.offer(take_snapshot(self.top))
+
+    def offer(self, snapshot):
+        """ Keeps the snapshot, if it is the largest one """
+        if self.largest is None or snapshot['traced'] > self.largest['traced']:
+            self.largest = snapshot
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class MemoryTracker(threading.Thread):
+    """ Memory accounting of a run (see module documentation). It must be started before the workers are forked,
+    as they inherit the tracing. Its thread receives the reports of the workers, which end.
+
+    :param path: path of the report
+    :param top: number of allocation sites per checkpoint and worker
+    :param interval: seconds between two checks for a larger snapshot
+
+    :property structures: dictionary name -> function, which returns a major in-memory structure of the main \
+    process, whose size is given at every checkpoint
+    """
+
+    def __init__(self, path, top=15, interval=5):
+        threading.Thread.__init__(self, name='MemoryTracker', daemon=True)
+        self.path = path
+        self.top = top
+        self.interval = interval
+        self.queue = multiprocessing.Queue()
+        self.structures = {}
+        self.checkpoints = []
+        self.workers = []
+        self.main_snapshots = None
+
+    def start(self):
+        tracemalloc.start()
+        self.main_snapshots = LargestSnapshot(self.interval, self.top)
+        self.main_snapshots.start()
+        threading.Thread.start(self)
+
+    def run(self):
+        while True:
+            worker = self.queue.get()
+            if worker is None:
+                break
+            self.workers.append(worker)
+
+    def checkpoint(self, name):
+        """ Records a checkpoint of the main process. Must be called by the main thread, as it measures the structures.
+
+        :param name: name of the checkpoint (e.g. the stage, which ended)
+        """
+        start_time = timeit.default_timer()
+        snapshot = take_snapshot(self.top)
+        self.main_snapshots.offer(snapshot)
+        current, peak = tracemalloc.get_traced_memory()
+        structures = []
+        for structure_name, get_structure in sorted(self.structures.items()):
+            structure = get_structure()
+            if structure is not None:
+                structures.append((structure_name, len(structure), deep_size(structure)))
+
+        self.checkpoints.append({'name': name, 'rss': read_memory(os.getpid()).get('rss'), 'traced_peak': peak,
+                                 'snapshot': snapshot, 'structures': structures})
+        logger.debug("Memory checkpoint %s took %0.2f s" % (name, timeit.default_timer() - start_time))
+
+    def wrap(self, run, stage, worker_name):
+        """ Wraps the run function of a worker, so that it traces only its own allocations and reports them when it
+        ends (see :class:`pyvcsshark.pipeline.WorkerPool`)
+
+        :param run: run function of a :class:`multiprocessing.Process`
+        :param stage: name of the stage of the worker
+        :param worker_name: name of the worker
+        """
+        @functools.wraps(run)
+        def traced_run():
+            # The traces of the allocations of the main process are inherited
+            tracemalloc.clear_traces()
+            snapshots = LargestSnapshot(self.interval, self.top)
+            snapshots.start()
+            try:
+                return run()
+            finally:
+                snapshots.stop()
+                snapshots.offer(take_snapshot(self.top))
+                self.queue.put({'worker': worker_name, 'stage': stage, 'peak_rss': peak_rss(),
+                                'traced_peak': tracemalloc.get_traced_memory()[1], 'snapshot': snapshots.largest})
+        return traced_run
+
+    def stop(self):
+        """ Stops the tracing after the workers ended, writes the report and returns its path """
+        self.main_snapshots.stop()
+        self.queue.put(None)
+        self.join()
+        self.queue.close()
+        tracemalloc.stop()
+
+        with open(self.path, 'w') as f:
+            f.write('\n'.join(self.format_report()) + '\n')
+
+        for line in self.format_stage_peaks():
+            logger.info(line)
+        logger.info("Wrote the memory report to %s" % self.path)
+        return self.path
+
+    def format_stage_peaks(self):
+        stages = {}
+        for worker in self.workers:
+            stages.setdefault(worker['stage'], []).append(worker['peak_rss'])
+        lines = ["Peak RSS of the main process: %0.1f MB" % (peak_rss() / MB)]
+        for stage, peaks in sorted(stages.items()):
+            lines.append("Peak RSS of stage %s: %0.1f MB max, %0.1f MB sum over %d workers" % (
+                stage, max(peaks) / MB, sum(peaks) / MB, len(peaks)))
+        return lines
+
+    def format_sites(self, snapshot):
+        lines = ["  Top allocation sites (%0.1f MB traced):" % (snapshot['traced'] / MB)]
+        for site, size, count in snapshot['sites']:
+            lines.append("  %10.1f MB %10d blocks  %s" % (size / MB, count, site))
+        return lines
+
+    def format_report(self):
+        """ Returns the lines of the report """
+        lines = self.format_stage_peaks() + ['']
+
+        for checkpoint in self.checkpoints:
+            rss = checkpoint['rss']
+            lines.append("=== Checkpoint %s (main process): rss %s, traced peak %0.1f MB ===" % (
+                checkpoint['name'], '%0.1f MB' % (rss / MB) if rss is not None else 'unknown',
+                checkpoint['traced_peak'] / MB))
+            if checkpoint['structures']:
+                lines.append("  Structures:")
+                for name, entries, size in checkpoint['structures']:
+                    lines.append("  %10.1f MB %10d entries %s" % (size / MB, entries, name))
+            lines += self.format_sites(checkpoint['snapshot']) + ['']
+
+        if self.main_snapshots.largest is not None:
+            lines.append("=== Largest snapshot of the main process ===")
+            lines += self.format_sites(self.main_snapshots.largest) + ['']
+
+        for worker in sorted(self.workers, key=lambda worker: -worker['peak_rss']):
+            lines.append("=== Worker %s (stage %s): peak rss %0.1f MB, traced peak %0.1f MB ===" % (
+                worker['worker'], worker['stage'], worker['peak_rss'] / MB, worker['traced_peak'] / MB))
+            if worker['snapshot'] is not None:
+                lines += self.format_sites(worker['snapshot'])
+            lines.append('')
+        return lines
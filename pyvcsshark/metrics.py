@@ -0,0 +1,279 @@
+"""Metrics of a running job, which are written periodically as Prometheus textfile (e.g., for the textfile collector
+of the node exporter), so that stalled or degraded jobs can be alerted on. The counters are kept in shared memory
+(see :class:`SharedCounters`), which is created before the workers are forked. Therefore, all processes of a run
+increment the same counters (each one its own row, without a lock between the processes) and the
+:class:`MetricsExporter` of the main process sees the totals of all workers.
+
+The processes increment the counters via :func:`increment`, which does nothing, if the counters are not activated
+(see :func:`activate`) by the exporter or by the :class:`pyvcsshark.progress.ProgressReporter`. The operations of the
+mongodb are counted by a command listener of pymongo (see :class:`MongoCommandCounter`).
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import timeit
+
+from pymongo import monitoring
+
+logger = logging.getLogger("main")
+
+COMMITS_PARSED = 'commits_parsed'
+COMMITS_STORED = 'commits_stored'
+HUNK_CONTENT_SIZE = 'hunk_content_size'
+
+# Commands of the mongodb, which are counted separately. All other commands are counted as other.
+MONGO_COMMANDS = ('insert', 'update', 'delete', 'find', 'getMore', 'findAndModify', 'aggregate', 'count', 'other')
+
+COUNTERS = (COMMITS_PARSED, COMMITS_STORED, HUNK_CONTENT_SIZE, 'mongo_failed') + \
+    tuple('mongo.%s.count' % command for command in MONGO_COMMANDS) + \
+    tuple('mongo.%s.seconds' % command for command in MONGO_COMMANDS)
+
+# Counters of the run (None, if they are not activated)
+_counters = None
+
+
+class SharedCounters(object):
+    """ Named counters in shared memory, which are incremented by all processes of a run. Every process adds to its
+    own row of the counters, which it claims with its first increment, so that the processes never wait for each
+    other. Only the threads of a process share a lock. The value of a counter is the sum of all rows. The processes,
+    which start after all other rows are claimed, share the last row and its lock. The object must be created before
+    the processes are forked.
+
+    :param names: names of the counters
+    :param rows: number of rows
+    """
+
+    def __init__(self, names=COUNTERS, rows=256):
+        self.index = {name: i for i, name in enumerate(names)}
+        self.width = len(names)
+        self.rows = max(rows, 1)
+        self.values = multiprocessing.RawArray('d', self.rows * self.width)
+        self.claimed_rows = multiprocessing.Value('i', 0)
+        self.shared_row_lock = multiprocessing.Lock()
+        # Process id, offset of the row and lock of the row of the current process
+        self.row = (None, None, None)
+
+    def claim_row(self):
+        """ Claims the row of the current process (once per process) and returns it """
+        pid = os.getpid()
+        with self.claimed_rows.get_lock():
+            if self.row[0] != pid:
+                row = self.claimed_rows.value
+                if row < self.rows - 1:
+                    self.claimed_rows.value = row + 1
+                    self.row = (pid, row * self.width, threading.Lock())
+                else:
+                    self.row = (pid, (self.rows - 1) * self.width, self.shared_row_lock)
+            return self.row
+
+    def add(self, name, value=1):
+        """ Adds the value to the counter
+
+        :param name: name of the counter
+        :param value: value, which is added
+        """
+        pid, offset, lock = self.row
+        if pid != os.getpid():
+            pid, offset, lock = self.claim_row()
+        with lock:
+            self.values[offset + self.index[name]] += value
+
+    def get(self, name):
+        i = self.index[name]
+        return sum(self.values[i::self.width])
+
+    def snapshot(self):
+        """ Returns a dictionary with the values of all counters """
+        values = self.values[:]
+        return {name: sum(values[i::self.width]) for name, i in self.index.items()}
+
+
+def activate(counters=None):
+    """ Activates the counters of the run, if they are not activated yet, and returns them. Must be called before the
+    workers are forked.
+
+    :param counters: object of class :class:`SharedCounters`, which is activated (a new one is created, if it is None)
+    """
+    global _counters
+    if _counters is None:
+        _counters = counters if counters is not None else SharedCounters()
+    return _counters
+
+
+def deactivate():
+    """ Deactivates the counters of the run, afterwards the increments are not counted anymore """
+    global _counters
+    _counters = None
+
+
+def increment(name, value=1):
+    """ Adds the value to the counter of the run (if the counters are activated)
+
+    :param name: name of the counter
+    :param value: value, which is added
+    """
+    counters = _counters
+    if counters is not None:
+        counters.add(name, value)
+
+
+class MongoCommandCounter(monitoring.CommandListener):
+    """ Command listener of pymongo, which counts the commands of every client and their durations in the counters of
+    the run (if they are activated)
+    """
+
+    def started(self, event):
+        return
+
+    def succeeded(self, event):
+        self.count(event)
+
+    def failed(self, event):
+        increment('mongo_failed')
+        self.count(event)
+
+    @staticmethod
+    def count(event):
+        counters = _counters
+        if counters is None:
+            return
+        command = event.command_name if event.command_name in MONGO_COMMANDS else 'other'
+        counters.add('mongo.%s.count' % command)
+        counters.add('mongo.%s.seconds' % command, event.duration_micros / 1000000.0)
+
+
+# The listener must be registered before the first client is created, which is why it is registered on import
+monitoring.register(MongoCommandCounter())
+
+
+def read_memory(pid):
+    """ Returns a dictionary with the resident set size (rss) and its peak (peak_rss) in bytes of the process from
+    /proc (empty, if it can not be read, e.g., the process ended or the system has no /proc)
+
+    :param pid: process id
+    """
+    memory = {}
+    try:
+        with open('/proc/%d/status' % pid, 'r') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    memory['rss'] = int(line.split()[1]) * 1024
+                elif line.startswith('VmHWM:'):
+                    memory['peak_rss'] = int(line.split()[1]) * 1024
+    except (IOError, ValueError):
+        return {}
+    return memory
+
+
+class MetricsExporter(threading.Thread):
+    """ Thread of the main process, which writes the metrics of the run every interval (and when it is stopped) into
+    a Prometheus textfile. The file is written to a temporary file first and then renamed, so that the collector
+    never reads a partly written file. The metrics are labeled with the project:
+
+    * **vcsshark_commits_parsed_total**, **vcsshark_commits_stored_total**: commits that were diffed and stored
+    * **vcsshark_commits_parsed_per_second**, **vcsshark_commits_stored_per_second**: rates since the last write
+    * **vcsshark_commits_total**: commits of the run (if known)
+    * **vcsshark_queue_depth**: commits waiting in the queue of a stage
+    * **vcsshark_hunk_content_size_total**: size of the parsed hunk contents in characters
+    * **vcsshark_mongo_operations_total**, **vcsshark_mongo_operation_seconds_total**: commands of the mongodb and \
+    their summed durations by command
+    * **vcsshark_mongo_failed_operations_total**: failed commands of the mongodb
+    * **vcsshark_worker_rss_bytes**: resident set size of the main process and every living worker
+
+    :param path: path of the textfile
+    :param worker_pool: object of class :class:`pyvcsshark.pipeline.WorkerPool`
+    :param project_name: name of the project
+    :param interval: seconds between two writes
+    """
+
+    def __init__(self, path, worker_pool, project_name, interval=15):
+        threading.Thread.__init__(self, name='MetricsExporter', daemon=True)
+        self.path = path
+        self.worker_pool = worker_pool
+        self.project_name = project_name
+        self.interval = interval
+        self.counters = SharedCounters()
+        self.number_of_commits = None
+        self.stopped = threading.Event()
+        self.last_values = self.counters.snapshot()
+        self.last_time = timeit.default_timer()
+
+    def start(self):
+        """ Activates the counters of the run (see :func:`activate`) and starts the thread. Must be called before the
+        workers are forked. """
+        self.counters = activate(self.counters)
+        self.last_values = self.counters.snapshot()
+        self.last_time = timeit.default_timer()
+        threading.Thread.start(self)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        """ Stops the thread, writes the final metrics and deactivates the counters """
+        self.stopped.set()
+        self.join()
+        self.write()
+        deactivate()
+
+    def write(self):
+        """ Writes the metrics into the textfile. Errors are only logged, as they must not stop the run. """
+        try:
+            temporary_path = '%s.%d.tmp' % (self.path, os.getpid())
+            with open(temporary_path, 'w') as f:
+                f.write('\n'.join(self.collect()) + '\n')
+            os.replace(temporary_path, self.path)
+        except (IOError, OSError) as e:
+            logger.warning("Could not write the metrics to %s: %s" % (self.path, e))
+
+    def collect(self):
+        """ Returns the lines of the textfile with the current metrics """
+        values = self.counters.snapshot()
+        now = timeit.default_timer()
+        elapsed = max(now - self.last_time, 1e-9)
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, metric_type))
+            for labels, value in samples:
+                labels = dict(labels, project=self.project_name)
+                label_text = ','.join('%s="%s"' % (key, str(labels[key]).replace('\\', '\\\\').replace('"', '\\"'))
+                                      for key in sorted(labels))
+                lines.append('%s{%s} %s' % (name, label_text, repr(float(value))))
+
+        for counter, description in ((COMMITS_PARSED, 'diffed'), (COMMITS_STORED, 'stored')):
+            metric('vcsshark_%s_total' % counter, 'counter', 'Commits that were %s' % description,
+                   [({}, values[counter])])
+            metric('vcsshark_%s_per_second' % counter, 'gauge', 'Commits that were %s per second since the last '
+                   'update' % description, [({}, (values[counter] - self.last_values[counter]) / elapsed)])
+        if self.number_of_commits is not None:
+            metric('vcsshark_commits_total', 'gauge', 'Commits of the run', [({}, self.number_of_commits)])
+
+        depths = []
+        for stage in ('diff', 'write'):
+            depth = self.worker_pool.queue_depth(stage)
+            if depth is not None:
+                depths.append(({'stage': stage}, depth))
+        metric('vcsshark_queue_depth', 'gauge', 'Commits waiting in the queue of the stage', depths)
+
+        metric('vcsshark_hunk_content_size_total', 'counter', 'Size of the parsed hunk contents in characters',
+               [({}, values[HUNK_CONTENT_SIZE])])
+        metric('vcsshark_mongo_operations_total', 'counter', 'Commands sent to the mongodb',
+               [({'command': command}, values['mongo.%s.count' % command]) for command in MONGO_COMMANDS])
+        metric('vcsshark_mongo_operation_seconds_total', 'counter', 'Summed durations of the commands sent to the '
+               'mongodb', [({'command': command}, values['mongo.%s.seconds' % command]) for command in MONGO_COMMANDS])
+        metric('vcsshark_mongo_failed_operations_total', 'counter', 'Failed commands of the mongodb',
+               [({}, values['mongo_failed'])])
+
+        memory = [({'stage': 'main', 'worker': 'MainProcess'}, read_memory(os.getpid()).get('rss'))]
+        for stage, process in self.worker_pool.living_workers():
+            memory.append(({'stage': stage, 'worker': process.name}, read_memory(process.pid).get('rss')))
+        metric('vcsshark_worker_rss_bytes', 'gauge', 'Resident set size of the process',
+               [(labels, rss) for labels, rss in memory if rss is not None])
+
+        self.last_values = values
+        self.last_time = now
+        return lines
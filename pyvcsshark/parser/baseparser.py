@@ -1,6 +1,7 @@
 import abc
 import os
 import pyvcsshark.utils
+from pyvcsshark.parser.models import BranchRegistry
 
 class BaseParser(metaclass=abc.ABCMeta):
     """
@@ -9,6 +10,21 @@ class BaseParser(metaclass=abc.ABCMeta):
     
     Based on pythons abc: :py:mod:`abc`
     
+    :property branch_registry: object of class :class:`pyvcsshark.parser.models.BranchRegistry`, which translates \
+    the branch ids of the parsed commits into branch names. A new parser has an empty registry of its own, which \
+    stays empty, if the parser does not provide branches.
+    :property excluded_commits: set of revision hashes of commits, which should not be parsed (e.g., because they \
+    were already stored by an interrupted run that is resumed). It must be set before :func:`initialize` is called.
+    :property worker_pool: object of class :class:`pyvcsshark.pipeline.WorkerPool`, via which the parser should \
+    start its worker processes. It is set by the application.
+    :property ordering_stage: object of class :class:`pyvcsshark.pipeline.OrderingStage` or None. If it is set by the \
+    application, the parser must dispatch the commits of its order via \
+    :func:`pyvcsshark.pipeline.OrderingStage.wait_for_dispatch` in :func:`parse`.
+    :property streaming_walk: if it is set by the application, :func:`initialize` is not called before :func:`parse`. \
+    The parser must walk the references in :func:`parse`, while its workers already parse the commits, add the commits \
+    without branches and tags and hand them afterwards to \
+    :func:`pyvcsshark.datastores.basestore.BaseStore.set_commit_references`.
+
     :param metaclass: name of the abstract metaclass
     
     .. NOTE:: If you want to use a logger for your implementation of a datastore you can write::
@@ -18,6 +34,13 @@ class BaseParser(metaclass=abc.ABCMeta):
         to get the logger.
 
     """
+    worker_pool = None
+    excluded_commits = frozenset()
+    ordering_stage = None
+    streaming_walk = False
+
+    def __init__(self):
+        self.branch_registry = BranchRegistry()
 
     @abc.abstractproperty
     def repository_type(self):
@@ -61,6 +84,23 @@ class BaseParser(metaclass=abc.ABCMeta):
         """Retrieves the project url from the repository. This need to be
         put here, as only the parser is specific to the repository type"""
 
+    def retry_commit(self, commit_hash):
+        """Parses the commit again in the calling process and adds it to the datastore. It is called by the
+        :class:`pyvcsshark.pipeline.Supervisor`, if the storage process, which stored the commit, died.
+
+        :param commit_hash: revision hash of the commit
+        """
+        raise NotImplementedError("%s can not retry commits" % self.__class__.__name__)
+
+    def get_topological_order(self):
+        """Returns the revision hashes of the commits, which are parsed, in topological order (parents before
+        children). It is called after :func:`initialize`."""
+        raise NotImplementedError("%s can not order the commits topologically" % self.__class__.__name__)
+
+    def get_number_of_commits(self):
+        """Returns the number of commits, which are parsed (None, if the parser does not know it)"""
+        return None
+
     @staticmethod
     def find_correct_parser(repository_path):
         """ Finds the correct parser by executing the parser.detect() method on
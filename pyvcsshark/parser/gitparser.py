@@ -4,11 +4,15 @@ import logging
 import re
 import uuid
 import multiprocessing
+import timeit
 
 import pygit2
 
+from pyvcsshark import metrics, slowcommits, timing
 from pyvcsshark.parser.baseparser import BaseParser
-from pyvcsshark.parser.models import BranchModel, PeopleModel, TagModel, FileModel, CommitModel, Hunk, BranchTipModel
+from pyvcsshark.pipeline import WorkerPool
+from pyvcsshark.parser.models import PeopleModel, TagModel, FileModel, CommitModel, Hunk, BranchTipModel, \
+    BranchRegistry
 
 
 class GitParser(BaseParser):
@@ -19,9 +23,11 @@ class GitParser(BaseParser):
     :func:`multiprocessing.cpu_count()`.
     :property repository: object of class :class:`pygit2.Repository`, which represents the repository
     :property commits_to_be_processed: dictionary that is set up the following way: \
-    commits_to_be_processed = {'<revisionHash>' : {'branches' : set(), 'tags' : []}}, where <revisionHash> must be\
+    commits_to_be_processed = {'<revisionHash>' : {'branches' : 0, 'tags' : []}}, where <revisionHash> must be\
     replaced with the actual hash. Therefore, this dictionary holds information about every revision and which branches\
-     this revision belongs to and which tags it has.
+     this revision belongs to (as bitmap of branch ids) and which tags it has.
+    :property branch_registry: object of class :class:`pyvcsshark.parser.models.BranchRegistry`, which assigns the\
+    ids to the branches
     :property logger: logger, which is acquired via logging.getLogger("parser")
     :property datastore: datastore, where the commits should be saved to
     :property commit_queue: object of class :class:`multiprocessing.JoinableQueue`, where commits are stored in that\
@@ -33,8 +39,10 @@ class GitParser(BaseParser):
     SIMILARITY_THRESHOLD = 50
 
     def __init__(self):
+        BaseParser.__init__(self)
         self.repository = None
         self.commits_to_be_processed = {}
+        self.branches = {}
         self.logger = logging.getLogger("parser")
         self.datastore = None
 
@@ -55,6 +63,28 @@ class GitParser(BaseParser):
 
         return url
 
+    def retry_commit(self, commit_hash):
+        """ Parses the commit again in the calling process and adds it to the datastore. It is used as retry handler
+        of the **write** stage (see :class:`pyvcsshark.pipeline.Supervisor`), as the datastore can not recreate a commit
+        that was lost together with its storage process.
+
+        The commit is handed to :func:`pyvcsshark.datastores.basestore.BaseStore.add_retried_commit`, which puts it
+        into the queue of the write stage before it returns. The retry gets a repository object of its own, as the
+        supervisor thread must not share the one of a streaming walk, which may still run.
+
+        :param commit_hash: revision hash of the commit
+        """
+        commit_information = {commit_hash: dict(self.commits_to_be_processed[commit_hash])}
+        repository = pygit2.Repository(self.repository.path)
+        commit_model = CommitParserProcess(None, commit_information, repository, self.datastore).create_commit_model(
+            repository[pygit2.Oid(hex=commit_hash)])
+        if commit_model is not None:
+            self.datastore.add_retried_commit(commit_model)
+
+    def get_number_of_commits(self):
+        """ Returns the number of commits, which are parsed (i.e., all commits found by :func:`initialize`) """
+        return len(self.commits_to_be_processed)
+
     def finalize(self):
         """Finalization process for parser"""
         return
@@ -73,24 +103,28 @@ class GitParser(BaseParser):
 
     def add_branch(self, commit_hash, branch):
         """ Does two things: First it adds the commitHash to the commitqueue, so that the parsing processes can process this commit. Second it
-        creates objects of type :class:`pyvcsshark.parser.models.BranchModel` and stores it in the dictionary.
+        sets the bit of the branch in the branch bitmap of the commit in the dictionary.
 
         :param commit_hash: revision hash of the commit to be processed
         :param branch: branch that should be added for the commit
         """
         string_commit_hash = str(commit_hash)
 
+        # Commits that were already stored by an interrupted run are not parsed again
+        if string_commit_hash in self.excluded_commits:
+            return
+
         if branch is None:
-            branch_model = None
+            branch_bit = 0
         else:
-            branch_model = BranchModel(branch)
+            branch_bit = self.branch_registry.get_bit(branch)
 
         # If the commit is already in the dict, we only need to append the branch (because then it was already parsed)
         if string_commit_hash in self.commits_to_be_processed:
-            self.commits_to_be_processed[string_commit_hash]['branches'].add(branch_model)
+            self.commits_to_be_processed[string_commit_hash]['branches'] |= branch_bit
         else:
             self.commit_queue.put(string_commit_hash)
-            self.commits_to_be_processed[string_commit_hash] = {'branches': {branch_model}, 'tags': []}
+            self.commits_to_be_processed[string_commit_hash] = {'branches': branch_bit, 'tags': []}
 
     def add_tag(self, tagged_commit, tag_name, tag_object):
         """
@@ -111,6 +145,9 @@ class GitParser(BaseParser):
         commit_id = str(tagged_commit.id)
         tag_name = tag_name.split("/")[-1]
 
+        if commit_id in self.excluded_commits:
+            return
+
         # If we have an annotated tag, get all the information we can out of it
         if isinstance(tag_object, pygit2.Tag):
 
@@ -136,7 +173,7 @@ class GitParser(BaseParser):
         if commit_id in self.commits_to_be_processed:
             self.commits_to_be_processed[commit_id]['tags'].append(tag_model)
         else:
-            self.commits_to_be_processed[commit_id] = {'branches': set([]), 'tags': [tag_model]}
+            self.commits_to_be_processed[commit_id] = {'branches': 0, 'tags': [tag_model]}
             self.commit_queue.put(commit_id)
 
     def _set_branch_tips(self, branches):
@@ -163,8 +200,10 @@ class GitParser(BaseParser):
         Initializes the parser. It gets all the branch and tag information and puts it into two different
         locations: First the commit id is put into the commitqueue for the processing with the parsing processes.
         Second a dictionary is created, which holds the information of which branches a commit is on and which tags it
-        has
+        has. Commits in excluded_commits are skipped.
         """
+        start_time = timeit.default_timer()
+
         # Get all references (branches, tags)
         references = set(self.repository.listall_references())
 
@@ -212,6 +251,75 @@ class GitParser(BaseParser):
                 if str(e) != 'ValueError: object is not a committish':  # we do not bail on this we just ignore tags to blobs
                     raise
 
+        timing.record('parser.walk', timeit.default_timer() - start_time)
+
+    def add_branch_tips(self, datastore):
+        """ Adds the tips of all branches found by :func:`initialize` to the datastore
+
+        :param datastore: Datastore used to save the data to
+        """
+        for name, val in self.branches.items():
+            datastore.add_branch(BranchTipModel(name, val['target'], val['is_origin_head']))
+
+    def split(self, number_of_shards):
+        """ Splits the commits found by :func:`initialize` into contiguous ranges of the walk order, which can be
+        parsed independently (see :mod:`pyvcsshark.sharding`). Afterwards, the parser can not parse the commits
+        itself anymore.
+
+        :param number_of_shards: number of shards (at most one shard per commit is created)
+        :return: list of dictionaries in the format of commits_to_be_processed
+        """
+        commits = list(self.commits_to_be_processed.items())
+        number_of_shards = max(min(number_of_shards, len(commits)), 1)
+        shards = []
+        for i in range(number_of_shards):
+            start = i * len(commits) // number_of_shards
+            end = (i + 1) * len(commits) // number_of_shards
+            shards.append(dict(commits[start:end]))
+
+        # The commits are parsed by the shard workers
+        self.drop_commit_queue()
+        self.commits_to_be_processed = {}
+        return shards
+
+    def drop_commit_queue(self):
+        """ Replaces the commit queue filled by :func:`initialize` with an empty one, without waiting for the feeder
+        thread of the old queue """
+        self.commit_queue.cancel_join_thread()
+        self.commit_queue.close()
+        self.commit_queue = multiprocessing.JoinableQueue()
+
+    def get_topological_order(self):
+        """ Returns the revision hashes of the commits found by :func:`initialize` in topological order (parents
+        before children). Commits, whose ancestors were excluded, are ordered as if their ancestors were there. Tagged
+        objects, which are not commits (e.g., blobs), are not part of the order.
+        """
+        walker = self.repository.walk(None, pygit2.GIT_SORT_TOPOLOGICAL | pygit2.GIT_SORT_REVERSE)
+        for commit_hash in self.commits_to_be_processed:
+            try:
+                walker.push(pygit2.Oid(hex=commit_hash))
+            except ValueError:
+                # object is not a committish
+                continue
+
+        return [str(commit.id) for commit in walker if str(commit.id) in self.commits_to_be_processed]
+
+    def load_shard(self, branch_names, commits):
+        """ Loads a shard created by :func:`split` instead of calling :func:`initialize`. Afterwards, :func:`parse`
+        parses only the commits of the shard.
+
+        :param branch_names: names of the branches in the order of their ids in the branch registry of the parser \
+        that created the shard
+        :param commits: dictionary in the format of commits_to_be_processed
+        """
+        self.branch_registry = BranchRegistry()
+        for branch_name in branch_names:
+            self.branch_registry.get_id(branch_name)
+
+        self.commits_to_be_processed = commits
+        for commit_hash in commits:
+            self.commit_queue.put(commit_hash)
+
     def parse(self, repository_path, datastore, cores_per_job):
         """ Parses the repository, which is located at the repository_path and save the parsed commits in the
         datastore, by calling the :func:`pyvcsshark.datastores.basestore.BaseStore.add_commit` method of the chosen
@@ -222,34 +330,66 @@ class GitParser(BaseParser):
             1. A list of all branches and tags are created
             2. All branches and tags are parsed. So we create dictionary of all commits with their corresponding tags\
             and branches and add all revision hashes to the commitqueue
-            3. Add the poison pills for terminating of the parsing process to the commit_queue
-            4. Create processes of class :class:`pyvcsshark.parser.gitparser.CommitParserProcess`, which parse all\
-            commits.
+            3. Create processes of class :class:`pyvcsshark.parser.gitparser.CommitParserProcess`, which parse all\
+            commits. They are started via the scalable stage **diff** of the worker pool.
+            4. After all commits were parsed, the poison pills for terminating of the parsing processes are put into\
+            the commit_queue
+
+        If the application set streaming_walk, the workers are started first and step 2 (:func:`initialize`) runs\
+        while they parse the commits. The branches and tags of the commits are handed to the datastore afterwards.
+
+        If the application set an ordering stage (see :class:`pyvcsshark.pipeline.OrderingStage`), the commit_queue\
+        filled by :func:`initialize` is replaced and the commits are put into it in the topological order of the\
+        stage, at most its window ahead of the commits it released.
 
         :param repository_path: Path to the repository
         :param datastore: Datastore used to save the data to
+        :param cores_per_job: number of parser processes (workers of the **diff** stage)
         """
         self.datastore = datastore
         self.logger.info("Starting parsing process...")
 
-        # first we want the branches queue filled
-        for name, val in self.branches.items():
-            self.datastore.add_branch(BranchTipModel(name, val['target'], val['is_origin_head']))
-
-        # Set up the poison pills
-        for i in range(cores_per_job):
-            self.commit_queue.put(None)
+        # first we want the branches queue filled (a streaming walk knows them only after the walk)
+        if not self.streaming_walk:
+            self.add_branch_tips(datastore)
 
         # Parsing all commits of the queue
         self.logger.info("Parsing commits...")
-        lock = multiprocessing.Lock()
+        if self.worker_pool is None:
+            self.worker_pool = WorkerPool()
+
+        if self.ordering_stage is not None:
+            self.drop_commit_queue()
+            # Commits outside of the order (e.g., tagged blobs) do not need to wait
+            for commit_hash in self.commits_to_be_processed:
+                if commit_hash not in self.ordering_stage.positions:
+                    self.commit_queue.put(commit_hash)
+
+        # During a streaming walk, the workers do not know the branches and tags of the commits yet
+        commit_information = {} if self.streaming_walk else self.commits_to_be_processed
+        self.worker_pool.register('diff', self.commit_queue,
+                                  lambda i: CommitParserProcess(self.commit_queue, commit_information,
+                                                                self.repository, self.datastore))
         for i in range(cores_per_job):
-            thread = CommitParserProcess(self.commit_queue, self.commits_to_be_processed, self.repository, self.datastore,
-                                         lock)
-            thread.daemon = True
-            thread.start()
+            self.worker_pool.scale_up('diff')
+
+        if self.streaming_walk:
+            self.logger.info("Walking the references while the commits are parsed...")
+            self.initialize()
+            self.add_branch_tips(datastore)
 
+        if self.ordering_stage is not None:
+            for position, commit_hash in enumerate(self.ordering_stage.revision_hashes):
+                self.ordering_stage.wait_for_dispatch(position)
+                self.commit_queue.put(commit_hash)
+
+        # The number of workers can change while parsing, therefore the poison pills are only put into the queue
+        # after all commits were parsed
         self.commit_queue.join()
+        self.worker_pool.stop('diff', self.commit_queue)
+
+        if self.streaming_walk:
+            datastore.set_commit_references(self.commits_to_be_processed)
         self.logger.info("Parsing complete...")
 
         return
@@ -262,23 +402,29 @@ class CommitParserProcess(multiprocessing.Process):
     the commits
 
     :property logger: logger acquired by calling logging.getLogger("parser")
+    :property stage_control: object of class :class:`pyvcsshark.pipeline.StageControl`, which is set by the worker\
+    pool, if the process can be asked to leave its stage
+    :property task_slot: object of class :class:`pyvcsshark.pipeline.TaskSlot`, which is set by the worker pool and\
+    holds the hash of the commit the process currently parses
 
     :param queue: queue, where the different commithashes are stored in
     :param commits_to_be_processed: dictionary, which contains information about the branches and tags of each commit
     :param repository: repository object of type :class:`pygit2.Repository`
     :param datastore: object, that is a subclass of :class:`pyvcsshark.datastores.basestore.BaseStore`
-    :param lock: lock that is used, so that only one process at a time is calling \
-    the :func:`pyvcsshark.datastores.basestore.BaseStore.addCommit` function
     """
 
-    def __init__(self, queue, commits_to_be_processed, repository, datastore, lock):
+    def __init__(self, queue, commits_to_be_processed, repository, datastore):
         multiprocessing.Process.__init__(self)
         self.queue = queue
         self.commits_to_be_processed = commits_to_be_processed
         self.datastore = datastore
         self.logger = logging.getLogger("parser")
         self.repository = repository
-        self.lock = lock
+        self.add_commit_time = 0
+        self.added_commits = 0
+
+    stage_control = None
+    task_slot = None
 
     def run(self):
         """
@@ -287,35 +433,68 @@ class CommitParserProcess(multiprocessing.Process):
         If a process encounters that None, he will stop and terminate.
         """
         while True:
-            next_task = self.queue.get()
+            # If the worker pool moves the process to another stage, it exits before it takes the next commit
+            if self.stage_control is not None and self.stage_control.leave():
+                break
+
+            with timing.timed('parser.queue_get'):
+                next_task = self.queue.get()
             # If process pulls the poisoned pill, he exits
             if next_task is None:
                 self.queue.task_done()
                 break
+            if self.task_slot is not None:
+                self.task_slot.set([next_task])
             commitHash = pygit2.Oid(hex=next_task)
             commit = self.repository[commitHash]
             self.parse_commit(commit)
+            metrics.increment(metrics.COMMITS_PARSED)
+            # The slot is cleared first, a worker that dies in between must not make the supervisor retry the commit
+            # and mark it as done a second time
+            if self.task_slot is not None:
+                self.task_slot.set([])
             self.queue.task_done()
+
+        self.logger.info("Process %s added %d commits to the datastore in %0.5f s" % (self.name, self.added_commits,
+                                                                                       self.add_commit_time))
         return
 
     def parse_commit(self, commit):
         """ Function for parsing a commit.
 
+        1. the commit model is created (see :func:`create_commit_model`)
+        2. :func:`pyvcsshark.datastores.basestore.BaseStore.addCommit` is called
+
+        :param commit: commit object of type :class:`pygit2.Commit`
+
+        .. NOTE:: The call to :func:`pyvcsshark.datastores.basestore.BaseStore.addCommit` is not synchronized, as\
+        datastores must allow concurrent calls from several processes
+        """
+        commit_model = self.create_commit_model(commit)
+        if commit_model is None:
+            return
+
+        start_time = timeit.default_timer()
+        self.datastore.add_commit(commit_model)
+        self.add_commit_time += timeit.default_timer() - start_time
+        self.added_commits += 1
+
+    def create_commit_model(self, commit):
+        """ Creates the model of a commit (None, if the object is a blob).
+
         1. changedFiles are created (type: list of :class:`pyvcsshark.parser.models.FileModel`)
         2. author and commiter are created (type: :class:`pyvcsshark.parser.models.PeopleModel`)
         3. parents are added (list of strings)
         4. commit model is created (type: :class:`pyvcsshark.parser.models.CommitModel`)
-        5. :func:`pyvcsshark.datastores.basestore.BaseStore.addCommit` is called
 
         :param commit: commit object of type :class:`pygit2.Commit`
-
-        .. NOTE:: The call to :func:`pyvcsshark.datastores.basestore.BaseStore.addCommit` is thread/process safe, as a\
-        lock is used to regulate the calls
         """
         # we do not want Blobs (for now)
         if commit.__class__.__name__ == 'Blob':
-            del self.commits_to_be_processed[str(commit.id)]
-            return
+            self.commits_to_be_processed.pop(str(commit.id), None)
+            return None
+
+        parse_start_time = timeit.default_timer()
 
         # If there are parents, we need to get the normal changed files, if not we need to get the files for initial
         # commit
@@ -332,17 +511,17 @@ class CommitParserProcess(multiprocessing.Process):
         author_model = PeopleModel(commit.author.name, commit.author.email)
         committer_model = PeopleModel(commit.committer.name, commit.committer.email)
         parent_ids = [str(parentId) for parentId in commit.parent_ids]
-        commit_model = CommitModel(string_commit_hash, self.commits_to_be_processed[string_commit_hash]['branches'],
-                                   self.commits_to_be_processed[string_commit_hash]['tags'], parent_ids,
+
+        # Commits, whose branches and tags are not known yet (streaming walk), get them attached by the datastore
+        commit_information = self.commits_to_be_processed.pop(string_commit_hash, None) or {'branches': 0, 'tags': []}
+        commit_model = CommitModel(string_commit_hash, commit_information['branches'],
+                                   commit_information['tags'], parent_ids,
                                    author_model, committer_model, commit.message, changed_files, commit.author.time,
                                    commit.author.offset, commit.committer.time, commit.committer.offset)
+        slowcommits.record('parse', string_commit_hash, timeit.default_timer() - parse_start_time,
+                           lambda: slowcommits.commit_features(commit_model))
 
-        # Make sure, that addCommit is only called by one process at a time
-        self.lock.acquire()
-        self.datastore.add_commit(commit_model)
-        self.lock.release()
-
-        del self.commits_to_be_processed[string_commit_hash]
+        return commit_model
 
     def create_hunks(self, hunks, initial_commit=False):
         """
@@ -354,7 +533,9 @@ class CommitParserProcess(multiprocessing.Process):
         :param initial_commit: indicates if we have an initial commit
         """
 
+        start_time = timeit.default_timer()
         list_of_hunks = []
+        content_size = 0
 
         for hunk in hunks:
             output = ""
@@ -367,6 +548,10 @@ class CommitParserProcess(multiprocessing.Process):
                     output += "%s%s" % (line.origin, line.content)
                 gen_hunk = Hunk(hunk.new_start, hunk.new_lines, hunk.old_start, hunk.old_lines, output)
             list_of_hunks.append(gen_hunk)
+            content_size += len(output)
+        timing.record('parser.create_hunks', timeit.default_timer() - start_time)
+        if content_size:
+            metrics.increment(metrics.HUNK_CONTENT_SIZE, content_size)
         return list_of_hunks
 
     def get_changed_files_for_initial_commit(self, commit):
@@ -378,7 +563,8 @@ class CommitParserProcess(multiprocessing.Process):
         :param commit: commit of type :class:`pygit2.Commit`
         """
         changed_files = []
-        diff = commit.tree.diff_to_tree(context_lines=0, interhunk_lines=1)
+        with timing.timed('parser.diff'):
+            diff = commit.tree.diff_to_tree(context_lines=0, interhunk_lines=1)
 
         for patch in diff:
             changed_file = FileModel(patch.delta.old_file.path, patch.delta.old_file.size,
@@ -398,10 +584,12 @@ class CommitParserProcess(multiprocessing.Process):
         """
 
         changed_files = []
-        diff = self.repository.diff(parent, commit, context_lines=0, interhunk_lines=1)
+        with timing.timed('parser.diff'):
+            diff = self.repository.diff(parent, commit, context_lines=0, interhunk_lines=1)
 
         opts = pygit2.GIT_DIFF_FIND_RENAMES | pygit2.GIT_DIFF_FIND_COPIES
-        diff.find_similar(opts, GitParser.SIMILARITY_THRESHOLD, GitParser.SIMILARITY_THRESHOLD)
+        with timing.timed('parser.find_similar'):
+            diff.find_similar(opts, GitParser.SIMILARITY_THRESHOLD, GitParser.SIMILARITY_THRESHOLD)
 
         already_checked_file_paths = set()
         for patch in diff:
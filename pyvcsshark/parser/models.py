@@ -1,10 +1,36 @@
 import datetime
 
+#: If set to False, the setters of the models do not check the values they get anymore. The checks walk through
+#: every changed file, tag and branch of a commit on each assignment, which is noticeable for large commits.
+#: Therefore, the application only enables them in debug mode (see :func:`set_validation`).
+VALIDATE = True
+
+
+def to_datetime(timestamp):
+    """ Converts a UNIX timestamp into an object of class :class:`datetime.datetime` (UTC)
+
+    :param timestamp: UNIX timestamp or None
+    """
+    if timestamp is None:
+        return None
+    return datetime.datetime.utcfromtimestamp(timestamp)
+
+
+def set_validation(enabled):
+    """ Enables or disables the validation of the values that are assigned to the models.
+
+    :param enabled: boolean, which is true if the values should be validated
+    """
+    global VALIDATE
+    VALIDATE = enabled
+
+
 class CommitModel(object):
     """Model that represents a commit to a repository
     
     :param id: id of the ocmmit (e.g. a revision hash)
-    :param branches: set of branches to which the commit belongs to
+    :param branches: bitmap (int) of the branches to which the commit belongs to. Bit i is set, if the commit belongs \
+    to the branch with the id i in the :class:`pyvcsshark.parser.models.BranchRegistry` of the parser
     :param tags: list of tags of type :class:`pyvcsshark.dbmodels.models.TagModel`
     :param parents: list of strings, which contains the parent ids of the commit
     :param author: author of the commit. Must be of type :class:`pyvcsshark.dbmodels.models.PeopleModel`
@@ -15,11 +41,18 @@ class CommitModel(object):
     :param authorOffset: offset for the authordate (timezone)
     :param committerDate: date of the commit (must be a UNIX timestamp)
     :param committerOffset: offset for the committerdate (timezone)
+
+    :property authorTimestamp: author date as UNIX timestamp. The property authorDate converts it into a \
+    :class:`datetime.datetime` on every access (it is not cached), so that datastores, which can work with the \
+    timestamps, do not need to create datetime objects at all. Datastores, which need the datetime, should convert \
+    the timestamp once with :func:`to_datetime`. The same holds for committerTimestamp.
     
     .. NOTE:: If your parser do not provide all information, then just use the default ones
     """
-    
-    def __init__(self, id, branches=[], tags=[], parents=[], 
+    __slots__ = ('id', '_branches', '_tags', 'parents', '_author', '_committer', 'message', '_changedFiles',
+                 'authorTimestamp', 'authorOffset', 'committerTimestamp', 'committerOffset')
+
+    def __init__(self, id, branches=0, tags=[], parents=[], 
                  author=None, committer=None, message=None, changedFiles=[], authorDate=None,
                  authorOffset=None, committerDate=None, committerOffset=None):
         self.id = id
@@ -37,23 +70,23 @@ class CommitModel(object):
         
     @property
     def authorDate(self):
-        return self._authorDate
+        return to_datetime(self.authorTimestamp)
     
     @authorDate.setter
     def authorDate(self, value):
-        if(value is not None and not isinstance(value, int)):
+        if(VALIDATE and value is not None and not isinstance(value, int)):
             raise Exception("Date must be a UNIX timestamp!")
-        self._authorDate = datetime.datetime.utcfromtimestamp(value)
+        self.authorTimestamp = value
         
     @property
     def committerDate(self):
-        return self._committerDate
+        return to_datetime(self.committerTimestamp)
     
     @committerDate.setter
     def committerDate(self, value):
-        if(value is not None and not isinstance(value, int)):
+        if(VALIDATE and value is not None and not isinstance(value, int)):
             raise Exception("Date must be a UNIX timestamp!")
-        self._committerDate = datetime.datetime.utcfromtimestamp(value)
+        self.committerTimestamp = value
         
     @property
     def branches(self):
@@ -61,14 +94,9 @@ class CommitModel(object):
         
     @branches.setter
     def branches(self, value):
-        if(value is not None and type(value) is not set):
-            raise Exception("Branches must be a set!")
-        
-        if(value is not None):
-            for branch in value:
-                if(not isinstance(branch, BranchModel) and branch is not None):
-                    raise Exception("Branch is not a Branch model or None!")
-        
+        if(VALIDATE and (type(value) is not int or value < 0)):
+            raise Exception("Branches must be a bitmap of branch ids!")
+
         self._branches = value
     
     @property
@@ -77,10 +105,10 @@ class CommitModel(object):
     
     @tags.setter
     def tags(self, value):
-        if(value is not None and type(value) is not list):
+        if(VALIDATE and value is not None and type(value) is not list):
             raise Exception("Tags must be a list!")
         
-        if(value is not None):
+        if(VALIDATE and value is not None):
             for tag in value:
                 if(not isinstance(tag, TagModel)):
                     raise Exception("Tag is not a Tag model!")
@@ -93,7 +121,7 @@ class CommitModel(object):
     
     @author.setter
     def author(self, value):
-        if(value is not None and not isinstance(value, PeopleModel)):
+        if(VALIDATE and value is not None and not isinstance(value, PeopleModel)):
             raise Exception("Author must be of type PeopleModel!")
         
         self._author = value
@@ -104,7 +132,7 @@ class CommitModel(object):
     
     @committer.setter
     def committer(self, value):
-        if(value is not None and not isinstance(value, PeopleModel)):
+        if(VALIDATE and value is not None and not isinstance(value, PeopleModel)):
             raise Exception("Committer must be of type PeopleModel!")
         
         self._committer = value
@@ -115,10 +143,10 @@ class CommitModel(object):
     
     @changedFiles.setter
     def changedFiles(self, value):
-        if(value is not None and type(value) is not list):
+        if(VALIDATE and value is not None and type(value) is not list):
             raise Exception("ChangedFiles must be a list!")
         
-        if(value is not None):
+        if(VALIDATE and value is not None):
             for file in value:
                 if(not isinstance(file, FileModel)):
                     raise Exception("File must be of type FileModel!")
@@ -132,10 +160,8 @@ class CommitModel(object):
         for file in self.changedFiles:
             files += file.path
             
-        branches = ""
-        for branch in self.branches:
-            branches+=branch.name
-            
+        branches = ",".join([str(branch_id) for branch_id in BranchRegistry.ids(self.branches)])
+
         tags = ""
         for tag in self.tags:
             tags+=tag.name
@@ -164,6 +190,9 @@ class FileModel(object):
     :param oldPath: old path to the file, which only exist if a file was copied or moved
     :param parent_revision_hash: hash of the parent commit
     """
+    __slots__ = ('path', 'size', 'linesAdded', 'linesDeleted', 'isBinary', 'mode', '_hunks', 'oldPath',
+                 'parent_revision_hash')
+
     def __init__(self, path, size=None, linesAdded=None, linesDeleted=None,
                  isBinary= None, mode=None, hunks=[], oldPath=None, parent_revision_hash=None):
         self.path = path
@@ -183,13 +212,23 @@ class FileModel(object):
     @hunks.setter
     def hunks(self, value):
         # Check hunks
-        if(value is not None and type(value) is not list):
+        if(VALIDATE and value is not None and type(value) is not list):
             raise Exception("Hunks must be a list!")
         
         self._hunks = value
 
 
 class Hunk(object):
+    """ Model that holds a hunk of a changed file in the unified diff format.
+
+    :param new_start: start line in the new file
+    :param new_lines: number of lines in the new file
+    :param old_start: start line in the old file
+    :param old_lines: number of lines in the old file
+    :param content: textual change
+    """
+    __slots__ = ('new_start', 'new_lines', 'old_start', 'old_lines', 'content')
+
     def __init__(self, new_start, new_lines, old_start, old_lines, content):
         self.new_start = new_start
         self.new_lines = new_lines
@@ -209,7 +248,12 @@ class TagModel(object):
     :param tagger: creator of the tag. Must be of type :class:`pyvcsshark.dbmodels.models.PeopleModel`.
     :param taggerDate: date of the creation of the tag. Must be a UNIX timestamp.
     :param taggerOffset: offset for taggerdate (timezone)
+
+    :property taggerTimestamp: tagger date as UNIX timestamp, which is converted by the property taggerDate on every \
+    access (it is not cached)
     """
+    __slots__ = ('name', 'message', '_tagger', 'taggerTimestamp', 'taggerOffset')
+
     def __init__(self, name, message=None, tagger=None, taggerDate=None, taggerOffset=None):
         self.name = name
         self.message = message
@@ -219,17 +263,13 @@ class TagModel(object):
 
     @property
     def taggerDate(self):
-        return self._taggerDate
+        return to_datetime(self.taggerTimestamp)
     
     @taggerDate.setter
     def taggerDate(self, value):
-        if(value is not None and not isinstance(value, int)):
+        if(VALIDATE and value is not None and not isinstance(value, int)):
             raise Exception("Date must be a UNIX timestamp!")
-        
-        if(value is not None):
-            self._taggerDate = datetime.datetime.utcfromtimestamp(value)
-        else:
-            self._taggerDate = None
+        self.taggerTimestamp = value
             
     @property
     def tagger(self):
@@ -237,23 +277,30 @@ class TagModel(object):
     
     @tagger.setter
     def tagger(self, value):
-        if(value is not None and not isinstance(value, PeopleModel)):
+        if(VALIDATE and value is not None and not isinstance(value, PeopleModel)):
             raise Exception("Tagger is not a People model!")
         self._tagger = value
 
 
 class BranchTipModel(object):
+    """ Model which holds the tip (last commit) of a branch.
+
+    :param name: name of the branch
+    :param target_revision_hash: revision hash of the last commit on the branch
+    :param is_origin_head: boolean, which is true if the branch is the default branch of the origin
+    """
+    __slots__ = ('name', 'target', 'is_origin_head')
 
     def __init__(self, name, target_revision_hash, is_origin_head):
         self.name = name
         self.target = target_revision_hash
         self.is_origin_head = is_origin_head
 
-        def __repr__(self):
-            return '{} -> {} is_origin_head: {}'.format(self.name, self.target, self.is_origin_head)
+    def __repr__(self):
+        return '{} -> {} is_origin_head: {}'.format(self.name, self.target, self.is_origin_head)
 
-        def __str__(self):
-            return self.name
+    def __str__(self):
+        return self.name
 
 
 class BranchModel(object):
@@ -261,6 +308,8 @@ class BranchModel(object):
 
     :param name: name of the branch
     """
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
 
@@ -274,7 +323,70 @@ class BranchModel(object):
         return not self.__eq__(other)
 
     def __hash__(self):
-        return hash(repr(self))
+        return hash(self.name)
+
+
+class BranchRegistry(object):
+    """ Registry, which assigns every branch a small integer id once. Commits only carry a bitmap of the ids of the
+    branches they belong to (see :class:`pyvcsshark.parser.models.CommitModel`). The ids are translated back to names
+    in the datastore via :func:`pyvcsshark.parser.models.BranchRegistry.names`.
+    """
+    __slots__ = ('_ids', '_names', '_bits')
+
+    def __init__(self):
+        self._ids = {}
+        self._names = []
+        self._bits = []
+
+    def __len__(self):
+        return len(self._names)
+
+    def get_id(self, name):
+        """ Returns the id of the branch. If the branch is not registered yet, it gets the next free id.
+
+        :param name: name of the branch
+        """
+        branch_id = self._ids.get(name)
+        if branch_id is None:
+            branch_id = len(self._names)
+            self._ids[name] = branch_id
+            self._names.append(name)
+            self._bits.append(1 << branch_id)
+        return branch_id
+
+    def get_bit(self, name):
+        """ Returns the bit of the branch in the branch bitmap of a commit.
+
+        :param name: name of the branch
+        """
+        return self._bits[self.get_id(name)]
+
+    def get_name(self, branch_id):
+        """ Returns the name of the branch with the given id.
+
+        :param branch_id: id of the branch
+        """
+        return self._names[branch_id]
+
+    def names(self, bitmap):
+        """ Returns the list of branch names, whose bits are set in the bitmap.
+
+        :param bitmap: bitmap of branch ids (int)
+        """
+        return [self._names[branch_id] for branch_id in BranchRegistry.ids(bitmap)]
+
+    @staticmethod
+    def ids(bitmap):
+        """ Returns the list of branch ids, whose bits are set in the bitmap.
+
+        :param bitmap: bitmap of branch ids (int)
+        """
+        branch_ids = []
+        while bitmap:
+            lowest_bit = bitmap & -bitmap
+            branch_ids.append(lowest_bit.bit_length() - 1)
+            bitmap ^= lowest_bit
+        return branch_ids
 
 
 class PeopleModel(object):
@@ -283,6 +395,8 @@ class PeopleModel(object):
     :param name: name of the person
     :param email: email of the person
     """
+    __slots__ = ('name', 'email')
+
     def __init__(self, name=None, email=None):
         self.name = name
         self.email = email
@@ -8,7 +8,7 @@ logger = logging.getLogger("parser")
 
 class SVNParser(BaseParser):
     def __init__(self):
-        pass
+        BaseParser.__init__(self)
         
     @property   
     def repository_type(self):
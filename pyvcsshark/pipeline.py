@@ -0,0 +1,666 @@
+import itertools
+import logging
+import multiprocessing
+import threading
+import timeit
+
+from pyvcsshark import timing
+from pyvcsshark.transport import BaseTransport
+
+logger = logging.getLogger("main")
+
+
+class WorkerPlan(object):
+    """ Distribution of the cores of a job over the stages of the pipeline:
+
+    1. **walk**: the ref walk of the parser (:func:`pyvcsshark.parser.baseparser.BaseParser.initialize`), which runs \
+    in the main process
+    2. **diff**: the parser processes (e.g. :class:`pyvcsshark.parser.gitparser.CommitParserProcess`), which create \
+    the diffs of the commits and **encode** them with the codec of the datastore when they add them
+    3. **write**: the storage processes of the datastore (e.g. \
+    :class:`pyvcsshark.datastores.mongostore.CommitStorageProcess`), which write the commits and afterwards the branches
+
+    The main process only waits while the diff and write workers are running. Therefore, the diff and write workers
+    share the cores of the job. If only one of them is configured, the other one gets the remaining cores. If none is
+    configured, the cores are split evenly (the diff stage gets the odd core). With the :class:`Autoscaler`, the plan
+    is only the initial split.
+
+    :param cores_per_job: number of cores of the job
+    :param diff_workers: number of diff workers (None for automatic balancing)
+    :param write_workers: number of write workers (None for automatic balancing)
+    """
+
+    def __init__(self, cores_per_job, diff_workers=None, write_workers=None):
+        if cores_per_job < 1:
+            raise Exception("The number of cores per job must be at least 1!")
+
+        # Both stages need at least one worker
+        budget = max(cores_per_job, 2)
+
+        if diff_workers is None and write_workers is None:
+            diff_workers = budget - budget // 2
+            write_workers = budget // 2
+        elif diff_workers is None:
+            diff_workers = max(budget - write_workers, 1)
+        elif write_workers is None:
+            write_workers = max(budget - diff_workers, 1)
+
+        if diff_workers < 1 or write_workers < 1:
+            raise Exception("Every stage needs at least one worker!")
+        if diff_workers + write_workers > budget:
+            raise Exception("%d diff workers and %d write workers exceed the budget of %d cores!" %
+                            (diff_workers, write_workers, cores_per_job))
+
+        self.cores_per_job = cores_per_job
+        self.diff_workers = diff_workers
+        self.write_workers = write_workers
+
+    def __str__(self):
+        return "walk: 1 (main process), diff: %d, write: %d (cores per job: %d)" % (
+            self.diff_workers, self.write_workers, self.cores_per_job)
+
+
+class StageControl(object):
+    """ Shared state of a scalable stage, via which the :class:`WorkerPool` asks workers to leave the stage. The workers
+    of a scalable stage get it as attribute stage_control and must call :func:`leave` before they take the next task
+    from their queue.
+    """
+
+    def __init__(self):
+        self.surplus = multiprocessing.Value('i', 0)
+
+    def leave(self):
+        """ Returns True, if the calling worker should leave the stage (then it must exit without taking a task) """
+        with self.surplus.get_lock():
+            if self.surplus.value > 0:
+                self.surplus.value -= 1
+                return True
+        return False
+
+
+class TaskSlot(object):
+    """ Shared slot, in which a worker of a scalable stage publishes the keys of the tasks it currently processes (e.g.,
+    revision hashes), so that the :class:`Supervisor` can retry them, if the worker dies. Workers set the slot after
+    they took a task from their queue and clear it before they call task_done, so that the supervisor never marks a
+    task as done, which the worker already marked. A task, which was taken but whose key
+    is not known yet (e.g., because the data is not decoded yet), is published as UNKNOWN_TASK.
+
+    :param size: size of the slot in bytes (a revision hash needs 41 bytes)
+    """
+    UNKNOWN_TASK = '?'
+
+    def __init__(self, size=4096):
+        self.array = multiprocessing.Array('c', size)
+
+    def set(self, tasks):
+        """ Publishes the keys of the tasks
+
+        :param tasks: iterable of strings without whitespace
+        """
+        self.array.value = ' '.join(tasks).encode('utf-8')
+
+    def get(self):
+        """ Returns the list of the published keys """
+        return self.array.value.decode('utf-8').split()
+
+
+class WorkerPool(object):
+    """ Pool, which holds the worker processes of all stages of the pipeline. The parser and the datastore start their
+    workers via the pool, so that the application has one place to see and stop all processes of a run.
+
+    Stages, which are registered via :func:`register`, are scalable: their workers are created by a factory and can be
+    added or removed while the stage runs (see :class:`Autoscaler`).
+
+    :property wrappers: list of functions, which get the run function, stage and name of a worker and return a \
+    wrapped run function (e.g., :func:`pyvcsshark.profiling.WorkerProfiler.wrap`). They are applied to the workers \
+    that are started afterwards.
+    """
+
+    def __init__(self):
+        self.wrappers = []
+        self.stages = {}
+        self.scalable_stages = {}
+        self.lock = threading.RLock()
+
+    def start(self, stage, process):
+        """ Starts the process as daemon and registers it as worker of the stage. The process reports its timers
+        (see :mod:`pyvcsshark.timing`), when it ends.
+
+        :param stage: name of the stage (e.g. **diff**)
+        :param process: object of class :class:`multiprocessing.Process`, which is not started yet
+        """
+        process.daemon = True
+        for wrapper in self.wrappers:
+            process.run = wrapper(process.run, stage, process.name)
+        process.run = timing.reporting(process.run)
+        with self.lock:
+            process.start()
+            self.stages.setdefault(stage, []).append(process)
+        return process
+
+    def register(self, stage, queue, factory):
+        """ Registers a scalable stage. Afterwards, its workers are started via :func:`scale_up`.
+
+        :param stage: name of the stage
+        :param queue: queue (or transport) from which the workers of the stage read
+        :param factory: function, which gets a consecutive number and returns a new worker process (not started), \
+        whose loop calls stage_control.leave() before it takes the next task and publishes its tasks in task_slot
+        """
+        with self.lock:
+            self.scalable_stages[stage] = (queue, factory, StageControl(), itertools.count())
+
+    def scale_up(self, stage):
+        """ Adds a worker to the scalable stage. Returns False, if the stage is not (or not anymore) registered.
+
+        :param stage: name of the stage
+        """
+        with self.lock:
+            if stage not in self.scalable_stages:
+                return False
+            queue, factory, control, counter = self.scalable_stages[stage]
+
+            # A worker that was asked to leave, but did not leave yet, can simply stay
+            with control.surplus.get_lock():
+                if control.surplus.value > 0:
+                    control.surplus.value -= 1
+                    return True
+
+            process = factory(next(counter))
+            process.stage_control = control
+            process.task_slot = TaskSlot()
+            self.start(stage, process)
+            return True
+
+    def scale_down(self, stage):
+        """ Asks one worker of the scalable stage to leave it after its current task. Returns False, if the stage is
+        not registered or has only one worker left.
+
+        :param stage: name of the stage
+        """
+        with self.lock:
+            if stage not in self.scalable_stages or self.size(stage) <= 1:
+                return False
+            control = self.scalable_stages[stage][2]
+            with control.surplus.get_lock():
+                control.surplus.value += 1
+            return True
+
+    def move(self, from_stage, to_stage):
+        """ Moves one worker from one scalable stage to another. Returns False, if this is not possible.
+
+        :param from_stage: name of the stage, which loses a worker
+        :param to_stage: name of the stage, which gets a worker
+        """
+        with self.lock:
+            if to_stage not in self.scalable_stages or not self.scale_down(from_stage):
+                return False
+            return self.scale_up(to_stage)
+
+    def size(self, stage):
+        """ Returns the number of workers of the stage, which are running and not asked to leave it
+
+        :param stage: name of the stage
+        """
+        with self.lock:
+            size = len(self.workers(stage))
+            if stage in self.scalable_stages:
+                size -= self.scalable_stages[stage][2].surplus.value
+            return size
+
+    def scalable_workers(self, stage):
+        """ Returns the queue of the scalable stage and all of its worker processes, including the dead ones (None, [] \
+        if the stage is not registered)
+
+        :param stage: name of the stage
+        """
+        with self.lock:
+            if stage not in self.scalable_stages:
+                return None, []
+            return self.scalable_stages[stage][0], list(self.stages.get(stage, []))
+
+    def status(self):
+        """ Returns a dictionary with the number of living workers per stage """
+        with self.lock:
+            return {stage: len(self.workers(stage)) for stage in self.stages}
+
+    def living_workers(self):
+        """ Returns a list of (stage, process) tuples with the living workers of all stages """
+        with self.lock:
+            return [(stage, process) for stage in self.stages for process in self.workers(stage)]
+
+    def queue_depth(self, stage):
+        """ Returns the number of tasks waiting in the queue of the scalable stage (None, if it is not registered)
+
+        :param stage: name of the stage
+        """
+        with self.lock:
+            if stage not in self.scalable_stages:
+                return None
+            queue = self.scalable_stages[stage][0]
+        return queue.qsize()
+
+    def workers(self, stage):
+        """ Returns the living worker processes of the stage
+
+        :param stage: name of the stage
+        """
+        return [process for process in self.stages.get(stage, []) if process.is_alive()]
+
+    def stop(self, stage, queue):
+        """ Stops all workers of the stage by putting one poison pill (None) per worker into the queue they read from
+        and waits for them to terminate.
+
+        :param stage: name of the stage
+        :param queue: queue (or transport) from which the workers of the stage read
+        """
+        with self.lock:
+            self.scalable_stages.pop(stage, None)
+            processes = self.stages.pop(stage, [])
+
+        # Workers that leave the stage on their own do not take a pill, the remaining pills are never read. The living
+        # workers are counted before the first pill is put, as a worker may take any pill and exit right away.
+        living = [process for process in processes if process.is_alive()]
+        for process in living:
+            queue.put(None)
+        for process in processes:
+            process.join()
+
+    def join(self, stage):
+        """ Waits for all workers of the stage to terminate and removes them from the pool
+
+        :param stage: name of the stage
+        """
+        with self.lock:
+            processes = self.stages.pop(stage, [])
+        for process in processes:
+            process.join()
+
+    def terminate(self):
+        """ Terminates all workers that are still running """
+        with self.lock:
+            for stage, processes in self.stages.items():
+                for process in processes:
+                    if process.is_alive():
+                        logger.debug("Terminating worker %s of stage %s" % (process.name, stage))
+                        process.terminate()
+            self.stages = {}
+            self.scalable_stages = {}
+
+
+class Autoscaler(threading.Thread):
+    """ Controller, which runs in the main process and moves workers between the **diff** and **write** stage, while
+    both are running. The total number of workers stays the same. Every interval it samples the depth of the queues
+    of both stages:
+
+    * If more than HIGH_WATERMARK commits per write worker wait in the queue of the write stage, the diff workers
+      produce faster than the write workers store (e.g., for repositories with many large files). A worker is moved
+      from the diff to the write stage.
+    * If at most one commit per write worker waits to be stored, while more commits than diff workers wait to be
+      diffed, the diff stage is the bottleneck (e.g., for large source trees). A worker is moved from the write to the
+      diff stage.
+
+    After a move, the controller waits COOLDOWN intervals, before it decides again. Every stage keeps at least one
+    worker. All decisions are logged.
+
+    :param worker_pool: object of class :class:`WorkerPool`
+    :param interval: seconds between two samples
+    """
+    HIGH_WATERMARK = 8
+    COOLDOWN = 2
+
+    def __init__(self, worker_pool, interval=2):
+        threading.Thread.__init__(self, name='Autoscaler', daemon=True)
+        self.worker_pool = worker_pool
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.cooldown = 0
+        self.moves = 0
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.balance()
+
+    def balance(self):
+        """ Samples the queues and moves a worker, if one stage is the bottleneck """
+        if self.cooldown > 0:
+            self.cooldown -= 1
+            return
+
+        diff_depth = self.worker_pool.queue_depth('diff')
+        write_depth = self.worker_pool.queue_depth('write')
+        if diff_depth is None or write_depth is None:
+            return
+
+        diff_workers = self.worker_pool.size('diff')
+        write_workers = self.worker_pool.size('write')
+        if write_depth > self.HIGH_WATERMARK * write_workers:
+            self.move('diff', 'write', diff_depth, write_depth, diff_workers, write_workers)
+        elif write_depth <= write_workers and diff_depth > diff_workers:
+            self.move('write', 'diff', diff_depth, write_depth, diff_workers, write_workers)
+
+    def move(self, from_stage, to_stage, diff_depth, write_depth, diff_workers, write_workers):
+        if not self.worker_pool.move(from_stage, to_stage):
+            return
+
+        self.moves += 1
+        self.cooldown = self.COOLDOWN
+        logger.info("Autoscaler: moved a worker from stage %s to stage %s (queue depth diff: %d, write: %d; "
+                    "workers before diff: %d, write: %d)" % (from_stage, to_stage, diff_depth, write_depth,
+                                                             diff_workers, write_workers))
+
+    def stop(self):
+        """ Stops the controller and waits for it """
+        self.stopped.set()
+        self.join()
+        logger.info("Autoscaler: moved %d workers" % self.moves)
+
+
+class Supervisor(threading.Thread):
+    """ Thread in the main process, which watches the workers of the scalable stages of a :class:`WorkerPool`. If a
+    worker dies (i.e., it exits with an exit code other than 0, e.g., after a segmentation fault or the OOM killer),
+    the supervisor
+
+    1. releases the buffers of the transport of the stage, which the dead worker still held (see
+       :func:`pyvcsshark.transport.BaseTransport.reclaim`), and starts a replacement worker,
+    2. hands the tasks, which the dead worker published in its :class:`TaskSlot`, to the retry handler of the stage
+       (by default, they are put into the queue of the stage again) and
+    3. marks them as done in the queue of the stage, so that waiting for the queue does not hang.
+
+    A task, which killed max_retries workers, is not retried anymore, but quarantined, reported and handed to the
+    quarantine handler of the stage (if any). The supervisor logs
+    every failure and, every STATUS_INTERVAL seconds, the number of living workers per stage.
+
+    :param worker_pool: object of class :class:`WorkerPool`
+    :param max_retries: number of retries per task
+    :param interval: seconds between two checks
+    """
+    STATUS_INTERVAL = 60
+
+    def __init__(self, worker_pool, max_retries=2, interval=1):
+        threading.Thread.__init__(self, name='Supervisor', daemon=True)
+        self.worker_pool = worker_pool
+        self.max_retries = max_retries
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.retry_handlers = {}
+        self.quarantine_handlers = {}
+        self.retries = {}
+        self.handled_workers = set()
+        self.failures = 0
+        self.quarantined = []
+        self.last_status = timeit.default_timer()
+
+    def set_retry_handler(self, stage, handler):
+        """ Sets the function, which is called with the key of every task of the stage that is retried. It must add
+        the task to the queue of the stage again.
+
+        :param stage: name of the stage
+        :param handler: function, which gets the key of the task
+        """
+        self.retry_handlers[stage] = handler
+
+    def set_quarantine_handler(self, stage, handler):
+        """ Sets the function, which is called with the key of every task of the stage that is quarantined
+
+        :param stage: name of the stage
+        :param handler: function, which gets the key of the task
+        """
+        self.quarantine_handlers[stage] = handler
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """ Checks the workers of all scalable stages once """
+        for stage in list(self.worker_pool.scalable_stages):
+            queue, processes = self.worker_pool.scalable_workers(stage)
+            for process in processes:
+                if process.exitcode in (None, 0) or process in self.handled_workers:
+                    continue
+                self.handled_workers.add(process)
+                # An error while handling one worker must neither stop the supervisor nor the other workers
+                try:
+                    self.handle_failure(stage, queue, process)
+                except Exception:
+                    logger.exception("Supervisor: handling the failure of worker %s of stage %s failed" % (
+                        process.name, stage))
+
+        if timeit.default_timer() - self.last_status > self.STATUS_INTERVAL:
+            self.last_status = timeit.default_timer()
+            logger.info("Supervisor: living workers %s, failures: %d, quarantined tasks: %d" % (
+                self.worker_pool.status(), self.failures, len(self.quarantined)))
+
+    def handle_failure(self, stage, queue, process):
+        self.failures += 1
+        tasks = process.task_slot.get() if getattr(process, 'task_slot', None) is not None else []
+        logger.error("Supervisor: worker %s of stage %s died with exit code %s while processing %s" % (
+            process.name, stage, process.exitcode, tasks or 'no task'))
+
+        # Buffers of the transport, which the dead worker did not release, would block the producers forever
+        if isinstance(queue, BaseTransport):
+            queue.reclaim(process.pid)
+        self.worker_pool.scale_up(stage)
+
+        for task in tasks:
+            retries = self.retries.get((stage, task), 0)
+            if task != TaskSlot.UNKNOWN_TASK and retries < self.max_retries:
+                self.retries[(stage, task)] = retries + 1
+                logger.warning("Supervisor: retrying task %s of stage %s (retry %d of %d)" % (
+                    task, stage, retries + 1, self.max_retries))
+                try:
+                    self.retry_handlers.get(stage, queue.put)(task)
+                except Exception:
+                    logger.exception("Supervisor: retry of task %s of stage %s failed" % (task, stage))
+                    self.quarantine(stage, task)
+            else:
+                logger.error("Supervisor: quarantined task %s of stage %s after %d retries" % (task, stage, retries))
+                self.quarantine(stage, task)
+
+            # The task was taken from the queue, but the dead worker could not mark it as done anymore
+            queue.task_done()
+
+    def quarantine(self, stage, task):
+        self.quarantined.append((stage, task))
+        if task != TaskSlot.UNKNOWN_TASK and stage in self.quarantine_handlers:
+            self.quarantine_handlers[stage](task)
+
+    def stop(self):
+        """ Stops the supervisor, waits for it and reports the quarantined tasks """
+        self.stopped.set()
+        self.join()
+        self.check()
+        for stage, task in self.quarantined:
+            logger.error("Supervisor: task %s of stage %s was quarantined and is missing in the results" % (task, stage))
+
+
+class OrderingStage(object):
+    """ Optional stage between the **diff** and the **write** stage, which releases the commits to the write stage in
+    topological order (parents before children), instead of the order in which the diff workers finish them. Together
+    with the watermark, consumers of the datastore can process the commits while they are still ingested.
+
+    * The parser dispatches the commits in the topological order to the diff workers, but at most window commits ahead
+      of the last released commit (see :func:`wait_for_dispatch`). Therefore, the reorder buffer never holds more than
+      window commits, even if one commit takes very long to diff.
+    * The diff workers hand the encoded commits via :func:`add` to a thread in the main process, which buffers them
+      and releases the commits in order, as soon as all commits before them were released.
+    * The write workers report every stored commit via :func:`stored`. The watermark is the highest position in the
+      order up to which all commits are stored (-1 if none). Because the order is topological, the commits up to the
+      watermark contain all of their ancestors. The watermark is handed to the watermark function, if it advanced,
+      at most every WATERMARK_INTERVAL seconds and once after the stage was stopped.
+
+    Commits that are not part of the order (e.g., commits that are added again by a retry) are released right away.
+    Commits that are given up (see :func:`skip`) are not released, the watermark does not pass them.
+
+    :param revision_hashes: revision hashes of the commits in topological order
+    :param window: maximal number of commits that are dispatched but not released yet
+    """
+    WATERMARK_INTERVAL = 1
+
+    # Kinds of the messages of the workers
+    COMMIT = 0
+    STORED = 1
+    SKIPPED = 2
+
+    def __init__(self, revision_hashes, window=1000):
+        self.revision_hashes = list(revision_hashes)
+        self.positions = {revision_hash: position for position, revision_hash in enumerate(self.revision_hashes)}
+        self.window = max(window, 1)
+
+        # The queue must be created before the workers are forked
+        self.queue = multiprocessing.Queue()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.error = None
+        self.release_function = None
+        self.watermark_function = None
+
+        # State of the thread in the main process
+        self.released = 0
+        self.buffer = {}
+        self.max_buffered = 0
+        self.stored_positions = set()
+        self.watermark = -1
+        self.written_watermark = -1
+        self.last_watermark_time = None
+
+    def add(self, revision_hash, data):
+        """ Hands an encoded commit to the stage. Can be called from several processes at once.
+
+        :param revision_hash: revision hash of the commit
+        :param data: bytes-like object, which is released to the write stage
+        """
+        self.queue.put((self.COMMIT, revision_hash, bytes(data)))
+
+    def stored(self, revision_hash):
+        """ Reports that the commit was stored completely. Can be called from several processes at once.
+
+        :param revision_hash: revision hash of the commit
+        """
+        self.queue.put((self.STORED, revision_hash, None))
+
+    def skip(self, revision_hash):
+        """ Reports that the commit will never be added (e.g., because it was quarantined by the :class:`Supervisor`),
+        so that the commits after it can be released
+
+        :param revision_hash: revision hash of the commit
+        """
+        self.queue.put((self.SKIPPED, revision_hash, None))
+
+    def start(self, release_function, watermark_function=None):
+        """ Starts the thread of the stage in the calling (main) process
+
+        :param release_function: function, which gets the data of a commit and puts it into the queue of the write \
+        stage
+        :param watermark_function: function, which gets the position and the revision hash of the watermark
+        """
+        self.release_function = release_function
+        self.watermark_function = watermark_function
+        self.thread = threading.Thread(target=self.run, name='OrderingStage', daemon=True)
+        self.thread.start()
+
+    def wait_for_dispatch(self, position):
+        """ Blocks until the commit at the position may be dispatched to the diff workers
+
+        :param position: position of the commit in the order
+        """
+        with self.condition:
+            while position >= self.released + self.window and self.error is None:
+                self.condition.wait()
+            self._raise_error()
+
+    def drain(self):
+        """ Blocks until all commits of the order were released (or skipped) """
+        with self.condition:
+            while self.released < len(self.revision_hashes) and self.error is None:
+                self.condition.wait()
+            self._raise_error()
+
+    def stop(self):
+        """ Stops the thread after it processed all messages of the workers, which have exited, and writes the final
+        watermark """
+        self.queue.put(None)
+        self.thread.join()
+        self.write_watermark(True)
+        logger.info("Ordering stage: released %d commits, at most %d were buffered, watermark at position %d of %d" %
+                    (self.released, self.max_buffered, self.watermark, len(self.revision_hashes) - 1))
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise Exception("Ordering stage failed: %s" % self.error)
+
+    def run(self):
+        try:
+            while True:
+                message = self.queue.get()
+                if message is None:
+                    break
+                kind, revision_hash, data = message
+                if kind == self.COMMIT:
+                    self.buffer_commit(revision_hash, data)
+                elif kind == self.SKIPPED:
+                    self.buffer_commit(revision_hash, None)
+                else:
+                    self.mark_stored(revision_hash)
+        except Exception as e:
+            logger.exception("Ordering stage failed")
+            with self.condition:
+                self.error = e
+                self.condition.notify_all()
+
+    def buffer_commit(self, revision_hash, data):
+        """ Buffers the commit and releases all commits, which are next in the order
+
+        :param revision_hash: revision hash of the commit
+        :param data: encoded commit or None, if the commit is skipped
+        """
+        position = self.positions.get(revision_hash)
+        if position is None or position < self.released:
+            if data is not None:
+                self.release_function(data)
+            return
+
+        self.buffer[position] = data
+        self.max_buffered = max(self.max_buffered, len(self.buffer))
+
+        released = self.released
+        while released in self.buffer:
+            data = self.buffer.pop(released)
+            if data is not None:
+                self.release_function(data)
+            released += 1
+
+        if released != self.released:
+            with self.condition:
+                self.released = released
+                self.condition.notify_all()
+
+    def mark_stored(self, revision_hash):
+        """ Advances the watermark over all stored commits
+
+        :param revision_hash: revision hash of the stored commit
+        """
+        position = self.positions.get(revision_hash)
+        if position is None or position <= self.watermark:
+            return
+
+        self.stored_positions.add(position)
+        while self.watermark + 1 in self.stored_positions:
+            self.stored_positions.remove(self.watermark + 1)
+            self.watermark += 1
+        self.write_watermark()
+
+    def write_watermark(self, force=False):
+        """ Hands the watermark to the watermark function, if it advanced since the last call
+
+        :param force: if False, the watermark is only handed over every WATERMARK_INTERVAL seconds
+        """
+        if self.watermark_function is None or self.watermark == self.written_watermark:
+            return
+        if not force and self.last_watermark_time is not None and \
+                timeit.default_timer() - self.last_watermark_time < self.WATERMARK_INTERVAL:
+            return
+
+        self.last_watermark_time = timeit.default_timer()
+        self.written_watermark = self.watermark
+        self.watermark_function(self.watermark, self.revision_hashes[self.watermark] if self.watermark >= 0 else None)
@@ -0,0 +1,228 @@
+"""Profiling of the worker processes. The work of a run happens in the forked workers (e.g.,
+:class:`pyvcsshark.parser.gitparser.CommitParserProcess` and
+:class:`pyvcsshark.datastores.mongostore.CommitStorageProcess`), which a profiler of the main process never sees.
+Therefore, the run function of every worker, which is started via the :class:`pyvcsshark.pipeline.WorkerPool`, is
+wrapped by :func:`WorkerProfiler.wrap` (see :attr:`pyvcsshark.pipeline.WorkerPool.wrappers`). Every worker writes its profile into the profile directory
+when it ends and the profiler merges them into one report per stage at the end of the run.
+
+There are two modes:
+
+* **cprofile**: deterministic profiling with :mod:`cProfile`. A profile only sees the thread, which enabled it.
+  Therefore, every thread that a worker starts (e.g., the io threads of
+  :class:`pyvcsshark.datastores.mongostore.CommitStorageProcess`) gets its own profile, which is merged with the
+  profile of the worker when it ends. Every worker writes a pstats file and the report lists the functions with the
+  highest own time per stage.
+* **sampling**: a thread of every worker samples the stacks of the other threads of the worker every interval. It
+  only costs time per sample (not per function call) and is meant for production-size runs. Every worker writes
+  its stacks in the folded format (one line "frame;frame;frame count" per stack, which flame graph tools read) and
+  the report lists the functions with the most samples per stage. The merged stacks are written as well.
+"""
+import collections
+import cProfile
+import functools
+import glob
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+
+logger = logging.getLogger("main")
+
+PROFILE_MODES = ('cprofile', 'sampling')
+
+
+class StackSampler(threading.Thread):
+    """ Thread, which counts the stacks of all other threads of the process every interval
+
+    :param interval: seconds between two samples
+    """
+
+    def __init__(self, interval):
+        threading.Thread.__init__(self, name='StackSampler', daemon=True)
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self.stacks[self.fold(frame)] += 1
+
+    @staticmethod
+    def fold(frame):
+        """ Returns the stack of the frame as frames (outermost first), which are separated by semicolons """
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append('%s (%s:%d)' % (code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        return ';'.join(reversed(frames))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class WorkerProfiler(object):
+    """ Profiler of the workers of a run (see module documentation). The files of a run are named
+    <run id>-<stage>-<worker name>-<pid>.<pstats|folded>, so that several runs can use the same directory.
+
+    :param directory: directory of the profiles (it is created, if it does not exist)
+    :param mode: **cprofile** or **sampling**
+    :param interval: seconds between two samples of the sampling mode
+    """
+
+    def __init__(self, directory, mode='cprofile', interval=0.01):
+        if mode not in PROFILE_MODES:
+            raise Exception("Unknown profile mode %s" % mode)
+        self.directory = directory
+        self.mode = mode
+        self.interval = interval
+        self.run_id = '%s-%d' % (time.strftime('%Y%m%d-%H%M%S'), os.getpid())
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def extension(self):
+        return 'pstats' if self.mode == 'cprofile' else 'folded'
+
+    def profile_path(self, stage, worker_name, pid):
+        return os.path.join(self.directory, '%s-%s-%s-%d.%s' % (self.run_id, stage, worker_name, pid,
+                                                                self.extension))
+
+    def wrap(self, run, stage, worker_name):
+        """ Wraps the run function of a worker, so that it is profiled and writes its profile when it ends
+
+        :param run: run function of a :class:`multiprocessing.Process`
+        :param stage: name of the stage of the worker
+        :param worker_name: name of the worker
+        """
+        @functools.wraps(run)
+        def profiled_run():
+            path = self.profile_path(stage, worker_name, os.getpid())
+            if self.mode == 'cprofile':
+                profiles = [cProfile.Profile()]
+                lock = threading.Lock()
+
+                def profile_thread(frame, event, arg):
+                    # Called for the first event of every new thread, the profile replaces this function
+                    profile = cProfile.Profile()
+                    with lock:
+                        profiles.append(profile)
+                    profile.enable()
+
+                threading.setprofile(profile_thread)
+                profiles[0].enable()
+                try:
+                    return run()
+                finally:
+                    profiles[0].disable()
+                    threading.setprofile(None)
+                    self.write_profiles(path, profiles, lock)
+
+            sampler = StackSampler(self.interval)
+            sampler.start()
+            try:
+                return run()
+            finally:
+                sampler.stop()
+                self.write_stacks(path, sampler.stacks)
+        return profiled_run
+
+    @staticmethod
+    def write_profiles(path, profiles, lock):
+        """ Merges the profiles of the threads of a worker into one pstats file
+
+        :param path: path of the pstats file
+        :param profiles: list of :class:`cProfile.Profile`, the first one is the profile of the main thread
+        :param lock: lock, which guards the list against threads that are started meanwhile
+        """
+        with lock:
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+        stats.dump_stats(path)
+
+    @staticmethod
+    def write_stacks(path, stacks):
+        with open(path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write('%s %d\n' % (stack, count))
+
+    @staticmethod
+    def read_stacks(path):
+        stacks = collections.Counter()
+        with open(path, 'r') as f:
+            for line in f:
+                stack, count = line.rstrip('\n').rsplit(' ', 1)
+                stacks[stack] += int(count)
+        return stacks
+
+    def profiles(self):
+        """ Returns a dictionary stage -> list of paths with the profiles of the workers of the run """
+        profiles = {}
+        prefix = os.path.join(self.directory, self.run_id + '-')
+        for path in sorted(glob.glob('%s*.%s' % (prefix, self.extension))):
+            stage = path[len(prefix):].split('-', 1)[0]
+            profiles.setdefault(stage, []).append(path)
+        return profiles
+
+    def report(self, top=40):
+        """ Merges the profiles of the workers, which ended, into the report <run id>-report.txt (and, in the
+        sampling mode, the stacks into <run id>.folded) and returns the path of the report (None, if no
+        worker wrote a profile)
+
+        :param top: number of functions per stage in the report
+        """
+        profiles = self.profiles()
+        if not profiles:
+            logger.warning("No worker wrote a profile into %s" % self.directory)
+            return None
+
+        report = io.StringIO()
+        merged_stacks = collections.Counter()
+        for stage, paths in sorted(profiles.items()):
+            report.write("=== Stage %s: %d workers (%s) ===\n" % (stage, len(paths), self.mode))
+            if self.mode == 'cprofile':
+                stats = pstats.Stats(*paths, stream=report)
+                stats.sort_stats('tottime').print_stats(top)
+            else:
+                stacks = collections.Counter()
+                for path in paths:
+                    stacks.update(self.read_stacks(path))
+                merged_stacks.update(stacks)
+                self.write_sample_report(report, stacks, top)
+
+        report_path = os.path.join(self.directory, '%s-report.txt' % self.run_id)
+        with open(report_path, 'w') as f:
+            f.write(report.getvalue())
+        if self.mode == 'sampling':
+            self.write_stacks(os.path.join(self.directory, '%s.folded' % self.run_id), merged_stacks)
+
+        logger.info("Merged the profiles of %d workers into %s" % (sum(len(paths) for paths in profiles.values()),
+                                                                   report_path))
+        return report_path
+
+    @staticmethod
+    def write_sample_report(report, stacks, top):
+        """ Writes the functions with the most samples, in which they run themselves (own) or are on the stack
+        (total)"""
+        samples = sum(stacks.values())
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+
+        report.write("%d samples\n\n%10s %8s %10s %8s  %s\n" % (samples, 'own', 'own %', 'total', 'total %',
+                                                                'function'))
+        for frame, count in own.most_common(top):
+            report.write("%10d %7.1f%% %10d %7.1f%%  %s\n" % (count, 100.0 * count / samples, total[frame],
+                                                            100.0 * total[frame] / samples, frame))
+        report.write("\n")
@@ -0,0 +1,112 @@
+"""Live progress of a run. The :class:`ProgressReporter` logs every interval how many commits were parsed and stored,
+the rates of the stored commits (since the last report and on average) and the estimated time until all commits are
+stored. Optionally, every report is also appended as JSON line to a file::
+
+    {"time": "2016-05-03T10:15:00", "elapsed": 120.0, "parsed": 1200, "stored": 1100, "total": 5000,
+     "rate": 45.3, "average_rate": 40.1, "eta": 86.1}
+
+The workers only increment the shared counters of :mod:`pyvcsshark.metrics` (commits_parsed and commits_stored),
+which the reporter reads, so that no message is sent per commit. The estimation is based on the stored commits, as
+storing is the last stage of a commit. It is unknown (None), as long as the total number of commits is not known
+(streaming walk) or no commit was stored.
+"""
+import datetime
+import json
+import logging
+import threading
+import timeit
+
+from pyvcsshark import metrics
+
+logger = logging.getLogger("main")
+
+
+def format_duration(seconds):
+    """ Returns the duration as H:MM:SS (or unknown, if it is None)
+
+    :param seconds: duration in seconds
+    """
+    if seconds is None:
+        return 'unknown'
+    return str(datetime.timedelta(seconds=int(round(seconds))))
+
+
+class ProgressReporter(threading.Thread):
+    """ Thread of the main process, which reports the progress of the run every interval and when it is stopped
+    (see module documentation)
+
+    :param interval: seconds between two reports
+    :param json_path: path of the file, to which every report is appended as JSON line (None for no file)
+
+    :property number_of_commits: total number of commits of the run (None, if it is not known yet)
+    """
+
+    def __init__(self, interval=30, json_path=None):
+        threading.Thread.__init__(self, name='ProgressReporter', daemon=True)
+        self.interval = interval
+        self.json_path = json_path
+        self.number_of_commits = None
+        self.counters = metrics.SharedCounters()
+        self.stopped = threading.Event()
+        self.start_time = timeit.default_timer()
+        self.last_stored = 0
+        self.last_time = self.start_time
+
+    def start(self):
+        """ Activates the counters of the run (see :func:`pyvcsshark.metrics.activate`) and starts the thread. Must be
+        called before the workers are forked. """
+        self.counters = metrics.activate(self.counters)
+        self.start_time = timeit.default_timer()
+        self.last_stored = self.counters.get(metrics.COMMITS_STORED)
+        self.last_time = self.start_time
+        threading.Thread.start(self)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def stop(self):
+        """ Stops the thread, reports the final progress and deactivates the counters """
+        self.stopped.set()
+        self.join()
+        self.report()
+        metrics.deactivate()
+
+    def collect(self):
+        """ Returns the current progress as dictionary (see module documentation) """
+        now = timeit.default_timer()
+        parsed = int(self.counters.get(metrics.COMMITS_PARSED))
+        stored = int(self.counters.get(metrics.COMMITS_STORED))
+        elapsed = now - self.start_time
+        rate = (stored - self.last_stored) / max(now - self.last_time, 1e-9)
+        average_rate = stored / max(elapsed, 1e-9)
+
+        eta = None
+        if self.number_of_commits is not None and average_rate > 0:
+            remaining = max(self.number_of_commits - stored, 0)
+            # The rate since the last report follows changes of the speed faster, but is zero during stalls
+            eta = remaining / (rate if rate > 0 else average_rate)
+
+        self.last_stored = stored
+        self.last_time = now
+        return {'time': datetime.datetime.now().replace(microsecond=0).isoformat(), 'elapsed': elapsed,
+                'parsed': parsed, 'stored': stored, 'total': self.number_of_commits, 'rate': rate,
+                'average_rate': average_rate, 'eta': eta}
+
+    def report(self):
+        """ Logs the current progress and appends it to the JSON lines file. Errors of the file are only logged, as
+        they must not stop the run. """
+        progress = self.collect()
+        total = progress['total']
+        logger.info("Progress: %d%s commits parsed, %d stored%s, %0.1f commits/s (average %0.1f commits/s), ETA %s" % (
+            progress['parsed'], '/%d' % total if total is not None else '', progress['stored'],
+            ' (%0.1f%%)' % (100.0 * progress['stored'] / total) if total else '', progress['rate'],
+            progress['average_rate'], format_duration(progress['eta'])))
+
+        if self.json_path is not None:
+            try:
+                with open(self.json_path, 'a') as f:
+                    f.write(json.dumps(progress) + '\n')
+            except (IOError, OSError) as e:
+                logger.warning("Could not write the progress to %s: %s" % (self.json_path, e))
+        return progress
@@ -0,0 +1,418 @@
+import glob
+import json
+import logging
+import os
+import pickle
+import socket
+import threading
+import time
+import timeit
+import uuid
+
+from pyvcsshark.datastores.basestore import BaseStore
+from pyvcsshark.parser.baseparser import BaseParser
+from pyvcsshark.pipeline import Autoscaler, Supervisor, WorkerPool
+
+logger = logging.getLogger("main")
+
+
+class ShardDirectory(object):
+    """ Directory, which is shared between the coordinator and the workers of a sharded run (e.g., on a network file
+    system or, for local runs, on the local disk). It contains:
+
+    * **plan.pickle**: project url, repository type, branch names (in the order of their ids) and number of shards
+    * **shard-<id>.pickle**: the commits of a shard in the format of
+      :attr:`pyvcsshark.parser.gitparser.GitParser.commits_to_be_processed`
+    * **shard-<id>.claimed**: created exclusively by the worker, which processes the shard. The claim is a lease: the
+      worker renews it (its modification time) regularly, a claim that was not renewed within the lease is expired
+      (its worker died) and can be claimed by another worker. Therefore, the clocks of the nodes must agree within
+      a fraction of the lease.
+    * **shard-<id>.done**: report (json) of the worker, which stored the shard completely
+
+    All files are written to a temporary file first and then renamed, so that nobody reads a partly written file.
+
+    :param path: path to the directory
+    """
+    PLAN = 'plan.pickle'
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def shard_file(self, shard_id, suffix):
+        return os.path.join(self.path, 'shard-%05d.%s' % (shard_id, suffix))
+
+    def _write(self, file_path, data):
+        temporary_path = '%s.%d.tmp' % (file_path, os.getpid())
+        with open(temporary_path, 'wb') as f:
+            f.write(data)
+        os.replace(temporary_path, file_path)
+
+    def clear(self):
+        """ Removes the files of a previous run """
+        for file_path in glob.glob(os.path.join(self.path, self.PLAN)) + glob.glob(os.path.join(self.path, 'shard-*')):
+            os.remove(file_path)
+
+    def write_plan(self, plan, shards):
+        """ Writes the shards and afterwards the plan, which makes them visible to the workers
+
+        :param plan: dictionary with the keys project_url, repository_type and branch_names
+        :param shards: list of dictionaries in the format of commits_to_be_processed
+        """
+        for shard_id, shard in enumerate(shards):
+            self._write(self.shard_file(shard_id, 'pickle'), pickle.dumps(shard, pickle.HIGHEST_PROTOCOL))
+
+        plan = dict(plan, shards=len(shards))
+        self._write(os.path.join(self.path, self.PLAN), pickle.dumps(plan, pickle.HIGHEST_PROTOCOL))
+
+    def read_plan(self):
+        """ Returns the plan or None, if the coordinator has not written it yet """
+        try:
+            with open(os.path.join(self.path, self.PLAN), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def read_shard(self, shard_id):
+        with open(self.shard_file(shard_id, 'pickle'), 'rb') as f:
+            return pickle.load(f)
+
+    def is_done(self, shard_id):
+        return os.path.exists(self.shard_file(shard_id, 'done'))
+
+    def claim(self, shard_id, worker_name, lease=None):
+        """ Claims the shard for the worker. Returns True, if the shard was claimed and False, if it is claimed by
+        another worker or already done.
+
+        :param shard_id: id of the shard
+        :param worker_name: name of the worker
+        :param lease: seconds after which the claim of another worker is expired, if it is not renewed (None for never)
+        """
+        if self.is_done(shard_id):
+            return False
+        if lease is not None:
+            self.expire(shard_id, lease)
+        try:
+            fd = os.open(self.shard_file(shard_id, 'claimed'), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(worker_name)
+        return True
+
+    def claim_age(self, shard_id):
+        """ Returns the seconds since the claim of the shard was renewed (None, if it is not claimed) """
+        try:
+            return time.time() - os.path.getmtime(self.shard_file(shard_id, 'claimed'))
+        except FileNotFoundError:
+            return None
+
+    def renew(self, shard_id, worker_name):
+        """ Renews the claim of the worker. Returns False, if the worker does not hold the claim anymore (e.g., it was
+        expired).
+
+        :param shard_id: id of the shard
+        :param worker_name: name of the worker
+        """
+        claimed_file = self.shard_file(shard_id, 'claimed')
+        try:
+            with open(claimed_file, 'r') as f:
+                if f.read() != worker_name:
+                    return False
+            os.utime(claimed_file)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def expire(self, shard_id, lease):
+        """ Removes the claim of the shard, if it was not renewed within the lease. Returns True, if it was expired.
+
+        :param shard_id: id of the shard
+        :param lease: seconds
+        """
+        age = self.claim_age(shard_id)
+        if age is None or age <= lease:
+            return False
+
+        # Only one worker can move the claim away. If another worker replaced the expired claim in the meantime, the
+        # new claim is put back.
+        claimed_file = self.shard_file(shard_id, 'claimed')
+        expired_file = '%s.%s.expired' % (claimed_file, uuid.uuid4().hex)
+        try:
+            os.rename(claimed_file, expired_file)
+        except FileNotFoundError:
+            return False
+        try:
+            if time.time() - os.path.getmtime(expired_file) <= lease:
+                try:
+                    os.link(expired_file, claimed_file)
+                except FileExistsError:
+                    pass
+                return False
+            with open(expired_file, 'r') as f:
+                logger.warning("Claim of shard %d by %s expired after %d s" % (shard_id, f.read(), age))
+            return True
+        finally:
+            os.remove(expired_file)
+
+    def living_claims(self, number_of_shards, lease):
+        """ Returns the number of shards, which are not done and whose claim was renewed within the lease
+
+        :param number_of_shards: number of shards
+        :param lease: seconds
+        """
+        living = 0
+        for shard_id in range(number_of_shards):
+            age = self.claim_age(shard_id)
+            if age is not None and age <= lease and not self.is_done(shard_id):
+                living += 1
+        return living
+
+    def release(self, shard_id, worker_name=None):
+        """ Releases the claim of a shard, which could not be processed, so that another worker can claim it
+
+        :param shard_id: id of the shard
+        :param worker_name: name of the worker, whose claim is released (None for any claim)
+        """
+        claimed_file = self.shard_file(shard_id, 'claimed')
+        try:
+            if worker_name is not None:
+                with open(claimed_file, 'r') as f:
+                    if f.read() != worker_name:
+                        return
+            os.remove(claimed_file)
+        except FileNotFoundError:
+            pass
+
+    def mark_done(self, shard_id, report):
+        """ Marks the shard as done
+
+        :param shard_id: id of the shard
+        :param report: dictionary, which can be serialized as json
+        """
+        self._write(self.shard_file(shard_id, 'done'), json.dumps(report).encode('utf-8'))
+
+    def reports(self):
+        """ Returns a dictionary with the reports of all shards that are done """
+        reports = {}
+        for file_path in glob.glob(os.path.join(self.path, 'shard-*.done')):
+            with open(file_path, 'r') as f:
+                reports[int(os.path.basename(file_path)[6:11])] = json.load(f)
+        return reports
+
+
+class ShardCoordinator(object):
+    """ Coordinator of a sharded run. It walks the references of the repository (see
+    :func:`pyvcsshark.parser.gitparser.GitParser.initialize`), splits the commits into shards and publishes them
+    via the :class:`ShardDirectory`. The commits are parsed and stored by :class:`ShardWorker`, which can run on
+    other nodes with their own clone of the repository. After all shards are done, the coordinator stores the branches
+    once. It fails, if no shard was done and no shard had a living claim for shard_timeout seconds of the config
+    (i.e., no worker works on the shards anymore).
+
+    :param config: An instance of :class:`~pyvcsshark.Config`, which contains the configuration parameters
+    """
+    POLL_INTERVAL = 1
+
+    def __init__(self, config):
+        logger.setLevel(config.debug_level)
+        start_time = timeit.default_timer()
+
+        directory = ShardDirectory(config.shard_dir)
+        directory.clear()
+
+        datastore = BaseStore.find_correct_datastore(config.db_driver)
+        parser = BaseParser.find_correct_parser(config.path)
+        worker_pool = WorkerPool()
+        parser.worker_pool = worker_pool
+        datastore.worker_pool = worker_pool
+
+        project_url = parser.get_project_url()
+        if config.resume:
+            parser.excluded_commits = datastore.get_journaled_commits(config, project_url)
+            logger.info("Resuming run, %d commits were already stored" % len(parser.excluded_commits))
+
+        parser.initialize()
+        shards = parser.split(config.shards)
+        number_of_commits = sum(len(shard) for shard in shards)
+
+        datastore.branch_registry = parser.branch_registry
+        datastore.initialize(config, project_url, parser.repository_type)
+
+        branch_names = [parser.branch_registry.get_name(i) for i in range(len(parser.branch_registry))]
+        directory.write_plan({'project_url': project_url, 'repository_type': parser.repository_type,
+                              'branch_names': branch_names}, shards)
+        logger.info("Published %d commits in %d shards in %s" % (number_of_commits, len(shards), config.shard_dir))
+
+        self.reports = self.wait_for_shards(directory, len(shards), config.shard_timeout, config.shard_lease)
+
+        # The commits are stored, therefore the datastore can store the branches
+        parser.add_branch_tips(datastore)
+        parser.finalize()
+        datastore.finalize()
+        worker_pool.terminate()
+
+        self.elapsed = timeit.default_timer() - start_time
+        logger.info("Stored %d commits in %d shards in %0.2f s" % (number_of_commits, len(shards), self.elapsed))
+
+    def wait_for_shards(self, directory, number_of_shards, timeout=None, lease=60):
+        """ Waits until all shards are done and returns their reports
+
+        :param directory: object of class :class:`ShardDirectory`
+        :param number_of_shards: number of shards
+        :param timeout: maximal time in seconds without progress, i.e., without a shard that was done or had a living \
+        claim (None for no limit)
+        :param lease: seconds after which a claim, which was not renewed, is not living anymore
+        """
+        start_time = timeit.default_timer()
+        done = 0
+        while True:
+            reports = directory.reports()
+            if len(reports) != done:
+                done = len(reports)
+                start_time = timeit.default_timer()
+                logger.info("%d of %d shards are done" % (done, number_of_shards))
+            elif directory.living_claims(number_of_shards, lease) > 0:
+                start_time = timeit.default_timer()
+            if done == number_of_shards:
+                for shard_id, report in sorted(reports.items()):
+                    logger.info("Shard %d: %d commits stored by %s in %0.2f s" % (
+                        shard_id, report['commits'], report['worker'], report['elapsed']))
+                return reports
+            if timeout is not None and timeit.default_timer() - start_time > timeout:
+                raise Exception("Only %d of %d shards were done and no worker processed a shard for %d s" % (
+                    done, number_of_shards, timeout))
+            time.sleep(self.POLL_INTERVAL)
+
+
+class ClaimHeartbeat(threading.Thread):
+    """ Thread, which renews the claim of a shard every interval, while the worker processes it
+
+    :param directory: object of class :class:`ShardDirectory`
+    :param shard_id: id of the shard
+    :param worker_name: name of the worker
+    :param interval: seconds between two renewals
+    """
+
+    def __init__(self, directory, shard_id, worker_name, interval):
+        threading.Thread.__init__(self, name='ClaimHeartbeat', daemon=True)
+        self.directory = directory
+        self.shard_id = shard_id
+        self.worker_name = worker_name
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            if not self.directory.renew(self.shard_id, self.worker_name):
+                logger.warning("Worker %s lost its claim of shard %d, another worker may process it as well" % (
+                    self.worker_name, self.shard_id))
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class ShardWorker(object):
+    """ Worker of a sharded run. It waits for the plan of the :class:`ShardCoordinator`, claims shards and parses and
+    stores the commits of each claimed shard with its own clone of the repository (given by the path of the config).
+    It scans the shards again, until all of them are done, so that it takes over shards, which were released by a
+    failed worker or whose claim expired (see :class:`ShardDirectory`), while it renews its own claim (see
+    :class:`ClaimHeartbeat`). The branches are not stored by the workers.
+
+    If a shard fails, its claim is released, so that another worker can process it, and the error is raised.
+
+    :param config: An instance of :class:`~pyvcsshark.Config`, which contains the configuration parameters
+    :param worker_name: name of the worker in the reports (default: <hostname>-<pid>)
+    """
+    POLL_INTERVAL = 1
+
+    def __init__(self, config, worker_name=None):
+        logger.setLevel(config.debug_level)
+        self.worker_name = worker_name or '%s-%d' % (socket.gethostname(), os.getpid())
+        directory = ShardDirectory(config.shard_dir)
+
+        plan = self.wait_for_plan(directory, config.shard_timeout)
+        worker_pool = WorkerPool()
+        self.processed_shards = []
+        while True:
+            open_shards = [shard_id for shard_id in range(plan['shards']) if not directory.is_done(shard_id)]
+            if not open_shards:
+                break
+
+            claimed = False
+            for shard_id in open_shards:
+                if directory.claim(shard_id, self.worker_name, config.shard_lease):
+                    claimed = True
+                    self.process(config, plan, directory, shard_id, worker_pool)
+            # The remaining shards are claimed by other workers, which may still fail or die
+            if not claimed:
+                time.sleep(self.POLL_INTERVAL)
+
+        logger.info("Worker %s processed %d shards" % (self.worker_name, len(self.processed_shards)))
+
+    def process(self, config, plan, directory, shard_id, worker_pool):
+        """ Processes the claimed shard, renews the claim meanwhile and marks the shard as done """
+        logger.info("Worker %s processes shard %d" % (self.worker_name, shard_id))
+        start_time = timeit.default_timer()
+        heartbeat = ClaimHeartbeat(directory, shard_id, self.worker_name, config.shard_lease / 4.0)
+        heartbeat.start()
+        try:
+            number_of_commits = self.process_shard(config, plan, directory.read_shard(shard_id), worker_pool)
+        except BaseException:
+            heartbeat.stop()
+            worker_pool.terminate()
+            directory.release(shard_id, self.worker_name)
+            raise
+        heartbeat.stop()
+
+        directory.mark_done(shard_id, {'worker': self.worker_name, 'commits': number_of_commits,
+                                       'elapsed': timeit.default_timer() - start_time})
+        self.processed_shards.append(shard_id)
+
+    def wait_for_plan(self, directory, timeout=None):
+        start_time = timeit.default_timer()
+        while True:
+            plan = directory.read_plan()
+            if plan is not None:
+                return plan
+            if timeout is not None and timeit.default_timer() - start_time > timeout:
+                raise Exception("No plan was published in %s after %d s" % (directory.path, timeout))
+            time.sleep(self.POLL_INTERVAL)
+
+    @staticmethod
+    def process_shard(config, plan, commits, worker_pool):
+        """ Parses and stores the commits of a shard and returns their number
+
+        :param config: An instance of :class:`~pyvcsshark.Config`
+        :param plan: plan of the coordinator (see :class:`ShardDirectory`)
+        :param commits: dictionary in the format of commits_to_be_processed
+        :param worker_pool: object of class :class:`pyvcsshark.pipeline.WorkerPool`
+        """
+        datastore = BaseStore.find_correct_datastore(config.db_driver)
+        parser = BaseParser.find_correct_parser(config.path)
+        parser.worker_pool = worker_pool
+        datastore.worker_pool = worker_pool
+
+        number_of_commits = len(commits)
+        parser.load_shard(plan['branch_names'], commits)
+        datastore.branch_registry = parser.branch_registry
+        datastore.initialize(config, plan['project_url'], plan['repository_type'])
+
+        supervisor = Supervisor(worker_pool, config.max_retries)
+        supervisor.set_retry_handler('write', parser.retry_commit)
+        supervisor.start()
+        autoscaler = None
+        if config.autoscale:
+            autoscaler = Autoscaler(worker_pool)
+            autoscaler.start()
+        parser.parse(config.path, datastore, config.worker_plan.diff_workers)
+        if autoscaler is not None:
+            autoscaler.stop()
+        parser.finalize()
+        datastore.finalize()
+        supervisor.stop()
+        worker_pool.terminate()
+        if supervisor.quarantined:
+            raise Exception("%d commits of the shard were quarantined" % len(supervisor.quarantined))
+        return number_of_commits
@@ -0,0 +1,170 @@
+"""Catalogue of the slowest commits of a run. A few pathological commits (e.g., mass renames, vendored libraries or
+generated files) often take most of the time of a run. The :class:`pyvcsshark.parser.gitparser.CommitParserProcess`
+records the time to parse every commit (stage **parse**) and the
+:class:`pyvcsshark.datastores.mongostore.CommitStorageProcess` the time to store it (stage **store**) via
+:func:`record`. Every process keeps only its slowest commits per stage, together with their size (see
+:func:`commit_features`), which is only computed for these commits.
+
+At the end of the run, the :class:`SlowCommitCatalogue` merges the slowest commits of all workers and writes them as
+JSON into the report::
+
+    {"top": 100, "stages": {"parse": [{"revision_hash": ..., "seconds": ..., "files": ..., ...}, ...],
+                            "store": [...]}}
+"""
+import functools
+import heapq
+import itertools
+import json
+import logging
+import multiprocessing
+import threading
+
+logger = logging.getLogger("main")
+
+# Slowest commits of this process (None, if no catalogue is created)
+_slow_commits = None
+
+
+class SlowCommits(object):
+    """ The slowest commits of one process per stage
+
+    :param top: number of commits per stage
+    """
+
+    def __init__(self, top):
+        self.top = top
+        self.heaps = {}
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+
+    def record(self, stage, revision_hash, seconds, get_features):
+        """ Records the duration of the commit in the stage, if it is one of the slowest
+
+        :param stage: name of the stage
+        :param revision_hash: revision hash of the commit
+        :param seconds: duration in seconds
+        :param get_features: function, which returns a dictionary with the size of the commit
+        """
+        heap = self.heaps.get(stage)
+        if heap is not None and len(heap) >= self.top and seconds <= heap[0][0]:
+            return
+
+        entry = dict(get_features(), revision_hash=revision_hash, seconds=seconds)
+        with self.lock:
+            heap = self.heaps.setdefault(stage, [])
+            if len(heap) < self.top:
+                heapq.heappush(heap, (seconds, next(self.counter), entry))
+            else:
+                heapq.heappushpop(heap, (seconds, next(self.counter), entry))
+
+    def summary(self):
+        """ Returns a dictionary stage -> list of commits (slowest first) """
+        with self.lock:
+            return {stage: [entry for seconds, i, entry in sorted(heap, reverse=True)]
+                    for stage, heap in self.heaps.items()}
+
+
+def merge_summaries(summaries, top):
+    """ Merges the summaries of several processes and returns the slowest commits per stage
+
+    :param summaries: list of summaries (see :func:`SlowCommits.summary`)
+    :param top: number of commits per stage
+    """
+    merged = {}
+    for summary in summaries:
+        for stage, commits in summary.items():
+            merged.setdefault(stage, []).extend(commits)
+    return {stage: sorted(commits, key=lambda commit: -commit['seconds'])[:top] for stage, commits in merged.items()}
+
+
+def record(stage, revision_hash, seconds, get_features):
+    """ Records the duration of the commit in the stage (if a catalogue is created, see :func:`SlowCommits.record`)
+    """
+    slow_commits = _slow_commits
+    if slow_commits is not None:
+        slow_commits.record(stage, revision_hash, seconds, get_features)
+
+
+def commit_features(commit_model):
+    """ Returns a dictionary with the size of the commit: number of parents, changed files, hunks, renamed or copied
+    files, the size of the hunk contents in characters and whether rename detection ran (for every parent)
+
+    :param commit_model: object of class :class:`pyvcsshark.parser.models.CommitModel`
+    """
+    hunks = 0
+    hunk_size = 0
+    renames = 0
+    for changed_file in commit_model.changedFiles:
+        hunks += len(changed_file.hunks)
+        hunk_size += sum(len(hunk.content) for hunk in changed_file.hunks)
+        if changed_file.mode in ('R', 'C'):
+            renames += 1
+    return {'parents': len(commit_model.parents), 'files': len(commit_model.changedFiles), 'hunks': hunks,
+            'hunk_size': hunk_size, 'renames': renames, 'rename_detection': bool(commit_model.parents)}
+
+
+class SlowCommitCatalogue(threading.Thread):
+    """ Catalogue of the slowest commits of a run (see module documentation). It must be created before the workers
+    are forked. Its thread receives the slowest commits of the workers, which end.
+
+    :param path: path of the report
+    :param top: number of commits per stage
+    """
+
+    def __init__(self, path, top=100):
+        threading.Thread.__init__(self, name='SlowCommitCatalogue', daemon=True)
+        self.path = path
+        self.top = top
+        self.queue = multiprocessing.Queue()
+        self.summaries = []
+
+    def start(self):
+        global _slow_commits
+        _slow_commits = SlowCommits(self.top)
+        threading.Thread.start(self)
+
+    def run(self):
+        while True:
+            summary = self.queue.get()
+            if summary is None:
+                break
+            self.summaries.append(summary)
+
+    def wrap(self, run, stage, worker_name):
+        """ Wraps the run function of a worker, so that it records its own slowest commits and reports them when it
+        ends (see :class:`pyvcsshark.pipeline.WorkerPool`)
+
+        :param run: run function of a :class:`multiprocessing.Process`
+        :param stage: name of the stage of the worker
+        :param worker_name: name of the worker
+        """
+        @functools.wraps(run)
+        def recording_run():
+            global _slow_commits
+            _slow_commits = SlowCommits(self.top)
+            try:
+                return run()
+            finally:
+                self.queue.put(_slow_commits.summary())
+        return recording_run
+
+    def stop(self):
+        """ Stops the catalogue after the workers ended, writes the report and returns the slowest commits per stage
+        """
+        global _slow_commits
+        self.queue.put(None)
+        self.join()
+        self.queue.close()
+        stages = merge_summaries(self.summaries + [_slow_commits.summary()], self.top)
+        _slow_commits = None
+
+        with open(self.path, 'w') as f:
+            json.dump({'top': self.top, 'stages': stages}, f, indent=2)
+
+        for stage, commits in sorted(stages.items()):
+            for commit in commits[:5]:
+                logger.info("Slow commit (%s): %s in %0.2f s (%d files, %d hunks, %d characters)" % (
+                    stage, commit['revision_hash'], commit['seconds'], commit['files'], commit['hunks'],
+                    commit['hunk_size']))
+        logger.info("Wrote the %d slowest commits per stage to %s" % (self.top, self.path))
+        return stages
@@ -0,0 +1,270 @@
+"""Low-overhead timers for the stages of a run. Every process (and every thread in it) records the durations of its
+stages into histograms (see :class:`Histogram`) of its own, so that recording needs no locks. The worker processes,
+which are started via the :class:`pyvcsshark.pipeline.WorkerPool`, send their histograms to the
+:class:`TimingCollector` of the application, when they end. The collector merges them with the histograms of the
+main process into the report, which is logged at the end of a run.
+
+Stages are named <component>.<step>, e.g.:
+
+* **parser.walk**: walk of the references in :func:`pyvcsshark.parser.gitparser.GitParser.initialize`
+* **parser.diff**, **parser.find_similar**, **parser.create_hunks**: diff of a commit against a parent
+* **parser.queue_get**, **store.queue_put**, **store.queue_get**: waiting for (or putting into) the queues between \
+the stages
+* **store.lock_wait**: waiting for the lock of a storage process (see :class:`TimedLock`)
+* **store.write.<collection>**: writes of the storage processes into a collection
+* **store.repository_file.tar**, **store.repository_file.gridfs**: storing of the repository as tar.gz in the gridfs
+"""
+import functools
+import logging
+import multiprocessing
+import threading
+import timeit
+
+logger = logging.getLogger("main")
+
+# Histograms of the threads of this process and the queue of the collector, to which worker processes report
+_local = threading.local()
+_registries = []
+_registries_lock = threading.Lock()
+_collector_queue = None
+
+
+class Histogram(object):
+    """ Histogram of durations with logarithmic buckets: bucket i holds the durations from 2^(i-1) up to 2^i
+    microseconds (bucket 0 the durations below one microsecond). Histograms of several processes can be merged.
+    """
+    BUCKETS = 40
+
+    __slots__ = ('count', 'total', 'maximum', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.buckets = [0] * self.BUCKETS
+
+    def add(self, seconds):
+        """ Adds a duration
+
+        :param seconds: duration in seconds
+        """
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+        self.buckets[min(int(seconds * 1000000).bit_length(), self.BUCKETS - 1)] += 1
+
+    def merge(self, other):
+        """ Adds the durations of another histogram
+
+        :param other: object of class :class:`Histogram`
+        """
+        self.count += other.count
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+        for i, count in enumerate(other.buckets):
+            self.buckets[i] += count
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        """ Returns the upper bound (in seconds) of the bucket, which holds the percentile. It is at most twice the \
+        exact percentile.
+
+        :param fraction: percentile as fraction (e.g. 0.99)
+        """
+        rank = fraction * self.count
+        cumulative = 0
+        for i, count in enumerate(self.buckets):
+            cumulative += count
+            if count and cumulative >= rank:
+                return min(2 ** i / 1000000.0, self.maximum)
+        return self.maximum
+
+
+class StageTimer(object):
+    """ Context manager, which records the duration of its block for the stage (see :func:`timed`)
+
+    :param stage: name of the stage
+    """
+    __slots__ = ('stage', 'start_time')
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.start_time = None
+
+    def __enter__(self):
+        self.start_time = timeit.default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record(self.stage, timeit.default_timer() - self.start_time)
+        return False
+
+
+class TimedLock(object):
+    """ Lock, whose acquisitions record the time they waited for the lock. It is used as context manager like the
+    wrapped lock.
+
+    :param lock: lock, e.g. of class :class:`threading.Lock`
+    :param stage: name of the stage, e.g. **store.lock_wait**
+    """
+
+    def __init__(self, lock, stage):
+        self.lock = lock
+        self.stage = stage
+
+    def __enter__(self):
+        start_time = timeit.default_timer()
+        self.lock.acquire()
+        record(self.stage, timeit.default_timer() - start_time)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.lock.release()
+        return False
+
+
+def _registry():
+    """ Returns the histograms of the current thread """
+    try:
+        return _local.registry
+    except AttributeError:
+        registry = {}
+        with _registries_lock:
+            _registries.append(registry)
+        _local.registry = registry
+        return registry
+
+
+def record(stage, seconds):
+    """ Records a duration of the stage in the current thread
+
+    :param stage: name of the stage
+    :param seconds: duration in seconds
+    """
+    registry = _registry()
+    histogram = registry.get(stage)
+    if histogram is None:
+        histogram = registry[stage] = Histogram()
+    histogram.add(seconds)
+
+
+def timed(stage):
+    """ Returns a context manager, which records the duration of its block for the stage::
+
+        with timing.timed('parser.diff'):
+            diff = repository.diff(parent, commit)
+
+    :param stage: name of the stage
+    """
+    return StageTimer(stage)
+
+
+def merge(histograms, other):
+    """ Merges the histograms of other into histograms (both dictionaries stage -> :class:`Histogram`) """
+    for stage, histogram in other.items():
+        if stage not in histograms:
+            histograms[stage] = Histogram()
+        histograms[stage].merge(histogram)
+    return histograms
+
+
+def snapshot():
+    """ Returns a dictionary stage -> :class:`Histogram` with the merged histograms of all threads of this process """
+    with _registries_lock:
+        registries = list(_registries)
+    histograms = {}
+    for registry in registries:
+        merge(histograms, dict(registry))
+    return histograms
+
+
+def reset():
+    """ Discards the histograms of this process """
+    global _local, _registries, _registries_lock
+    _local = threading.local()
+    _registries = []
+    _registries_lock = threading.Lock()
+
+
+def report():
+    """ Sends the histograms of this process to the collector of the application (if there is one) """
+    if _collector_queue is not None:
+        _collector_queue.put(snapshot())
+
+
+def reporting(run):
+    """ Wraps the run function of a worker process, so that the process starts without the histograms, which it
+    inherited from its parent (they would otherwise be reported twice), and reports its histograms when it ends
+
+    :param run: run function of a :class:`multiprocessing.Process`
+    """
+    @functools.wraps(run)
+    def run_and_report():
+        reset()
+        try:
+            return run()
+        finally:
+            report()
+    return run_and_report
+
+
+class TimingCollector(threading.Thread):
+    """ Thread of the main process, which receives the histograms of the worker processes. It must be started before
+    the workers are forked. The queue is read while the run continues, so that the workers never wait for it when
+    they end.
+    """
+
+    def __init__(self):
+        threading.Thread.__init__(self, name='TimingCollector', daemon=True)
+        self.queue = multiprocessing.Queue()
+        self.histograms = {}
+        self.reports = 0
+
+    def start(self):
+        global _collector_queue
+        reset()
+        _collector_queue = self.queue
+        threading.Thread.start(self)
+
+    def run(self):
+        while True:
+            histograms = self.queue.get()
+            if histograms is None:
+                break
+            merge(self.histograms, histograms)
+            self.reports += 1
+
+    def stop(self):
+        """ Stops the collector, after the workers ended, and returns the merged histograms of the workers and the \
+        main process """
+        global _collector_queue
+        _collector_queue = None
+        self.queue.put(None)
+        self.join()
+        self.queue.close()
+        return merge(self.histograms, snapshot())
+
+
+def format_report(histograms, elapsed):
+    """ Returns the lines of the report of a run. The times of the stages are summed over all processes and threads,
+    therefore they can exceed the execution time.
+
+    :param histograms: dictionary stage -> :class:`Histogram`
+    :param elapsed: execution time in seconds
+    """
+    lines = ["Execution time: %0.5f s" % elapsed]
+    if not histograms:
+        return lines
+
+    lines.append("%-28s %10s %11s %10s %10s %10s %10s" % ('stage', 'count', 'total [s]', 'mean [ms]', 'p50 [ms]',
+                                                          'p99 [ms]', 'max [ms]'))
+    for stage in sorted(histograms):
+        histogram = histograms[stage]
+        lines.append("%-28s %10d %11.3f %10.3f %10.3f %10.3f %10.3f" % (
+            stage, histogram.count, histogram.total, histogram.mean * 1000, histogram.percentile(0.5) * 1000,
+            histogram.percentile(0.99) * 1000, histogram.maximum * 1000))
+    return lines
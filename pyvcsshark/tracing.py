@@ -0,0 +1,259 @@
+"""Tracer of the round trips to the mongodb. It is built on the command monitoring of pymongo: every command of every
+client is counted and timed per command and collection. The :class:`pyvcsshark.datastores.mongostore.CommitStorageProcess`
+marks the commit it stores in the current thread (see :func:`start_commit` and :func:`end_commit`), so that the
+commands are also counted per commit. The events of pymongo are published in the thread, which sends the command.
+
+The :class:`DatabaseTracer` of a run collects the traces of all worker processes and writes a report with the commands
+per collection, the distribution of the operations per commit and the commits, which exceed a threshold.
+
+The createIndexes commands, which mongoengine sends once per process and collection, are not counted for the
+commits.
+"""
+import collections
+import functools
+import logging
+import multiprocessing
+import threading
+
+from pymongo import monitoring
+
+logger = logging.getLogger("main")
+
+# Commands, which are not counted for the commit, during which they are sent
+SETUP_COMMANDS = ('createIndexes', 'listIndexes')
+
+# Recorder of this process (None, if no tracer runs)
+_recorder = None
+
+
+class CommandRecorder(object):
+    """ Records the commands of one process
+
+    :param threshold: number of operations, above which a commit is flagged
+    :param max_flagged: maximal number of flagged commits that are kept (the ones with the most operations)
+    """
+
+    def __init__(self, threshold, max_flagged=1000):
+        self.threshold = threshold
+        self.max_flagged = max_flagged
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.pending = {}
+        self.commands = {}
+        self.operations_per_commit = collections.Counter()
+        self.commits = 0
+        self.commit_operations = 0
+        self.commit_seconds = 0.0
+        self.flagged = []
+
+    def start_commit(self, revision_hash):
+        self.local.commit = [revision_hash, 0, 0.0, collections.Counter()]
+
+    def end_commit(self):
+        commit = getattr(self.local, 'commit', None)
+        if commit is None:
+            return
+        self.local.commit = None
+        revision_hash, operations, seconds, collections_of_commit = commit
+        with self.lock:
+            self.commits += 1
+            self.commit_operations += operations
+            self.commit_seconds += seconds
+            self.operations_per_commit[operations] += 1
+            if operations > self.threshold:
+                self.flagged.append((revision_hash, operations, seconds, dict(collections_of_commit)))
+                if len(self.flagged) > 2 * self.max_flagged:
+                    self.flagged = most_operations(self.flagged, self.max_flagged)
+
+    def command_started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == 'getMore':
+            collection = event.command.get('collection')
+        if not isinstance(collection, str):
+            collection = '-'
+        self.pending[(event.connection_id, event.request_id)] = collection
+
+    def command_ended(self, event):
+        collection = self.pending.pop((event.connection_id, event.request_id), '-')
+        seconds = event.duration_micros / 1000000.0
+        with self.lock:
+            entry = self.commands.setdefault((event.command_name, collection), [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+        commit = getattr(self.local, 'commit', None)
+        if commit is not None and event.command_name not in SETUP_COMMANDS:
+            commit[1] += 1
+            commit[2] += seconds
+            commit[3][collection] += 1
+
+    def summary(self):
+        """ Returns the records as dictionary, which can be merged with :func:`merge_summaries` """
+        with self.lock:
+            return {'commands': {key: list(value) for key, value in self.commands.items()},
+                    'operations_per_commit': dict(self.operations_per_commit), 'commits': self.commits,
+                    'commit_operations': self.commit_operations, 'commit_seconds': self.commit_seconds,
+                    'flagged': most_operations(self.flagged, self.max_flagged)}
+
+
+def most_operations(flagged, number):
+    return sorted(flagged, key=lambda commit: -commit[1])[:number]
+
+
+def merge_summaries(summaries, max_flagged=1000):
+    """ Merges the summaries of several processes (see :func:`CommandRecorder.summary`)
+
+    :param summaries: list of summaries
+    :param max_flagged: maximal number of flagged commits that are kept
+    """
+    merged = {'commands': {}, 'operations_per_commit': collections.Counter(), 'commits': 0, 'commit_operations': 0,
+              'commit_seconds': 0.0, 'flagged': []}
+    for summary in summaries:
+        for key, (count, seconds) in summary['commands'].items():
+            entry = merged['commands'].setdefault(key, [0, 0.0])
+            entry[0] += count
+            entry[1] += seconds
+        merged['operations_per_commit'].update(summary['operations_per_commit'])
+        for key in ('commits', 'commit_operations', 'commit_seconds'):
+            merged[key] += summary[key]
+        merged['flagged'] += summary['flagged']
+    merged['operations_per_commit'] = dict(merged['operations_per_commit'])
+    merged['flagged'] = most_operations(merged['flagged'], max_flagged)
+    return merged
+
+
+def start_commit(revision_hash):
+    """ Marks the commit as the commit, which is stored by the current thread (if a tracer runs)
+
+    :param revision_hash: revision hash of the commit
+    """
+    recorder = _recorder
+    if recorder is not None:
+        recorder.start_commit(revision_hash)
+
+
+def end_commit():
+    """ Marks the end of the commit, which is stored by the current thread (if a tracer runs) """
+    recorder = _recorder
+    if recorder is not None:
+        recorder.end_commit()
+
+
+class CommandTracer(monitoring.CommandListener):
+    """ Command listener of pymongo, which passes the commands to the recorder of the process (if there is one) """
+
+    def started(self, event):
+        recorder = _recorder
+        if recorder is not None:
+            recorder.command_started(event)
+
+    def succeeded(self, event):
+        recorder = _recorder
+        if recorder is not None:
+            recorder.command_ended(event)
+
+    def failed(self, event):
+        self.succeeded(event)
+
+
+# The listener must be registered before the first client is created, which is why it is registered on import
+monitoring.register(CommandTracer())
+
+
+class DatabaseTracer(threading.Thread):
+    """ Tracer of the round trips of a run (see module documentation). It must be started before the workers are
+    forked. Its thread receives the summaries of the workers, which end.
+
+    :param path: path of the report
+    :param threshold: number of operations, above which a commit is flagged
+    """
+
+    def __init__(self, path, threshold=50):
+        threading.Thread.__init__(self, name='DatabaseTracer', daemon=True)
+        self.path = path
+        self.threshold = threshold
+        self.queue = multiprocessing.Queue()
+        self.summaries = []
+
+    def start(self):
+        global _recorder
+        _recorder = CommandRecorder(self.threshold)
+        threading.Thread.start(self)
+
+    def run(self):
+        while True:
+            summary = self.queue.get()
+            if summary is None:
+                break
+            self.summaries.append(summary)
+
+    def wrap(self, run, stage, worker_name):
+        """ Wraps the run function of a worker, so that it records its own commands and reports them when it ends
+        (see :class:`pyvcsshark.pipeline.WorkerPool`)
+
+        :param run: run function of a :class:`multiprocessing.Process`
+        :param stage: name of the stage of the worker
+        :param worker_name: name of the worker
+        """
+        @functools.wraps(run)
+        def traced_run():
+            global _recorder
+            # The records of the main process are inherited
+            _recorder = CommandRecorder(self.threshold)
+            try:
+                return run()
+            finally:
+                self.queue.put(_recorder.summary())
+        return traced_run
+
+    def stop(self):
+        """ Stops the tracer after the workers ended, writes the report and returns the merged summary of all
+        processes """
+        global _recorder
+        self.queue.put(None)
+        self.join()
+        self.queue.close()
+        summary = merge_summaries(self.summaries + [_recorder.summary()])
+        _recorder = None
+
+        with open(self.path, 'w') as f:
+            f.write('\n'.join(format_report(summary, self.threshold)) + '\n')
+
+        operations = sum(count for count, seconds in summary['commands'].values())
+        logger.info("Sent %d commands to the mongodb, %0.1f operations per commit, %d commits with more than %d "
+                    "operations (see %s)" % (operations, summary['commit_operations'] / max(summary['commits'], 1),
+                                             len(summary['flagged']), self.threshold, self.path))
+        return summary
+
+
+def max_operations_per_commit(summary):
+    """ Returns the maximal number of operations of a commit (0, if no commit was stored) """
+    return max(summary['operations_per_commit'] or [0])
+
+
+def format_report(summary, threshold):
+    """ Returns the lines of the report
+
+    :param summary: merged summary (see :func:`merge_summaries`)
+    :param threshold: number of operations, above which a commit is flagged
+    """
+    lines = ["%-16s %-20s %10s %11s %10s" % ('command', 'collection', 'count', 'total [s]', 'mean [ms]')]
+    for (command, collection), (count, seconds) in sorted(summary['commands'].items(),
+                                                          key=lambda item: -item[1][0]):
+        lines.append("%-16s %-20s %10d %11.3f %10.3f" % (command, collection, count, seconds,
+                                                         1000 * seconds / max(count, 1)))
+
+    commits = summary['commits']
+    lines += ['', "%d commits with %d operations (%0.1f per commit, %0.3f s per commit, max %d)" % (
+        commits, summary['commit_operations'], summary['commit_operations'] / max(commits, 1),
+        summary['commit_seconds'] / max(commits, 1), max_operations_per_commit(summary))]
+    lines.append("%12s %10s" % ('operations', 'commits'))
+    for operations, number in sorted(summary['operations_per_commit'].items()):
+        lines.append("%12d %10d" % (operations, number))
+
+    lines += ['', "%d commits with more than %d operations:" % (len(summary['flagged']), threshold)]
+    for revision_hash, operations, seconds, collections_of_commit in summary['flagged']:
+        lines.append("%s %6d operations %8.3f s  %s" % (
+            revision_hash, operations, seconds,
+            ', '.join('%s: %d' % item for item in sorted(collections_of_commit.items()))))
+    return lines
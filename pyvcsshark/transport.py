@@ -0,0 +1,319 @@
+import abc
+import multiprocessing
+import os
+import struct
+
+# Shared memory blocks need python 3.8, with older versions only the queue transport is available
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+class BaseTransport(metaclass=abc.ABCMeta):
+    """
+    Abstract class for the transports, which hand serialized commits (see :class:`pyvcsshark.codec.BaseCodec`) from
+    the parser processes over to the storage processes of a datastore. A transport behaves like a
+    :class:`multiprocessing.JoinableQueue` of bytes, with the difference that the consumer must call :func:`release`
+    as soon as it does not need the buffer returned by :func:`get` anymore.
+
+    Based on pythons abc: :py:mod:`abc`
+
+    :param metaclass: name of the abstract metaclass
+    """
+
+    @abc.abstractmethod
+    def put(self, data):
+        """Puts the data into the transport. Can be called from several processes at once.
+
+        :param data: bytes-like object or None (used as poison pill)
+        """
+        return
+
+    @abc.abstractmethod
+    def get(self):
+        """Blocks until data is available and returns it (or None for a poison pill). The returned buffer is only
+        valid until :func:`release` is called."""
+        return
+
+    def release(self):
+        """Releases the buffer returned by the last call of :func:`get` of this process"""
+        return
+
+    def reclaim(self, pid):
+        """Releases the buffers, which a process got via :func:`get` but did not release before it died. It is called
+        by the :class:`pyvcsshark.pipeline.Supervisor` for every dead worker.
+
+        :param pid: process id of the dead process
+        """
+        return
+
+    @abc.abstractmethod
+    def task_done(self):
+        """Indicates that the processing of data got via :func:`get` is complete"""
+        return
+
+    @abc.abstractmethod
+    def join(self):
+        """Blocks until all data that was put into the transport was processed"""
+        return
+
+    @abc.abstractmethod
+    def qsize(self):
+        """Returns the approximate number of items that are waiting in the transport"""
+        return
+
+    def close(self):
+        """Frees the resources of the transport. Must be called by the process that created it."""
+        return
+
+
+class QueueTransport(BaseTransport):
+    """Transport that uses a :class:`multiprocessing.JoinableQueue`. The data is pickled and written through a pipe
+    by the feeder thread of the queue."""
+
+    def __init__(self):
+        self.queue = multiprocessing.JoinableQueue()
+
+    def put(self, data):
+        self.queue.put(data)
+
+    def get(self):
+        return self.queue.get()
+
+    def task_done(self):
+        self.queue.task_done()
+
+    def join(self):
+        self.queue.join()
+
+    def qsize(self):
+        return self.queue.qsize()
+
+
+class SharedMemoryTransport(BaseTransport):
+    """Transport that uses a multi-producer/multi-consumer ring buffer in a
+    :class:`multiprocessing.shared_memory.SharedMemory` block. Producers copy the data once into the ring buffer and
+    consumers get a :class:`memoryview` on it, so that they can decode it in place.
+
+    The ring buffer is made of records, which consist of a header (length and state, 8 bytes) and the data (padded
+    to 8 bytes). The positions in the header of the shared memory block increase monotonically:
+
+    * write position: end of the space that was reserved by producers
+    * read position: end of the records that were taken by consumers
+    * free position: end of the records that were released by consumers, everything before can be overwritten
+
+    A record that was taken by a consumer is marked with the process id of the consumer, so that the records of a dead
+    consumer can be released by :func:`reclaim`. Otherwise, the free position could not move over them anymore and the
+    producers would wait forever.
+
+    Producers and consumers only hold the lock for the reservation of records, the copying and decoding of the data
+    happens outside of it. Data that is larger than the ring buffer is passed through an overflow queue.
+
+    :param size: size of the ring buffer in bytes
+    """
+    _FIELD = struct.Struct('<Q')
+    _RECORD = struct.Struct('<II')
+
+    # Fields of the header of the shared memory block
+    _WRITE_POSITION = 0
+    _READ_POSITION = 1
+    _FREE_POSITION = 2
+    _UNFINISHED_TASKS = 3
+    _QUEUED_ITEMS = 4
+    _HEADER_SIZE = 5 * 8
+
+    # States of the records
+    _WRITING = 0
+    _READY = 1
+    _RELEASED = 2
+    _WRAP = 3
+    _POISON_PILL = 4
+    _OVERFLOW = 5
+    # Records taken by a consumer have the state _RESERVED + process id of the consumer
+    _RESERVED = 8
+
+    def __init__(self, size=64 * 1024 * 1024):
+        self.capacity = max(size - size % 8, 1024)
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=self._HEADER_SIZE + self.capacity)
+        self.shared_memory.buf[:self._HEADER_SIZE] = bytes(self._HEADER_SIZE)
+        self.condition = multiprocessing.Condition(multiprocessing.Lock())
+        self.overflow_queue = multiprocessing.Queue()
+
+        # Record that was reserved by the last call of get (local to each process)
+        self.reserved_offset = None
+
+    def _get(self, field):
+        return self._FIELD.unpack_from(self.shared_memory.buf, field * 8)[0]
+
+    def _set(self, field, value):
+        self._FIELD.pack_into(self.shared_memory.buf, field * 8, value)
+
+    def _get_record(self, offset):
+        return self._RECORD.unpack_from(self.shared_memory.buf, self._HEADER_SIZE + offset)
+
+    def _set_record(self, offset, length, state):
+        self._RECORD.pack_into(self.shared_memory.buf, self._HEADER_SIZE + offset, length, state)
+
+    def _record_size(self, length):
+        return self._RECORD.size + length + (-length % 8)
+
+    def put(self, data):
+        if data is None:
+            length, state = 0, self._POISON_PILL
+        elif self._RECORD.size + len(data) > self.capacity:
+            # Data does not fit into the ring buffer, we only write a marker into it
+            self.overflow_queue.put(bytes(data))
+            length, state = 0, self._OVERFLOW
+        else:
+            length, state = len(data), self._WRITING
+
+        record_size = self._record_size(length)
+
+        with self.condition:
+            while True:
+                write_position = self._get(self._WRITE_POSITION)
+                free_space = self.capacity - (write_position - self._get(self._FREE_POSITION))
+                offset = write_position % self.capacity
+
+                # If the record does not fit to the end of the buffer, the rest of the buffer is skipped by writing
+                # a wrap marker, which is released by the consumers like a normal record
+                if record_size > self.capacity - offset:
+                    wrap_size = self.capacity - offset
+                    if free_space >= wrap_size:
+                        self._set_record(offset, wrap_size - self._RECORD.size, self._WRAP)
+                        self._set(self._WRITE_POSITION, write_position + wrap_size)
+                        self.condition.notify_all()
+                        continue
+                elif free_space >= record_size:
+                    break
+                self.condition.wait()
+
+            self._set_record(offset, length, state)
+            self._set(self._WRITE_POSITION, write_position + record_size)
+            self._set(self._UNFINISHED_TASKS, self._get(self._UNFINISHED_TASKS) + 1)
+            self._set(self._QUEUED_ITEMS, self._get(self._QUEUED_ITEMS) + 1)
+            if state != self._WRITING:
+                self.condition.notify_all()
+                return
+
+        # Copy the data outside of the lock, the consumers wait until the record is ready
+        start = self._HEADER_SIZE + offset + self._RECORD.size
+        self.shared_memory.buf[start:start + length] = data
+        with self.condition:
+            self._set_record(offset, length, self._READY)
+            self.condition.notify_all()
+
+    def get(self):
+        with self.condition:
+            while True:
+                read_position = self._get(self._READ_POSITION)
+                if read_position == self._get(self._WRITE_POSITION):
+                    self.condition.wait()
+                    continue
+
+                offset = read_position % self.capacity
+                length, state = self._get_record(offset)
+                if state == self._WRITING:
+                    self.condition.wait()
+                    continue
+
+                self._set(self._READ_POSITION, read_position + self._record_size(length))
+                if state == self._WRAP:
+                    self._release_record(offset, length)
+                    continue
+
+                self._set(self._QUEUED_ITEMS, self._get(self._QUEUED_ITEMS) - 1)
+                if state == self._READY:
+                    self._set_record(offset, length, self._RESERVED + os.getpid())
+                    self.reserved_offset = offset
+                    start = self._HEADER_SIZE + offset + self._RECORD.size
+                    return self.shared_memory.buf[start:start + length]
+
+                # Poison pills and overflow markers are released right away
+                self._release_record(offset, length)
+                if state == self._POISON_PILL:
+                    return None
+                break
+
+        return self.overflow_queue.get()
+
+    def release(self):
+        if self.reserved_offset is None:
+            return
+
+        with self.condition:
+            self._release_record(self.reserved_offset, self._get_record(self.reserved_offset)[0])
+        self.reserved_offset = None
+
+    def reclaim(self, pid):
+        with self.condition:
+            position = self._get(self._FREE_POSITION)
+            read_position = self._get(self._READ_POSITION)
+            while position < read_position:
+                offset = position % self.capacity
+                length, state = self._get_record(offset)
+                if state == self._RESERVED + pid:
+                    self._release_record(offset, length)
+                position += self._record_size(length)
+
+    def _release_record(self, offset, length):
+        """Marks the record as released and moves the free position over all released records. Must be called while
+        holding the lock."""
+        self._set_record(offset, length, self._RELEASED)
+
+        read_position = self._get(self._READ_POSITION)
+        free_position = self._get(self._FREE_POSITION)
+        moved = False
+        while free_position < read_position:
+            free_length, state = self._get_record(free_position % self.capacity)
+            if state != self._RELEASED:
+                break
+            free_position += self._record_size(free_length)
+            moved = True
+
+        if moved:
+            self._set(self._FREE_POSITION, free_position)
+            self.condition.notify_all()
+
+    def task_done(self):
+        with self.condition:
+            unfinished_tasks = self._get(self._UNFINISHED_TASKS)
+            if unfinished_tasks <= 0:
+                raise ValueError('task_done() called too many times')
+            self._set(self._UNFINISHED_TASKS, unfinished_tasks - 1)
+            if unfinished_tasks == 1:
+                self.condition.notify_all()
+
+    def join(self):
+        with self.condition:
+            while self._get(self._UNFINISHED_TASKS) > 0:
+                self.condition.wait()
+
+    def qsize(self):
+        return self._get(self._QUEUED_ITEMS)
+
+    def close(self):
+        self.overflow_queue.close()
+        self.shared_memory.close()
+        self.shared_memory.unlink()
+
+
+TRANSPORTS = {
+    'queue': QueueTransport,
+}
+if shared_memory is not None:
+    TRANSPORTS['shm'] = SharedMemoryTransport
+
+
+def create_transport(transport_identifier, buffer_size=None):
+    """ Creates the transport for the given identifier (see :data:`TRANSPORTS`)
+
+    :param transport_identifier: string identifier of the transport (e.g. **shm**)
+    :param buffer_size: size of the buffer in bytes (only used by transports that have a fixed size buffer)
+    """
+    if transport_identifier not in TRANSPORTS:
+        raise Exception("No transport with identifier %s found" % transport_identifier)
+    if transport_identifier == 'shm' and buffer_size is not None:
+        return SharedMemoryTransport(buffer_size)
+    return TRANSPORTS[transport_identifier]()
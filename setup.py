@@ -15,7 +15,7 @@ setup(
     install_requires=['mongoengine', 'pygit2==0.26.2', 'pymongo==3.12.2', 'pycoshark>=1.2.6'],
     url='https://github.com/smartshark/vcsSHARK',
     download_url='https://github.com/smartshark/vcsSHARK/zipball/master',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     entry_points={
         'console_scripts': [
             'vcsshark = pyvcsshark:start'
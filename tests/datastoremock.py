@@ -4,8 +4,13 @@ Created on 21.01.2016
 @author: fabian
 '''
 
+import argparse
 import multiprocessing
 
+from pyvcsshark.codec import BaseCodec
+from pyvcsshark.config import Config
+from pyvcsshark.datastores.basestore import BaseStore
+
 
 class DatastoreMock(object):
 
@@ -41,3 +46,42 @@ class DatastoreMock(object):
 
     def get_branch_queue(self):
         return self.branch_queue
+
+
+class DiscardStore(BaseStore):
+    """ Datastore, which encodes the commits with the codec of the config (like the
+    :class:`pyvcsshark.datastores.mongostore.MongoStore`), counts and discards them """
+
+    def __init__(self):
+        BaseStore.__init__(self)
+        self.commits = multiprocessing.Value('i', 0)
+
+    @property
+    def store_identifier(self):
+        return 'discard'
+
+    def initialize(self, config, repository_url, repository_type):
+        self.codec = BaseCodec.find_correct_codec(config.commit_codec)
+
+    def add_commit(self, commit_model):
+        self.codec.encode(commit_model)
+        with self.commits.get_lock():
+            self.commits.value += 1
+
+    def add_branch(self, branch_model):
+        return
+
+    def set_commit_references(self, references):
+        return
+
+    def finalize(self):
+        return
+
+
+def create_config(path, db_driver, cores_per_job, codec_identifier, db_hostname='localhost', db_port=27017,
+                  db_database='vcsshark_benchmark', trace_db=None):
+    """ Creates the config of a run, like it is created from the command line """
+    return Config(argparse.Namespace(db_driver=db_driver, db_user=None, db_password=None, db_database=db_database,
+                                     db_hostname=db_hostname, db_port=db_port, db_authentication=None, path=path,
+                                     log_level='WARNING', project_name='benchmark', cores_per_job=cores_per_job,
+                                     ssl=False, commit_codec=codec_identifier, trace_db=trace_db))
@@ -0,0 +1,233 @@
+"""Deterministic generator of synthetic git repositories for the tests and the benchmarks of the parser. The same
+seed and parameters always create the same history (including the revision hashes).
+
+The generated repository has a remote origin with one remote branch per local branch and origin/HEAD pointing to
+origin/master, like a clone, which is what :class:`pyvcsshark.parser.gitparser.GitParser` expects.
+
+Run it from the repository root via::
+
+    python -m tests.repogen /tmp/synthetic --commits 5000 --files 2000 --branches 8 --tags 50
+"""
+import argparse
+import json
+import os
+import random
+
+import pygit2
+
+# The names of the object type constants changed between the pygit2 versions
+GIT_OBJECT_COMMIT = getattr(pygit2, 'GIT_OBJECT_COMMIT', None) or getattr(pygit2, 'GIT_OBJ_COMMIT')
+
+WORDS = ['alpha', 'beta', 'gamma', 'delta', 'return', 'value', 'if', 'else', 'for', 'while', 'self', 'None', '=',
+         '(', ')', '+', '-', 'data', 'result', 'index', 'count', 'name', 'path', 'commit', 'parse', 'store']
+
+
+class RepositorySpec(object):
+    """ Parameters of a synthetic repository. The rates are probabilities per commit.
+
+    :param commits: number of commits (including merges)
+    :param files: number of files of the initial commit
+    :param changes_per_commit: number of files, which are changed by a normal commit
+    :param branches: number of branches (including master)
+    :param tags: number of tags (every second one is annotated)
+    :param rename_rate: probability that a commit renames a file
+    :param copy_rate: probability that a commit copies a file
+    :param binary_rate: probability that a commit adds or changes a binary file
+    :param huge_hunk_rate: probability that a commit adds a huge hunk to a file
+    :param huge_hunk_lines: number of lines of a huge hunk
+    :param merge_rate: probability that a commit of master merges another branch
+    :param octopus_rate: probability that a commit of master merges all other branches at once (octopus merge)
+    :param seed: seed of the random generator
+    """
+
+    def __init__(self, commits=500, files=200, changes_per_commit=3, branches=4, tags=10, rename_rate=0.05,
+                 copy_rate=0.02, binary_rate=0.02, huge_hunk_rate=0.01, huge_hunk_lines=5000, merge_rate=0.05,
+                 octopus_rate=0.01, seed=0):
+        self.commits = commits
+        self.files = files
+        self.changes_per_commit = changes_per_commit
+        self.branches = branches
+        self.tags = tags
+        self.rename_rate = rename_rate
+        self.copy_rate = copy_rate
+        self.binary_rate = binary_rate
+        self.huge_hunk_rate = huge_hunk_rate
+        self.huge_hunk_lines = huge_hunk_lines
+        self.merge_rate = merge_rate
+        self.octopus_rate = octopus_rate
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @staticmethod
+    def add_arguments(parser):
+        """ Adds one argument per parameter to the argument parser """
+        defaults = RepositorySpec()
+        for name, value in sorted(vars(defaults).items()):
+            parser.add_argument('--' + name.replace('_', '-'), type=type(value), default=value,
+                                help='(default: %s)' % value)
+
+    @staticmethod
+    def from_arguments(args):
+        return RepositorySpec(**{name: getattr(args, name) for name in vars(RepositorySpec())})
+
+
+class RepositoryGenerator(object):
+    """ Generates the repository of a :class:`RepositorySpec`. The history is built directly out of blobs, trees
+    and commits (no working directory is checked out). Every branch starts at a commit of master and gets its
+    commits round-robin; merges and octopus merges only happen on master.
+
+    :param path: path of the repository, which must not exist yet
+    :param spec: object of class :class:`RepositorySpec`
+    """
+
+    def __init__(self, path, spec):
+        self.path = path
+        self.spec = spec
+        self.random = random.Random(spec.seed)
+        self.repository = pygit2.init_repository(path, bare=False)
+        self.file_counter = 0
+        self.number_of_commits = 0
+
+        # Tip and index of every branch. The indexes are kept, so that libgit2 only writes the changed trees.
+        self.tips = {}
+        self.indexes = {}
+
+    def generate(self):
+        """ Generates the repository and returns a dictionary with its statistics """
+        spec = self.spec
+        index = pygit2.Index()
+        for i in range(spec.files):
+            self.set_file(index, self.new_path(), self.text(self.random.randint(5, 60)))
+        self.tips['master'] = self.commit([], index, 'Initial commit')
+        self.indexes['master'] = index
+
+        tag_interval = max(spec.commits // max(spec.tags, 1), 1)
+        tagged = 0
+        while self.number_of_commits < spec.commits:
+            branch = self.next_branch()
+            index = self.indexes[branch]
+            parents = [self.tips[branch]]
+            others = [name for name in self.tips if name != branch]
+
+            # Merges keep the tree of master
+            if branch == 'master' and len(others) >= 2 and self.random.random() < spec.octopus_rate:
+                parents += [self.tips[name] for name in others]
+                message = 'Merge branches %s' % ', '.join(others)
+            elif branch == 'master' and others and self.random.random() < spec.merge_rate:
+                other = self.random.choice(others)
+                parents.append(self.tips[other])
+                message = 'Merge branch %s' % other
+            else:
+                self.change(index)
+                message = 'Change %d files\n\n%s' % (spec.changes_per_commit, self.text(2).decode('utf-8'))
+
+            self.tips[branch] = self.commit(parents, index, message)
+
+            if branch == 'master' and tagged < spec.tags and self.number_of_commits >= (tagged + 1) * tag_interval:
+                self.tag('v%d.0' % tagged, self.tips['master'], annotated=tagged % 2 == 1)
+                tagged += 1
+
+        self.create_references()
+        return {'path': self.path, 'commits': self.number_of_commits, 'branches': len(self.tips), 'tags': tagged,
+                'files': len(self.indexes['master'])}
+
+    def next_branch(self):
+        """ Returns the branch of the next commit and creates new branches off master, until all exist """
+        if len(self.tips) < self.spec.branches and self.number_of_commits >= len(self.tips) * 5:
+            name = 'feature%d' % len(self.tips)
+            self.tips[name] = self.tips['master']
+            self.indexes[name] = pygit2.Index()
+            self.indexes[name].read_tree(self.repository[self.tips['master']].tree)
+            return name
+        return sorted(self.tips)[self.number_of_commits % len(self.tips)]
+
+    def change(self, index):
+        """ Changes the files in the index of a branch """
+        rnd = self.random
+        paths = sorted(entry.path for entry in index)
+        for i in range(self.spec.changes_per_commit):
+            path = rnd.choice(paths)
+            lines = self.read_file(index, path).split(b'\n')
+            for j in range(rnd.randint(1, 3)):
+                lines[rnd.randrange(len(lines))] = self.text(1).rstrip(b'\n')
+            self.set_file(index, path, b'\n'.join(lines))
+
+        if rnd.random() < self.spec.rename_rate:
+            path = paths.pop(rnd.randrange(len(paths)))
+            index.add(pygit2.IndexEntry(self.new_path(), index[path].id, pygit2.GIT_FILEMODE_BLOB))
+            index.remove(path)
+        if rnd.random() < self.spec.copy_rate:
+            index.add(pygit2.IndexEntry(self.new_path(), index[rnd.choice(paths)].id, pygit2.GIT_FILEMODE_BLOB))
+        if rnd.random() < self.spec.binary_rate:
+            content = bytes(rnd.randrange(256) for i in range(4096))
+            self.set_file(index, 'assets/blob%d.bin' % rnd.randrange(10), content)
+        if rnd.random() < self.spec.huge_hunk_rate:
+            path = rnd.choice(paths)
+            self.set_file(index, path, self.read_file(index, path) + self.text(self.spec.huge_hunk_lines))
+
+    def read_file(self, index, path):
+        return self.repository[index[path].id].data
+
+    def set_file(self, index, path, content):
+        index.add(pygit2.IndexEntry(path, self.repository.create_blob(content), pygit2.GIT_FILEMODE_BLOB))
+
+    def new_path(self):
+        self.file_counter += 1
+        return 'src/module%d/file%d.py' % (self.file_counter % 20, self.file_counter)
+
+    def text(self, lines):
+        words = WORDS
+        choice = self.random.choice
+        return ''.join(' '.join(choice(words) for i in range(8)) + '\n' for j in range(lines)).encode('utf-8')
+
+    def commit(self, parents, index, message):
+        tree = index.write_tree(self.repository)
+
+        signature = pygit2.Signature('Developer %d' % (self.number_of_commits % 7),
+                                     'dev%d@example.com' % (self.number_of_commits % 7),
+                                     1500000000 + self.number_of_commits * 60, 60)
+        self.number_of_commits += 1
+        return self.repository.create_commit(None, signature, signature, message, tree, parents)
+
+    def tag(self, name, target, annotated):
+        if annotated:
+            tagger = pygit2.Signature('Release Manager', 'release@example.com',
+                                      1500000000 + self.number_of_commits * 60, 60)
+            self.repository.create_tag(name, target, GIT_OBJECT_COMMIT, tagger, 'Release %s\n' % name)
+        else:
+            self.repository.create_reference('refs/tags/%s' % name, target)
+
+    def create_references(self):
+        """ Creates the local and the remote branches and origin/HEAD """
+        self.repository.remotes.create('origin', 'https://example.com/synthetic/%d.git' % self.spec.seed)
+        for name, tip in self.tips.items():
+            self.repository.create_reference('refs/heads/%s' % name, tip, force=True)
+            self.repository.create_reference('refs/remotes/origin/%s' % name, tip)
+        self.repository.create_reference('refs/remotes/origin/HEAD', 'refs/remotes/origin/master')
+        self.repository.set_head('refs/heads/master')
+
+
+def generate_repository(path, spec):
+    """ Generates a repository and returns a dictionary with its statistics
+
+    :param path: path of the repository, which must not exist yet
+    :param spec: object of class :class:`RepositorySpec`
+    """
+    if os.path.exists(path):
+        raise Exception("%s already exists" % path)
+    return RepositoryGenerator(path, spec).generate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generator of synthetic git repositories')
+    parser.add_argument('path', help='Path of the repository, which must not exist yet')
+    RepositorySpec.add_arguments(parser)
+    args = parser.parse_args()
+
+    print(json.dumps(generate_repository(args.path, RepositorySpec.from_arguments(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
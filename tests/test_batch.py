@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from tests.datastoremock import DiscardStore, create_config
+from tests.repogen import RepositorySpec, generate_repository
+from pyvcsshark import metrics
+from pyvcsshark.datastores.basestore import BaseStore
+from pyvcsshark.main import BatchApplication, RepositoryResult
+
+
+class FailingStore(DiscardStore, BaseStore):
+    """ Datastore, which discards the commits and fails at the end of the run of the project broken """
+
+    @property
+    def store_identifier(self):
+        return 'failing'
+
+    def initialize(self, config, repository_url, repository_type):
+        DiscardStore.initialize(self, config, repository_url, repository_type)
+        self.project_name = config.project_name
+
+    def finalize(self):
+        if self.project_name == 'broken':
+            raise Exception("Project broken failed")
+
+
+class QuarantiningStore(DiscardStore, BaseStore):
+    """ Datastore, which kills the diff worker that adds the root commit of the project quarantined """
+
+    @property
+    def store_identifier(self):
+        return 'quarantining'
+
+    def initialize(self, config, repository_url, repository_type):
+        DiscardStore.initialize(self, config, repository_url, repository_type)
+        self.project_name = config.project_name
+
+    def add_commit(self, commit_model):
+        if self.project_name == 'quarantined' and not commit_model.parents:
+            os._exit(1)
+        DiscardStore.add_commit(self, commit_model)
+
+
+class BatchApplicationTest(unittest.TestCase):
+
+    def write_manifest(self, content):
+        handle, path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(handle, 'w') as manifest:
+            manifest.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_read_manifest(self):
+        path = self.write_manifest("# project path\nproject1 /repositories/project1\n\n"
+                                   "  project2\t/repositories/with space  \n")
+        self.assertListEqual([('project1', '/repositories/project1'), ('project2', '/repositories/with space')],
+                             BatchApplication.read_manifest(path))
+
+    def test_read_manifest_without_path(self):
+        path = self.write_manifest("project1 /repositories/project1\nproject2\n")
+        with self.assertRaises(Exception):
+            BatchApplication.read_manifest(path)
+
+    def test_repository_result(self):
+        self.assertTrue(RepositoryResult('project1', '/repositories/project1', 10, 2.0).succeeded)
+        self.assertIn("5.0 commits/s", str(RepositoryResult('project1', '/repositories/project1', 10, 2.0)))
+
+        result = RepositoryResult('project1', '/repositories/project1', None, 0.5, 'Branch not found')
+        self.assertFalse(result.succeeded)
+        self.assertIn("FAILED", str(result))
+
+    def test_partial_repository_result(self):
+        result = RepositoryResult('project1', '/repositories/project1', 10, 2.0, quarantined=2)
+        self.assertFalse(result.succeeded)
+        self.assertTrue(result.partial)
+        self.assertIn("PARTIAL", str(result))
+        self.assertIn("2 tasks were quarantined", str(result))
+        self.assertFalse(RepositoryResult('project1', '/repositories/project1', None, 0.5, 'Failed').partial)
+
+    def test_failed_repository(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = generate_repository(os.path.join(directory, 'repository'), RepositorySpec(commits=30, files=10))['path']
+        manifest_path = self.write_manifest("broken %s\nproject %s\n" % (path, path))
+        threads = set(threading.enumerate())
+
+        batch = BatchApplication(create_config(path, 'failing', 2, 'binary'), manifest_path)
+
+        self.assertEqual(['broken'], [result.project_name for result in batch.failed])
+        self.assertIn("Project broken failed", batch.failed[0].error)
+        self.assertTrue(batch.results[1].succeeded)
+        self.assertEqual(30, batch.results[1].number_of_commits)
+
+        # The supervisor, reporters and collectors of the failed run do not outlive it (the feeder threads of the queues
+        # end, when the queues are collected)
+        self.assertEqual(set(), set(thread for thread in threading.enumerate()
+                                    if thread.is_alive() and thread.name != 'QueueFeederThread') - threads)
+        self.assertIsNone(metrics._counters)
+
+    def test_partial_repository(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = generate_repository(os.path.join(directory, 'repository'), RepositorySpec(commits=30, files=10))['path']
+        manifest_path = self.write_manifest("quarantined %s\nproject %s\n" % (path, path))
+
+        batch = BatchApplication(create_config(path, 'quarantining', 2, 'binary'), manifest_path)
+
+        self.assertEqual(['quarantined'], [result.project_name for result in batch.failed])
+        self.assertTrue(batch.failed[0].partial)
+        self.assertEqual(1, batch.failed[0].quarantined)
+        self.assertTrue(batch.results[1].succeeded)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+from pyvcsshark.codec import BaseCodec
+from pyvcsshark.parser.models import CommitModel, TagModel, PeopleModel, FileModel, Hunk
+
+
+class CodecTest(unittest.TestCase):
+
+    def create_commit(self):
+        people = PeopleModel("Fabian Trautsch", "ftrautsch@googlemail.com")
+        hunks = [Hunk(old_start=1, old_lines=1, new_start=0, new_lines=0, content='-line1\n'),
+                 Hunk(old_start=20, old_lines=1, new_start=19, new_lines=1, content='-line20\n+ä€\n')]
+        test_file = FileModel("lib/lib.txt", 266, 2, 2, False, "M", hunks, None,
+                              "204d306b10e123f2474612a297b83be6ac79e519")
+        binary_file = FileModel("lib.jar", 30747, 0, 0, True, "R", [], "old/lib.jar",
+                                "204d306b10e123f2474612a297b83be6ac79e519")
+        tags = [TagModel("release1", "tag release 1", people, 1453380457, 60), TagModel("light")]
+        return CommitModel("830c29f111f261e26897d42e94c15960a512c0e4", (1 << 70) | 5, tags,
+                           ['204d306b10e123f2474612a297b83be6ac79e519'], people, people, "testCommit",
+                           [test_file, binary_file], 1453380157, 60, 1453380357, -120)
+
+    def assert_commit_equal(self, expected, actual):
+        self.assertEqual(expected.id, actual.id)
+        self.assertEqual(expected.branches, actual.branches)
+        self.assertListEqual(expected.parents, actual.parents)
+        self.assertEqual(expected.author.name, actual.author.name)
+        self.assertEqual(expected.committer.email, actual.committer.email)
+        self.assertEqual(expected.message, actual.message)
+        self.assertEqual(expected.authorDate, actual.authorDate)
+        self.assertEqual(expected.committerDate, actual.committerDate)
+        self.assertEqual(expected.committerOffset, actual.committerOffset)
+
+        self.assertEqual(len(expected.tags), len(actual.tags))
+        for expected_tag, actual_tag in zip(expected.tags, actual.tags):
+            self.assertEqual(expected_tag.name, actual_tag.name)
+            self.assertEqual(expected_tag.message, actual_tag.message)
+            self.assertEqual(expected_tag.taggerDate, actual_tag.taggerDate)
+            self.assertEqual(expected_tag.tagger is None, actual_tag.tagger is None)
+
+        self.assertEqual(len(expected.changedFiles), len(actual.changedFiles))
+        for expected_file, actual_file in zip(expected.changedFiles, actual.changedFiles):
+            for attribute in ['path', 'size', 'linesAdded', 'linesDeleted', 'isBinary', 'mode', 'oldPath',
+                              'parent_revision_hash']:
+                self.assertEqual(getattr(expected_file, attribute), getattr(actual_file, attribute))
+            self.assertEqual(len(expected_file.hunks), len(actual_file.hunks))
+            for expected_hunk, actual_hunk in zip(expected_file.hunks, actual_file.hunks):
+                self.assertEqual(str(expected_hunk), str(actual_hunk))
+
+    def test_codecs_roundtrip(self):
+        commit = self.create_commit()
+        for identifier in BaseCodec.get_codec_choices():
+            codec = BaseCodec.find_correct_codec(identifier)
+            self.assert_commit_equal(commit, codec.decode(codec.encode(commit)))
+
+    def test_binary_decode_from_memoryview(self):
+        codec = BaseCodec.find_correct_codec('binary')
+        data = bytearray(b'\x00' * 8) + codec.encode(self.create_commit())
+        self.assert_commit_equal(self.create_commit(), codec.decode(memoryview(data)[8:]))
+
+    def test_unknown_codec(self):
+        with self.assertRaises(Exception):
+            BaseCodec.find_correct_codec('nonsense')
+
+
+if __name__ == "__main__":
+    unittest.main()
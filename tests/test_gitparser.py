@@ -2,11 +2,46 @@ import unittest
 import logging
 import os
 import datetime
+import shutil
+import tempfile
 
+import pygit2
+
+from tests.repogen import RepositorySpec, generate_repository
+from pyvcsshark.codec import BaseCodec
 from pyvcsshark.parser.gitparser import GitParser
+from pyvcsshark.transport import TRANSPORTS, create_transport
 from tests.datastoremock import DatastoreMock
 
 
+class TransportDatastoreMock(DatastoreMock):
+    """ Datastore, which encodes the commits and puts them into a transport like the mongo store (the shared memory
+    transport, if it is available), without any synchronization of its own """
+
+    def __init__(self):
+        DatastoreMock.__init__(self)
+        self.codec = BaseCodec.find_correct_codec('binary')
+        self.transport = create_transport('shm' if 'shm' in TRANSPORTS else 'queue', 16 * 1024 * 1024)
+        self.retried = []
+
+    def add_commit(self, commitModel):
+        self.transport.put(self.codec.encode(commitModel))
+
+    def set_commit_references(self, references):
+        return
+
+    def add_retried_commit(self, commitModel):
+        self.retried.append(commitModel.id)
+
+    def get_commit_ids(self):
+        commit_ids = []
+        while self.transport.qsize() > 0:
+            commit_ids.append(self.codec.decode(self.transport.get()).id)
+            self.transport.release()
+            self.transport.task_done()
+        return commit_ids
+
+
 class GitParserTest(unittest.TestCase):
 
     parser = None
@@ -56,11 +91,9 @@ class GitParserCommitsTest(GitParserTest):
         self.assertListEqual([], commit1.tags)
 
         # Checking branches
-        list_of_branch_names = []
-        for branchModel in commit1.branches:
-            list_of_branch_names.append(branchModel.name)
+        list_of_branch_names = self.parser.branch_registry.names(commit1.branches)
 
-        self.assertEqual(3, len(commit1.branches))
+        self.assertEqual(3, len(list_of_branch_names))
         self.assertIn("refs/heads/master", list_of_branch_names)
         self.assertIn("refs/remotes/origin/HEAD", list_of_branch_names)
         self.assertIn("refs/remotes/origin/master", list_of_branch_names)
@@ -145,11 +178,9 @@ class GitParserCommitsTest(GitParserTest):
         self.assertListEqual([], commit1.tags)
 
         # Checking branches
-        list_of_branch_names = []
-        for branchModel in commit1.branches:
-            list_of_branch_names.append(branchModel.name)
+        list_of_branch_names = self.parser.branch_registry.names(commit1.branches)
 
-        self.assertEqual(3, len(commit1.branches))
+        self.assertEqual(3, len(list_of_branch_names))
         self.assertIn("refs/heads/master", list_of_branch_names)
         self.assertIn("refs/remotes/origin/HEAD", list_of_branch_names)
         self.assertIn("refs/remotes/origin/master", list_of_branch_names)
@@ -232,11 +263,9 @@ class GitParserCommitsTest(GitParserTest):
         self.assertEqual("test$#.*;ßöä%!&\n", commit1.message)
 
         # Checking branches
-        list_of_branch_names = []
-        for branchModel in commit1.branches:
-            list_of_branch_names.append(branchModel.name)
+        list_of_branch_names = self.parser.branch_registry.names(commit1.branches)
 
-        self.assertEqual(3, len(commit1.branches))
+        self.assertEqual(3, len(list_of_branch_names))
         self.assertIn("refs/heads/master", list_of_branch_names)
         self.assertIn("refs/remotes/origin/HEAD", list_of_branch_names)
         self.assertIn("refs/remotes/origin/master", list_of_branch_names)
@@ -287,11 +316,9 @@ class GitParserCommitsTest(GitParserTest):
         self.assertListEqual([], commit1.tags)
 
         # Checking branches
-        list_of_branch_names = []
-        for branchModel in commit1.branches:
-            list_of_branch_names.append(branchModel.name)
+        list_of_branch_names = self.parser.branch_registry.names(commit1.branches)
 
-        self.assertEqual(3, len(commit1.branches))
+        self.assertEqual(3, len(list_of_branch_names))
         self.assertIn("refs/heads/master", list_of_branch_names)
         self.assertIn("refs/remotes/origin/HEAD", list_of_branch_names)
         self.assertIn("refs/remotes/origin/master", list_of_branch_names)
@@ -350,11 +377,9 @@ class GitParserCommitsTest(GitParserTest):
         self.assertEqual("branch3\n", commit1.message)
 
         # Checking branches
-        list_of_branch_names = []
-        for branchModel in commit1.branches:
-            list_of_branch_names.append(branchModel.name)
+        list_of_branch_names = self.parser.branch_registry.names(commit1.branches)
 
-        self.assertEqual(3, len(commit1.branches))
+        self.assertEqual(3, len(list_of_branch_names))
         self.assertIn("refs/heads/master", list_of_branch_names)
         self.assertIn("refs/remotes/origin/HEAD", list_of_branch_names)
         self.assertIn("refs/remotes/origin/master", list_of_branch_names)
@@ -405,11 +430,9 @@ class GitParserCommitsTest(GitParserTest):
         self.assertListEqual([], commit1.tags)
 
         # Checking branches
-        list_of_branch_names = []
-        for branchModel in commit1.branches:
-            list_of_branch_names.append(branchModel.name)
+        list_of_branch_names = self.parser.branch_registry.names(commit1.branches)
 
-        self.assertEqual(3, len(commit1.branches))
+        self.assertEqual(3, len(list_of_branch_names))
         self.assertIn("refs/heads/master", list_of_branch_names)
         self.assertIn("refs/remotes/origin/HEAD", list_of_branch_names)
         self.assertIn("refs/remotes/origin/master", list_of_branch_names)
@@ -460,11 +483,9 @@ class GitParserCommitsTest(GitParserTest):
         self.assertListEqual([], commit1.tags)
 
         # Checking branches
-        list_of_branch_names = []
-        for branchModel in commit1.branches:
-            list_of_branch_names.append(branchModel.name)
+        list_of_branch_names = self.parser.branch_registry.names(commit1.branches)
 
-        self.assertEqual(3, len(commit1.branches))
+        self.assertEqual(3, len(list_of_branch_names))
         self.assertIn("refs/heads/master", list_of_branch_names)
         self.assertIn("refs/remotes/origin/HEAD", list_of_branch_names)
         self.assertIn("refs/remotes/origin/master", list_of_branch_names)
@@ -519,11 +540,9 @@ class GitParserCommitsTest(GitParserTest):
         self.assertListEqual([], commit1.tags)
 
         # Checking branches
-        list_of_branch_names = []
-        for branchModel in commit1.branches:
-            list_of_branch_names.append(branchModel.name)
+        list_of_branch_names = self.parser.branch_registry.names(commit1.branches)
 
-        self.assertEqual(3, len(commit1.branches))
+        self.assertEqual(3, len(list_of_branch_names))
         self.assertIn("refs/heads/master", list_of_branch_names)
         self.assertIn("refs/remotes/origin/HEAD", list_of_branch_names)
         self.assertIn("refs/remotes/origin/master", list_of_branch_names)
@@ -588,11 +607,9 @@ class GitParserCommitsTest(GitParserTest):
         self.assertListEqual([], commit1.tags)
 
         # Checking branches
-        list_of_branch_names = []
-        for branchModel in commit1.branches:
-            list_of_branch_names.append(branchModel.name)
+        list_of_branch_names = self.parser.branch_registry.names(commit1.branches)
 
-        self.assertEqual(3, len(commit1.branches))
+        self.assertEqual(3, len(list_of_branch_names))
         self.assertIn("refs/heads/master", list_of_branch_names)
         self.assertIn("refs/remotes/origin/HEAD", list_of_branch_names)
         self.assertIn("refs/remotes/origin/master", list_of_branch_names)
@@ -665,11 +682,9 @@ class GitParserCommitsTest(GitParserTest):
         self.assertListEqual([], commit1.tags)
 
         # Checking branches
-        list_of_branch_names = []
-        for branchModel in commit1.branches:
-            list_of_branch_names.append(branchModel.name)
+        list_of_branch_names = self.parser.branch_registry.names(commit1.branches)
 
-        self.assertEqual(3, len(commit1.branches))
+        self.assertEqual(3, len(list_of_branch_names))
         self.assertIn("refs/heads/master", list_of_branch_names)
         self.assertIn("refs/remotes/origin/HEAD", list_of_branch_names)
         self.assertIn("refs/remotes/origin/master", list_of_branch_names)
@@ -752,5 +767,42 @@ class GitParserCommitsTest(GitParserTest):
         self.assertEqual("-test2\n+test3\n", test_file.hunks[0].content)
 
 
+class GitParserWorkersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_commits_are_added_once_by_concurrent_workers(self):
+        path = generate_repository(os.path.join(self.directory, 'repository'),
+                                   RepositorySpec(commits=80, files=20, huge_hunk_rate=0))['path']
+        parser = GitParser()
+        parser.detect(path)
+        parser.initialize()
+        datastore = TransportDatastoreMock()
+        self.addCleanup(datastore.transport.close)
+
+        # The workers add their commits to the datastore at the same time, as there is no lock around add_commit
+        parser.parse(path, datastore, 4)
+
+        repository = pygit2.Repository(path)
+        expected = {str(commit.id) for commit in repository.walk(repository.head.target)}
+        for reference in repository.references:
+            target = repository.references[reference].peel()
+            if isinstance(target, pygit2.Commit):
+                expected.update(str(commit.id) for commit in repository.walk(target.id))
+
+        commit_ids = datastore.get_commit_ids()
+        self.assertGreaterEqual(len(commit_ids), 80)
+        self.assertEqual(len(expected), len(commit_ids))
+        self.assertSetEqual(expected, set(commit_ids))
+
+        # A commit, which was lost together with its storage process, is parsed again and added as retried commit
+        revision_hash = sorted(expected)[0]
+        parser.retry_commit(revision_hash)
+        self.assertListEqual([revision_hash], datastore.retried)
+        self.assertEqual(0, datastore.transport.qsize())
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,54 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyvcsshark.memory import MemoryTracker, deep_size
+from pyvcsshark.pipeline import WorkerPool
+
+
+class AllocatingWorker(multiprocessing.Process):
+
+    def run(self):
+        self.hunks = ['+line %d\n' % i * 10 for i in range(20000)]
+
+
+class MemoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_deep_size(self):
+        commits = {'%040d' % i: {'branches': 1, 'tags': []} for i in range(100)}
+        self.assertGreater(deep_size(commits), deep_size({}) + 100 * deep_size('%040d' % 0))
+
+        # Shared objects are counted once
+        shared = 'x' * 10000
+        self.assertLess(deep_size([shared, shared]), 2 * len(shared))
+
+    def test_report(self):
+        tracker = MemoryTracker(os.path.join(self.directory, 'memory.txt'), interval=0.05)
+        structure = {'a': list(range(1000))}
+        tracker.structures['structure'] = lambda: structure
+        tracker.start()
+
+        worker_pool = WorkerPool()
+        worker_pool.wrappers.append(tracker.wrap)
+        worker_pool.start('diff', AllocatingWorker())
+        worker_pool.join('diff')
+        tracker.checkpoint('parse')
+
+        with open(tracker.stop(), 'r') as f:
+            report = f.read()
+
+        self.assertEqual(1, len(tracker.workers))
+        self.assertEqual('diff', tracker.workers[0]['stage'])
+        self.assertGreater(tracker.workers[0]['traced_peak'], 20000 * 90)
+        self.assertIn('Peak RSS of stage diff', report)
+        self.assertIn('=== Checkpoint parse (main process)', report)
+        self.assertIn('1 entries structure', report)
+        self.assertIn('test_memory.py:14', report)
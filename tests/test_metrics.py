@@ -0,0 +1,120 @@
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from pyvcsshark import metrics
+from pyvcsshark.pipeline import WorkerPool
+
+
+class CountingWorker(multiprocessing.Process):
+
+    def __init__(self, started=None, finish=None):
+        multiprocessing.Process.__init__(self)
+        self.started = started
+        self.finish = finish
+
+    def run(self):
+        for i in range(100):
+            metrics.increment(metrics.COMMITS_PARSED)
+        if self.started is not None:
+            self.started.set()
+            self.finish.wait()
+
+
+class ThreadedCountingWorker(multiprocessing.Process):
+
+    def __init__(self, counters):
+        multiprocessing.Process.__init__(self)
+        self.counters = counters
+
+    def run(self):
+        threads = [threading.Thread(target=self.count) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def count(self):
+        for i in range(1000):
+            self.counters.add(metrics.COMMITS_STORED)
+            self.counters.add('mongo.insert.seconds', 0.5)
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'vcsshark.prom')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_increment_without_exporter(self):
+        metrics.increment(metrics.COMMITS_PARSED)
+
+    def test_counters_of_workers(self):
+        worker_pool = WorkerPool()
+        exporter = metrics.MetricsExporter(self.path, worker_pool, 'project', interval=60)
+        exporter.start()
+
+        for i in range(4):
+            worker_pool.start('diff', CountingWorker())
+        worker_pool.join('diff')
+        exporter.stop()
+
+        self.assertEqual(400, exporter.counters.get(metrics.COMMITS_PARSED))
+        with open(self.path, 'r') as f:
+            self.assertIn('vcsshark_commits_parsed_total{project="project"} 400.0\n', f.read())
+
+        # Afterwards, the increments are not counted anymore
+        metrics.increment(metrics.COMMITS_PARSED)
+        self.assertEqual(400, exporter.counters.get(metrics.COMMITS_PARSED))
+
+    def test_rows_of_processes(self):
+        for rows in (256, 3):
+            counters = metrics.SharedCounters(rows=rows)
+            worker_pool = WorkerPool()
+            for i in range(5):
+                worker_pool.start('write', ThreadedCountingWorker(counters))
+            worker_pool.join('write')
+
+            self.assertEqual(20000, counters.get(metrics.COMMITS_STORED))
+            self.assertEqual(10000, counters.snapshot()['mongo.insert.seconds'])
+            # Every process counted in its own row, unless all rows were claimed
+            self.assertEqual(min(5, rows - 1), counters.claimed_rows.value)
+
+    def test_mongo_commands(self):
+        exporter = metrics.MetricsExporter(self.path, WorkerPool(), 'project')
+        exporter.start()
+        listener = metrics.MongoCommandCounter()
+        listener.succeeded(argparse.Namespace(command_name='insert', duration_micros=2000))
+        listener.succeeded(argparse.Namespace(command_name='insert', duration_micros=1000))
+        listener.failed(argparse.Namespace(command_name='listIndexes', duration_micros=500))
+        exporter.stop()
+
+        lines = exporter.collect()
+        self.assertIn('vcsshark_mongo_operations_total{command="insert",project="project"} 2.0', lines)
+        self.assertIn('vcsshark_mongo_operation_seconds_total{command="insert",project="project"} 0.003', lines)
+        self.assertIn('vcsshark_mongo_operations_total{command="other",project="project"} 1.0', lines)
+        self.assertIn('vcsshark_mongo_failed_operations_total{project="project"} 1.0', lines)
+
+    def test_worker_memory(self):
+        worker_pool = WorkerPool()
+        exporter = metrics.MetricsExporter(self.path, worker_pool, 'project')
+        started = multiprocessing.Event()
+        finish = multiprocessing.Event()
+        worker = worker_pool.start('write', CountingWorker(started, finish))
+        started.wait()
+
+        lines = exporter.collect()
+        finish.set()
+        worker_pool.join('write')
+
+        if not metrics.read_memory(os.getpid()):
+            self.skipTest('/proc is not available')
+        self.assertTrue(any(line.startswith('vcsshark_worker_rss_bytes{project="project",stage="write",worker="%s"}'
+                                            % worker.name) for line in lines))
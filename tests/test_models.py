@@ -0,0 +1,83 @@
+import unittest
+import pickle
+import datetime
+
+from pyvcsshark.parser import models
+from pyvcsshark.parser.models import CommitModel, BranchRegistry, TagModel, PeopleModel, FileModel, Hunk
+from pyvcsshark.parser.svnparser import SVNParser
+from tests.datastoremock import DiscardStore
+
+
+class ModelsTest(unittest.TestCase):
+
+    def tearDown(self):
+        models.set_validation(True)
+
+    def create_commit(self):
+        people = PeopleModel("Fabian Trautsch", "ftrautsch@googlemail.com")
+        hunks = [Hunk(old_start=1, old_lines=1, new_start=0, new_lines=0, content='-line1\n')]
+        test_file = FileModel("lib/lib.txt", 266, 2, 2, False, "M", hunks, None,
+                              "204d306b10e123f2474612a297b83be6ac79e519")
+        return CommitModel("830c29f111f261e26897d42e94c15960a512c0e4", 1,
+                           [TagModel("release1", "tag release 1", people, 1453380457, 60)],
+                           ['204d306b10e123f2474612a297b83be6ac79e519'], people, people, "testCommit", [test_file],
+                           1453380157, 60, 1453380357, 60)
+
+    def test_models_have_no_dict(self):
+        commit = self.create_commit()
+        for model in [commit, commit.author, commit.tags[0], commit.changedFiles[0],
+                      commit.changedFiles[0].hunks[0]]:
+            self.assertFalse(hasattr(model, '__dict__'))
+
+    def test_validation(self):
+        commit = self.create_commit()
+        with self.assertRaises(Exception):
+            commit.changedFiles = ["lib/lib.txt"]
+        with self.assertRaises(Exception):
+            commit.author = "Fabian Trautsch"
+
+    def test_validation_disabled(self):
+        models.set_validation(False)
+        commit = self.create_commit()
+        commit.author = "Fabian Trautsch"
+        self.assertEqual("Fabian Trautsch", commit.author)
+
+    def test_dates_are_converted_lazily(self):
+        commit = self.create_commit()
+        self.assertEqual(1453380157, commit.authorTimestamp)
+        self.assertEqual(datetime.datetime.utcfromtimestamp(1453380157), commit.authorDate)
+        self.assertEqual(datetime.datetime.utcfromtimestamp(1453380357), commit.committerDate)
+        self.assertEqual(datetime.datetime.utcfromtimestamp(1453380457), commit.tags[0].taggerDate)
+
+        commit.authorDate = None
+        self.assertIsNone(commit.authorDate)
+        self.assertIsNone(TagModel("light").taggerDate)
+
+    def test_branch_registry(self):
+        registry = BranchRegistry()
+        self.assertEqual(0, registry.get_id('refs/heads/master'))
+        self.assertEqual(1, registry.get_id('refs/heads/feature'))
+        self.assertEqual(0, registry.get_id('refs/heads/master'))
+        self.assertEqual(2, len(registry))
+
+        bitmap = registry.get_bit('refs/heads/feature') | registry.get_bit('refs/heads/master')
+        self.assertListEqual(['refs/heads/master', 'refs/heads/feature'], registry.names(bitmap))
+        self.assertListEqual([], registry.names(0))
+        self.assertEqual('refs/heads/feature', registry.get_name(1))
+
+    def test_default_branch_registry(self):
+        first_store, second_store = DiscardStore(), DiscardStore()
+        self.assertIsInstance(first_store.branch_registry, BranchRegistry)
+        self.assertIsNot(first_store.branch_registry, second_store.branch_registry)
+        self.assertEqual(0, len(SVNParser().branch_registry))
+
+    def test_pickle(self):
+        commit = pickle.loads(pickle.dumps(self.create_commit()))
+        self.assertEqual("830c29f111f261e26897d42e94c15960a512c0e4", commit.id)
+        self.assertEqual("Fabian Trautsch", commit.author.name)
+        self.assertEqual("-line1\n", commit.changedFiles[0].hunks[0].content)
+        self.assertEqual("release1", commit.tags[0].name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,14 +1,24 @@
 import unittest
 import logging
 import configparser
+import multiprocessing
 import os
 import datetime
 from pymongo import MongoClient
+import shutil
+import tempfile
 import uuid
 
+from pycoshark.mongomodels import Commit, FileAction, Hunk as MongoHunk
+
+from pyvcsshark import tracing
+from pyvcsshark.codec import BaseCodec
 from pyvcsshark.config import Config
-from pyvcsshark.datastores.mongostore import MongoStore
-from pyvcsshark.parser.models import CommitModel, BranchModel, TagModel,\
+from pyvcsshark.main import Application
+from pyvcsshark.datastores.mongostore import MongoStore, CommitJournal, CommitStorageProcess, get_hunks
+from pyvcsshark.pipeline import OrderingStage, Supervisor, TaskSlot, WorkerPool
+from pyvcsshark.transport import QueueTransport
+from pyvcsshark.parser.models import CommitModel, BranchRegistry, TagModel,\
     PeopleModel, FileModel, Hunk
 
 
@@ -29,8 +39,126 @@ class ArgparserMock(object):
         self.cores_per_job = cores_per_job
 
 
+class RecordingJournal(CommitJournal):
+    """ Journal, which checks that a commit is stored completely, when it is added """
+
+    def __init__(self, vcs_system_id, test, batch_size=100):
+        CommitJournal.__init__(self, vcs_system_id, batch_size)
+        self.test = test
+        self.added = []
+
+    def add(self, revision_hash):
+        commit = Commit.objects(vcs_system_id=self.vcs_system_id, revision_hash=revision_hash).get()
+        self.test.assertEqual('message of %s' % revision_hash, commit.message)
+        self.added.append(revision_hash)
+        CommitJournal.add(self, revision_hash)
+
+
+class RecordingStorageProcess(CommitStorageProcess):
+    """ Storage process, which checks the state of the commit in the mongodb, after its file actions were created """
+
+    test = None
+
+    def create_file_actions(self, files, mongo_commit_id):
+        CommitStorageProcess.create_file_actions(self, files, mongo_commit_id)
+        commit = Commit.objects(id=mongo_commit_id).get()
+
+        # The file actions and their hunks are stored before the commit document is saved
+        file_action_ids = [file_action.id for file_action in FileAction.objects(commit_id=mongo_commit_id)]
+        self.test.assertEqual(len(files), len(file_action_ids))
+        self.test.assertEqual(2 * len(files), MongoHunk.objects(file_action_id__in=file_action_ids).count())
+        self.test.assertIsNone(commit.message)
+
+        # The commit is published as in flight, until it is done
+        self.test.assertIn(commit.revision_hash, self.task_slot.get())
+
+
+class RecordingTaskSlot(object):
+    """ Task slot, which records the maximal number of tasks it held """
+
+    def __init__(self, task_slot, maximum):
+        self.task_slot = task_slot
+        self.maximum = maximum
+
+    def set(self, tasks):
+        self.maximum.value = max(self.maximum.value, len(tasks))
+        self.task_slot.set(tasks)
+
+    def get(self):
+        return self.task_slot.get()
+
+
+class DyingStorageProcess(CommitStorageProcess):
+    """ Storage process, which dies after it decoded a commit and before it stores it """
+
+    maximum = None
+
+    def run(self):
+        self.task_slot = RecordingTaskSlot(self.task_slot, self.maximum)
+        CommitStorageProcess.run(self)
+
+    def store_commit(self, commit):
+        os._exit(1)
+
+
+class CommitStorageProcessFailureTest(unittest.TestCase):
+
+    def test_worker_dies_between_decode_and_store(self):
+        config = Config(ArgparserMock('mongo', None, None, 'vcsshark_test', 'localhost', 27017, None, '..', 'ERROR',
+                                      'testproject', False, 2))
+        codec = BaseCodec.find_correct_codec(config.commit_codec)
+        queue = QueueTransport()
+        DyingStorageProcess.maximum = multiprocessing.Value('i', 0)
+        worker_pool = WorkerPool()
+        worker_pool.register('write', queue, lambda i: DyingStorageProcess(queue, None, None, config,
+                                                                           "StorageProcess-%d" % i, BranchRegistry(),
+                                                                           codec))
+        worker_pool.scale_up('write')
+
+        retried = []
+        supervisor = Supervisor(worker_pool, max_retries=1, interval=0.05)
+        supervisor.set_retry_handler('write', retried.append)
+        supervisor.start()
+
+        people = PeopleModel("Fabian Trautsch", "ftrautsch@googlemail.com")
+        queue.put(codec.encode(CommitModel("830c29f111f261e26897d42e94c15960a512c0e4", 0, [], [], people, people,
+                                           "testCommit", [], 1453380157, 60, 1453380357, 60)))
+
+        # The commit is marked as done once by the supervisor, so that waiting for the queue returns
+        queue.join()
+        worker_pool.stop('write', queue)
+        supervisor.stop()
+
+        self.assertEqual(1, supervisor.failures)
+        self.assertListEqual(["830c29f111f261e26897d42e94c15960a512c0e4"], retried)
+        # The unknown task of the queue was replaced by the commit, the slot never held both
+        self.assertEqual(1, DyingStorageProcess.maximum.value)
+        self.assertEqual(0, queue.queue._unfinished_tasks.get_value())
+
+
+class MongoStoreRetryTest(unittest.TestCase):
+
+    def test_retried_commit_bypasses_ordering_stage(self):
+        people = PeopleModel("Fabian Trautsch", "ftrautsch@googlemail.com")
+        commit = CommitModel("830c29f111f261e26897d42e94c15960a512c0e4", 0, [], [], people, people, "testCommit", [],
+                             1453380157, 60, 1453380357, 60)
+        mongo_store = MongoStore()
+        mongo_store.codec = BaseCodec.find_correct_codec('binary')
+        mongo_store.commit_queue = QueueTransport()
+        mongo_store.ordering_stage = OrderingStage([commit.id])
+
+        # The supervisor marks the lost commit as done right after the retry, therefore it must already be queued
+        mongo_store.add_retried_commit(commit)
+        self.assertEqual(commit.id, mongo_store.codec.decode(mongo_store.commit_queue.get()).id)
+        self.assertTrue(mongo_store.ordering_stage.queue.empty())
+
+
 class Test(unittest.TestCase):
 
+    # Upper bound of the round trips to the mongodb per commit of the test repository (at most three changed files
+    # and two tags per commit)
+    MAX_OPERATIONS_PER_COMMIT = 40
+
     config = None
     mongo_store = None
     project_url = None
@@ -64,10 +192,17 @@ class Test(unittest.TestCase):
         self.mongo_client[self.config.db_database].project.insert_one({"name": "testproject"})
 
         # Initialize mongo store
-        self.mongo_store = MongoStore()
         self.project_name = str(uuid.uuid4())
         self.project_url = "local/" + self.project_name
-        self.mongo_store.initialize(self.config, self.project_url, "git")
+        self.mongo_store = self.create_store()
+
+    def create_store(self):
+        mongo_store = MongoStore()
+        # The storage processes get a copy of the registry, when they are started in initialize
+        mongo_store.branch_registry.get_id('refs/heads/master')
+        mongo_store.branch_registry.get_id('refs/heads/testbranch1')
+        mongo_store.initialize(self.config, self.project_url, "git")
+        return mongo_store
 
     def test_storeIdentifier(self):
         self.assertEqual("mongo", self.mongo_store.store_identifier)
@@ -79,8 +214,8 @@ class Test(unittest.TestCase):
         people = PeopleModel("Fabian Trautsch", "ftrautsch@googlemail.com")
 
         # Create branches
-        branch1 = BranchModel('refs/heads/master')
-        branch2 = BranchModel('refs/heads/testbranch1')
+        branches = self.mongo_store.branch_registry.get_bit('refs/heads/master') | \
+            self.mongo_store.branch_registry.get_bit('refs/heads/testbranch1')
 
         # Create tag
         tag = TagModel("release1", "tag release 1", people, 1453380457, 60)
@@ -92,7 +227,7 @@ class Test(unittest.TestCase):
         test_file = FileModel("lib/lib.txt", 266, 2, 2, False, "M", hunks, None,
                               "204d306b10e123f2474612a297b83be6ac79e519")
 
-        commit = CommitModel("830c29f111f261e26897d42e94c15960a512c0e4", {branch1, branch2}, [tag],
+        commit = CommitModel("830c29f111f261e26897d42e94c15960a512c0e4", branches, [tag],
                              ['204d306b10e123f2474612a297b83be6ac79e519'], people, people, "testCommit", [test_file],
                              1453380157, 60, 1453380357, 60)
 
@@ -209,6 +344,113 @@ class Test(unittest.TestCase):
         self.assertEqual(datetime.datetime.utcfromtimestamp(1453380457), tag['date'])
         self.assertEqual(60, tag['date_offset'])
 
+    def test_addCommit_deduplicated_hunks(self):
+        self.config.dedup_hunks = True
+        try:
+            self.mongo_store = self.create_store()
+            self.addingCommit()
+        finally:
+            self.config.dedup_hunks = False
+
+        db = self.mongo_client[self.config.db_database]
+        self.assertEqual(3, db.hunk.count_documents({}))
+        self.assertEqual(3, db.hunk_content.count_documents({}))
+        self.assertEqual(0, db.hunk.count_documents({'content': {'$exists': True}}))
+
+        file_action = db.file_action.find_one()
+        hunks = sorted(get_hunks(file_action['_id']), key=lambda hunk: hunk.old_start)
+        self.assertListEqual(["-line1\n", "-line20\n+\n", "+line41\n"], [hunk.content for hunk in hunks])
+
+    def test_commitJournal(self):
+        journal = CommitJournal(self.mongo_store.vcs_system_id, batch_size=2)
+        journal.add("830c29f111f261e26897d42e94c15960a512c0e4")
+        self.assertSetEqual(set(), CommitJournal.load(self.mongo_store.vcs_system_id))
+
+        journal.add("204d306b10e123f2474612a297b83be6ac79e519")
+        self.assertSetEqual({"830c29f111f261e26897d42e94c15960a512c0e4", "204d306b10e123f2474612a297b83be6ac79e519"},
+                            self.mongo_store.get_journaled_commits(self.config, self.project_url))
+
+        # A completed run clears the journal
+        self.mongo_store.finalize()
+        self.assertSetEqual(set(), CommitJournal.load(self.mongo_store.vcs_system_id))
+
+    def test_storeCommitsWithIoThreads(self):
+        people = PeopleModel("Fabian Trautsch", "ftrautsch@googlemail.com")
+        commits = []
+        for i in range(40):
+            revision_hash = '%040x' % (i + 1)
+            files = [FileModel("lib/file%d-%d.txt" % (i, j), 10, 2, 0, False, "A",
+                               [Hunk(0, 0, 1, 1, '+line%d\n' % j), Hunk(0, 0, 5, 1, '+line%d\n' % j)], None,
+                               '%040x' % i) for j in range(3)]
+            commits.append(CommitModel(revision_hash, 0, [], ['%040x' % i], people, people,
+                                       "message of %s" % revision_hash, files, 1453380157 + i, 60, 1453380357 + i,
+                                       60))
+
+        queue = QueueTransport()
+        codec = BaseCodec.find_correct_codec(self.config.commit_codec)
+        process = RecordingStorageProcess(queue, self.mongo_store.vcs_system_id, None, self.config,
+                                          "StorageProcess-test", self.mongo_store.branch_registry, codec)
+        process.io_threads = 4
+        process.test = self
+        process.task_slot = TaskSlot()
+        process.journal = RecordingJournal(self.mongo_store.vcs_system_id, self, batch_size=7)
+        for commit in commits:
+            queue.put(codec.encode(commit))
+        queue.put(None)
+
+        # The process is run in the test, errors of its io threads (e.g., of the checks above) are raised by run
+        process.run()
+
+        # Every commit was marked as done exactly once
+        self.assertEqual(0, queue.queue._unfinished_tasks.get_value())
+        self.assertListEqual([], process.task_slot.get())
+
+        # Every commit is stored once and in the journal
+        revision_hashes = [commit.id for commit in commits]
+        self.assertListEqual(sorted(revision_hashes), sorted(process.journal.added))
+        self.assertSetEqual(set(revision_hashes), CommitJournal.load(self.mongo_store.vcs_system_id))
+        db = self.mongo_client[self.config.db_database]
+        self.assertEqual(40, db.commit.count_documents({}))
+        self.assertEqual(120, db.file_action.count_documents({}))
+        self.assertEqual(240, db.hunk.count_documents({}))
+
+    def test_setCommitReferences(self):
+        # The commit is added without branches and tags, as during a streaming walk
+        people = PeopleModel("Fabian Trautsch", "ftrautsch@googlemail.com")
+        commit = CommitModel("830c29f111f261e26897d42e94c15960a512c0e4", 0, [], [], people, people, "testCommit", [],
+                             1453380157, 60, 1453380357, 60)
+        self.mongo_store.add_commit(commit)
+
+        branches = self.mongo_store.branch_registry.get_bit('refs/heads/master')
+        self.mongo_store.set_commit_references({"830c29f111f261e26897d42e94c15960a512c0e4": {
+            'branches': branches, 'tags': [TagModel("release1", "tag release 1", people, 1453380457, 60)]}})
+        self.mongo_store.finalize()
+
+        db = self.mongo_client[self.config.db_database]
+        commit = db.commit.find_one()
+        self.assertListEqual(['refs/heads/master'], commit['branches'])
+        tag = db.tag.find_one()
+        self.assertEqual('release1', tag['name'])
+        self.assertEqual(commit['_id'], tag['commit_id'])
+
+    def test_roundTripsPerCommit(self):
+        # Catches regressions in the number of operations of create_file_actions, create_people and create_tags
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        args = ArgparserMock('mongo', self.config.db_user, self.config.db_password, self.config.db_database,
+                             self.config.db_hostname, self.config.db_port, self.config.db_authentication,
+                             os.path.dirname(os.path.realpath(__file__)) + "/data/testdatarepository", 'ERROR',
+                             'testproject', False, 2)
+        args.trace_db = os.path.join(directory, 'trace.txt')
+        args.trace_db_threshold = self.MAX_OPERATIONS_PER_COMMIT
+
+        application = Application(Config(args))
+        trace = application.database_trace
+
+        self.assertEqual(application.number_of_commits, trace['commits'])
+        self.assertLessEqual(tracing.max_operations_per_commit(trace), self.MAX_OPERATIONS_PER_COMMIT)
+        self.assertListEqual([], trace['flagged'])
+
 
 if __name__ == "__main__":
     unittest.main()
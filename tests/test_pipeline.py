@@ -0,0 +1,361 @@
+import multiprocessing
+import os
+import threading
+import unittest
+
+from pyvcsshark.pipeline import Autoscaler, OrderingStage, Supervisor, TaskSlot, WorkerPlan, WorkerPool
+
+
+def work(queue):
+    while queue.get() is not None:
+        pass
+
+
+def work_after(queue, event):
+    event.wait()
+    work(queue)
+
+
+class ExitWaitingQueue(object):
+    """ Queue, whose put of a poison pill returns only after the given worker exited and then sets the event """
+
+    def __init__(self, queue, worker, event):
+        self.queue = queue
+        self.worker = worker
+        self.event = event
+
+    def put(self, task):
+        self.queue.put(task)
+        if task is None:
+            self.worker.join(10)
+            self.event.set()
+
+
+class ScalableWorker(multiprocessing.Process):
+    stage_control = None
+    task_slot = None
+
+    def __init__(self, queue, done, crashed=None):
+        multiprocessing.Process.__init__(self)
+        self.queue = queue
+        self.done = done
+        self.crashed = crashed
+
+    def run(self):
+        while not (self.stage_control is not None and self.stage_control.leave()):
+            task = self.queue.get()
+            if task is None:
+                self.queue.task_done()
+                break
+            if self.task_slot is not None:
+                self.task_slot.set([task])
+
+            # Simulate a worker that gets killed while it processes the task
+            if task == 'crash-always' or (task == 'crash-once' and not self.crashed.is_set()):
+                self.crashed.set()
+                os._exit(1)
+
+            self.done.put(task)
+            if self.task_slot is not None:
+                self.task_slot.set([])
+            self.queue.task_done()
+
+
+class WorkerPlanTest(unittest.TestCase):
+
+    def test_automatic_balancing(self):
+        plan = WorkerPlan(4)
+        self.assertEqual(2, plan.diff_workers)
+        self.assertEqual(2, plan.write_workers)
+
+        plan = WorkerPlan(5)
+        self.assertEqual(3, plan.diff_workers)
+        self.assertEqual(2, plan.write_workers)
+
+    def test_minimum_of_one_worker_per_stage(self):
+        plan = WorkerPlan(1)
+        self.assertEqual(1, plan.diff_workers)
+        self.assertEqual(1, plan.write_workers)
+
+    def test_configured_stage_gets_remaining_cores(self):
+        plan = WorkerPlan(8, diff_workers=6)
+        self.assertEqual(6, plan.diff_workers)
+        self.assertEqual(2, plan.write_workers)
+
+        plan = WorkerPlan(8, write_workers=3)
+        self.assertEqual(5, plan.diff_workers)
+        self.assertEqual(3, plan.write_workers)
+
+    def test_budget_exceeded(self):
+        with self.assertRaises(Exception):
+            WorkerPlan(4, diff_workers=3, write_workers=3)
+        with self.assertRaises(Exception):
+            WorkerPlan(4, diff_workers=0)
+
+
+class WorkerPoolTest(unittest.TestCase):
+
+    def test_start_and_stop(self):
+        pool = WorkerPool()
+        queue = multiprocessing.Queue()
+        for i in range(2):
+            pool.start('diff', multiprocessing.Process(target=work, args=(queue,)))
+        self.assertEqual(2, len(pool.workers('diff')))
+        self.assertEqual(0, len(pool.workers('write')))
+
+        pool.stop('diff', queue)
+        self.assertEqual(0, len(pool.workers('diff')))
+
+    def test_stop_after_a_worker_took_the_first_pill(self):
+        pool = WorkerPool()
+        queue = multiprocessing.Queue()
+        event = multiprocessing.Event()
+        waiting = pool.start('diff', multiprocessing.Process(target=work_after, args=(queue, event)))
+        reading = pool.start('diff', multiprocessing.Process(target=work, args=(queue,)))
+        self.addCleanup(waiting.terminate)
+
+        # The reading worker takes the first pill and exits, before the pool looks at it
+        stopper = threading.Thread(target=pool.stop, args=('diff', ExitWaitingQueue(queue, reading, event)))
+        stopper.daemon = True
+        stopper.start()
+        stopper.join(10)
+        self.assertFalse(stopper.is_alive())
+        self.assertFalse(waiting.is_alive())
+
+    def test_scale(self):
+        pool = WorkerPool()
+        queue = multiprocessing.JoinableQueue()
+        done = multiprocessing.Queue()
+        pool.register('diff', queue, lambda i: ScalableWorker(queue, done))
+        for i in range(3):
+            self.assertTrue(pool.scale_up('diff'))
+        self.assertEqual(3, pool.size('diff'))
+
+        self.assertTrue(pool.scale_down('diff'))
+        self.assertTrue(pool.scale_down('diff'))
+        self.assertEqual(1, pool.size('diff'))
+
+        # The last worker of a stage stays
+        self.assertFalse(pool.scale_down('diff'))
+
+        tasks = ['task%d' % i for i in range(10)]
+        for task in tasks:
+            queue.put(task)
+        queue.join()
+        self.assertListEqual(tasks, sorted(done.get() for task in tasks))
+
+        pool.stop('diff', queue)
+        self.assertEqual(0, len(pool.workers('diff')))
+        self.assertFalse(pool.scale_up('diff'))
+
+    def test_move(self):
+        pool = WorkerPool()
+        queues = {'diff': multiprocessing.JoinableQueue(), 'write': multiprocessing.JoinableQueue()}
+        done = multiprocessing.Queue()
+        for stage, queue in queues.items():
+            pool.register(stage, queue, lambda i, queue=queue: ScalableWorker(queue, done))
+            pool.scale_up(stage)
+            pool.scale_up(stage)
+
+        self.assertTrue(pool.move('diff', 'write'))
+        self.assertEqual(1, pool.size('diff'))
+        self.assertEqual(3, pool.size('write'))
+        self.assertFalse(pool.move('diff', 'write'))
+
+        for stage, queue in queues.items():
+            pool.stop(stage, queue)
+
+
+class SupervisorTest(unittest.TestCase):
+
+    def test_retry_and_quarantine(self):
+        pool = WorkerPool()
+        queue = multiprocessing.JoinableQueue()
+        # The results must not be buffered in the crashing workers
+        done = multiprocessing.SimpleQueue()
+        crashed = multiprocessing.Event()
+        pool.register('diff', queue, lambda i: ScalableWorker(queue, done, crashed))
+        pool.scale_up('diff')
+        pool.scale_up('diff')
+
+        supervisor = Supervisor(pool, max_retries=1, interval=0.05)
+        supervisor.start()
+        tasks = ['task%d' % i for i in range(10)] + ['crash-once', 'crash-always']
+        for task in tasks:
+            queue.put(task)
+
+        # Waiting for the queue must not hang, although tasks were lost together with their workers
+        queue.join()
+        pool.stop('diff', queue)
+        supervisor.stop()
+
+        results = [done.get() for i in range(len(tasks) - 1)]
+        self.assertTrue(done.empty())
+        self.assertListEqual(sorted(tasks[:-1]), sorted(results))
+        self.assertListEqual([('diff', 'crash-always')], supervisor.quarantined)
+        self.assertEqual(3, supervisor.failures)
+
+    def test_failure_of_one_worker_does_not_stop_the_others(self):
+        queue = multiprocessing.JoinableQueue()
+        queue.put('task1')
+        queue.put('task2')
+        queue.get()
+        queue.get()
+        pool = ScalablePoolStub(queue, [DeadWorker('Worker-1', ['task1']), DeadWorker('Worker-2', ['task2'])])
+        supervisor = Supervisor(pool, max_retries=0)
+
+        # The replacement of the first worker can not be started, the second worker is handled anyway
+        with self.assertLogs('main', 'ERROR') as logs:
+            supervisor.check()
+        self.assertEqual(2, supervisor.failures)
+        self.assertListEqual([('diff', 'task2')], supervisor.quarantined)
+        self.assertIn('handling the failure of worker Worker-1 of stage diff failed', '\n'.join(logs.output))
+
+        # Both workers are handled only once
+        supervisor.check()
+        self.assertEqual(2, supervisor.failures)
+
+
+class DeadWorker(object):
+    exitcode = -9
+    pid = 0
+
+    def __init__(self, name, tasks):
+        self.name = name
+        self.task_slot = TaskSlot()
+        self.task_slot.set(tasks)
+
+
+class ScalablePoolStub(object):
+
+    def __init__(self, queue, processes):
+        self.scalable_stages = {'diff': queue}
+        self.processes = processes
+        self.scaled_up = 0
+
+    def scalable_workers(self, stage):
+        return self.scalable_stages[stage], self.processes
+
+    def scale_up(self, stage):
+        self.scaled_up += 1
+        if self.scaled_up == 1:
+            raise OSError('Cannot fork')
+        return True
+
+    def status(self):
+        return {}
+
+
+class PoolStub(object):
+
+    def __init__(self, diff_depth, write_depth):
+        self.depths = {'diff': diff_depth, 'write': write_depth}
+        self.sizes = {'diff': 2, 'write': 2}
+
+    def queue_depth(self, stage):
+        return self.depths[stage]
+
+    def size(self, stage):
+        return self.sizes[stage]
+
+    def move(self, from_stage, to_stage):
+        self.sizes[from_stage] -= 1
+        self.sizes[to_stage] += 1
+        return True
+
+
+class AutoscalerTest(unittest.TestCase):
+
+    def test_store_bound(self):
+        pool = PoolStub(0, 50)
+        autoscaler = Autoscaler(pool)
+        autoscaler.balance()
+        self.assertDictEqual({'diff': 1, 'write': 3}, pool.sizes)
+
+        # After a move, the autoscaler waits before it decides again
+        autoscaler.balance()
+        self.assertEqual(1, autoscaler.moves)
+
+    def test_diff_bound(self):
+        pool = PoolStub(50, 1)
+        autoscaler = Autoscaler(pool)
+        autoscaler.balance()
+        self.assertDictEqual({'diff': 3, 'write': 1}, pool.sizes)
+
+    def test_balanced(self):
+        pool = PoolStub(50, 10)
+        autoscaler = Autoscaler(pool)
+        autoscaler.balance()
+        self.assertEqual(0, autoscaler.moves)
+
+    def test_stage_not_running(self):
+        pool = PoolStub(None, 50)
+        autoscaler = Autoscaler(pool)
+        autoscaler.balance()
+        self.assertEqual(0, autoscaler.moves)
+
+
+class OrderingStageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.released = []
+        self.watermarks = []
+        self.stage = OrderingStage(['a', 'b', 'c', 'd'], window=2)
+        self.stage.start(self.released.append, lambda position, revision_hash: self.watermarks.append(
+            (position, revision_hash)))
+
+    def test_release_in_order(self):
+        self.stage.buffer_commit('b', b'B')
+        self.stage.buffer_commit('c', b'C')
+        self.assertListEqual([], self.released)
+
+        self.stage.buffer_commit('a', b'A')
+        self.assertListEqual([b'A', b'B', b'C'], self.released)
+        self.assertEqual(3, self.stage.released)
+        self.assertEqual(3, self.stage.max_buffered)
+
+        # Commits, which were already released or are not part of the order, are released right away
+        self.stage.buffer_commit('a', b'A')
+        self.stage.buffer_commit('x', b'X')
+        self.assertListEqual([b'A', b'B', b'C', b'A', b'X'], self.released)
+        self.stage.stop()
+
+    def test_skip(self):
+        self.stage.buffer_commit('b', b'B')
+        self.stage.buffer_commit('a', None)
+        self.assertListEqual([b'B'], self.released)
+
+        # The watermark does not pass the skipped commit
+        self.stage.mark_stored('b')
+        self.stage.stop()
+        self.assertEqual(-1, self.stage.watermark)
+        self.assertListEqual([], self.watermarks)
+
+    def test_watermark(self):
+        self.stage.WATERMARK_INTERVAL = 3600
+        self.stage.mark_stored('b')
+        self.assertEqual(-1, self.stage.watermark)
+        self.stage.mark_stored('a')
+        self.stage.mark_stored('d')
+        self.assertEqual(1, self.stage.watermark)
+
+        # The messages of the workers are processed by the thread
+        self.stage.stored('c')
+        self.stage.stop()
+        self.assertEqual(3, self.stage.watermark)
+        self.assertListEqual([(1, 'b'), (3, 'd')], self.watermarks)
+
+    def test_dispatch_window(self):
+        self.stage.wait_for_dispatch(1)
+        self.stage.add('a', b'A')
+        self.stage.add('b', b'B')
+        self.stage.wait_for_dispatch(3)
+        self.stage.add('d', b'D')
+        self.stage.add('c', b'C')
+        self.stage.drain()
+        self.stage.stop()
+        self.assertListEqual([b'A', b'B', b'C', b'D'], self.released)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import concurrent.futures
+import multiprocessing
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import unittest
+
+from pyvcsshark.pipeline import WorkerPool
+from pyvcsshark.profiling import WorkerProfiler
+
+
+def busy_function(seconds):
+    end_time = time.time() + seconds
+    while time.time() < end_time:
+        sum(range(1000))
+
+
+class BusyWorker(multiprocessing.Process):
+
+    def run(self):
+        busy_function(0.2)
+
+
+def threaded_busy_function(seconds):
+    busy_function(seconds)
+
+
+class ThreadedWorker(multiprocessing.Process):
+
+    def run(self):
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            for future in [executor.submit(threaded_busy_function, 0.1) for i in range(4)]:
+                future.result()
+
+
+class ProfilingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_workers(self, profiler):
+        worker_pool = WorkerPool()
+        worker_pool.wrappers.append(profiler.wrap)
+        for stage in ['diff', 'diff', 'write']:
+            worker_pool.start(stage, BusyWorker())
+        worker_pool.join('diff')
+        worker_pool.join('write')
+
+    def test_cprofile(self):
+        profiler = WorkerProfiler(self.directory)
+        self.run_workers(profiler)
+
+        profiles = profiler.profiles()
+        self.assertEqual(['diff', 'write'], sorted(profiles))
+        self.assertEqual(2, len(profiles['diff']))
+
+        with open(profiler.report(), 'r') as f:
+            report = f.read()
+        self.assertIn('=== Stage diff: 2 workers (cprofile) ===', report)
+        self.assertIn('busy_function', report)
+
+    def test_cprofile_of_threads(self):
+        profiler = WorkerProfiler(self.directory)
+        worker_pool = WorkerPool()
+        worker_pool.wrappers.append(profiler.wrap)
+        worker_pool.start('write', ThreadedWorker())
+        worker_pool.join('write')
+
+        # The functions, which only run in the threads of the worker, are profiled as well
+        stats = pstats.Stats(*profiler.profiles()['write'])
+        calls = {function[2]: stat[1] for function, stat in stats.stats.items()}
+        self.assertEqual(4, calls['threaded_busy_function'])
+        self.assertIn('run', calls)
+
+    def test_sampling(self):
+        profiler = WorkerProfiler(self.directory, 'sampling', 0.005)
+        self.run_workers(profiler)
+
+        with open(profiler.report(), 'r') as f:
+            report = f.read()
+        self.assertIn('=== Stage write: 1 workers (sampling) ===', report)
+        self.assertIn('busy_function', report)
+
+        stacks = WorkerProfiler.read_stacks(os.path.join(self.directory, '%s.folded' % profiler.run_id))
+        self.assertTrue(any('busy_function (' in stack for stack in stacks))
+
+    def test_no_profiles(self):
+        self.assertIsNone(WorkerProfiler(self.directory).report())
@@ -0,0 +1,80 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyvcsshark import metrics
+from pyvcsshark.pipeline import WorkerPool
+from pyvcsshark.progress import ProgressReporter, format_duration
+
+
+class StoringWorker(multiprocessing.Process):
+
+    def run(self):
+        for i in range(50):
+            metrics.increment(metrics.COMMITS_PARSED)
+            metrics.increment(metrics.COMMITS_STORED)
+
+
+class ProgressTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'progress.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_format_duration(self):
+        self.assertEqual('1:01:05', format_duration(3665.4))
+        self.assertEqual('unknown', format_duration(None))
+
+    def test_progress_of_workers(self):
+        reporter = ProgressReporter(interval=60, json_path=self.path)
+        reporter.number_of_commits = 400
+        reporter.start()
+
+        worker_pool = WorkerPool()
+        for i in range(4):
+            worker_pool.start('write', StoringWorker())
+        worker_pool.join('write')
+
+        progress = reporter.report()
+        self.assertEqual(200, progress['parsed'])
+        self.assertEqual(200, progress['stored'])
+        self.assertGreater(progress['rate'], 0)
+        # Half of the commits are stored, at the current rate the other half takes as long
+        self.assertAlmostEqual(200 / progress['rate'], progress['eta'])
+
+        reporter.stop()
+        with open(self.path, 'r') as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(2, len(lines))
+        self.assertEqual(400, lines[-1]['total'])
+        # No commit was stored since the last report, therefore the average rate is used
+        self.assertEqual(0, lines[-1]['rate'])
+        self.assertAlmostEqual(200 / lines[-1]['average_rate'], lines[-1]['eta'])
+
+    def test_unknown_total(self):
+        reporter = ProgressReporter(interval=60)
+        reporter.start()
+        metrics.increment(metrics.COMMITS_STORED)
+        self.assertIsNone(reporter.report()['eta'])
+        reporter.stop()
+
+    def test_shares_counters_with_exporter(self):
+        exporter = metrics.MetricsExporter(os.path.join(self.directory, 'vcsshark.prom'), WorkerPool(), 'project')
+        exporter.start()
+        reporter = ProgressReporter(interval=60)
+        reporter.start()
+        metrics.increment(metrics.COMMITS_PARSED)
+        self.assertIs(exporter.counters, reporter.counters)
+        self.assertEqual(1, reporter.report()['parsed'])
+        exporter.stop()
+        reporter.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
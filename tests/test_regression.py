@@ -0,0 +1,78 @@
+import argparse
+import unittest
+
+from benchmarks.regression import compare, create_baseline, format_comparisons, parse_tolerances
+from tests.repogen import RepositorySpec
+
+
+def entry(benchmark, commits=100, commits_per_s=100.0, peak_rss=1000, **extra):
+    return dict({'benchmark': benchmark, 'commits': commits, 'seconds': commits / commits_per_s,
+                 'commits_per_s': commits_per_s, 'peak_rss': peak_rss}, **extra)
+
+
+class RegressionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.baseline = create_baseline(RepositorySpec(commits=100), 4, 'binary', [
+            entry('parse (discard)'),
+            entry('end-to-end (mongo)', db_operations_per_commit=10.0),
+            {'benchmark': 'end-to-end (discard)', 'skipped': 'reason'},
+        ])
+
+    def regressions(self, results, tolerances=None):
+        return [(comparison['benchmark'], comparison['metric'])
+                for comparison in compare(self.baseline, results, tolerances) if comparison['regressed']]
+
+    def test_baseline(self):
+        self.assertEqual(['end-to-end (mongo)', 'parse (discard)'], sorted(self.baseline['benchmarks']))
+        self.assertEqual(100, self.baseline['spec']['commits'])
+        self.assertEqual({'commits': 100, 'commits_per_s': 100.0, 'peak_rss': 1000, 'db_operations_per_commit': 10.0},
+                         self.baseline['benchmarks']['end-to-end (mongo)'])
+
+    def test_within_tolerance(self):
+        results = [entry('parse (discard)', commits_per_s=80.0, peak_rss=1100),
+                   entry('end-to-end (mongo)', commits_per_s=300.0, db_operations_per_commit=10.5)]
+        self.assertEqual([], self.regressions(results))
+
+    def test_regressions(self):
+        results = [entry('parse (discard)', commits_per_s=70.0, peak_rss=1300),
+                   entry('end-to-end (mongo)', commits=99, db_operations_per_commit=12.0)]
+        self.assertEqual([('parse (discard)', 'commits_per_s'), ('parse (discard)', 'peak_rss'),
+                          ('end-to-end (mongo)', 'commits'), ('end-to-end (mongo)', 'db_operations_per_commit')],
+                         self.regressions(results))
+
+        # The tolerances can be overridden
+        self.assertEqual([('parse (discard)', 'peak_rss')], self.regressions(results[:1], {'commits_per_s': 0.5}))
+
+    def test_skipped_and_new_benchmarks(self):
+        results = [entry('parse (discard)'), {'benchmark': 'end-to-end (mongo)', 'skipped': 'no mongodb'},
+                   {'benchmark': 'new', 'skipped': 'reason'}]
+        self.assertEqual([('end-to-end (mongo)', 'commits'), ('end-to-end (mongo)', 'commits_per_s'),
+                          ('end-to-end (mongo)', 'db_operations_per_commit'), ('end-to-end (mongo)', 'peak_rss')],
+                         self.regressions(results))
+
+        results = [entry('new', commits_per_s=1.0)]
+        self.assertEqual([('new', 'commits'), ('new', 'commits_per_s'), ('new', 'peak_rss')],
+                         self.regressions(results))
+
+    def test_missing_metrics(self):
+        results = [entry('parse (discard)'), entry('end-to-end (mongo)')]
+        comparisons = [comparison for comparison in compare(self.baseline, results) if comparison['regressed']]
+        self.assertEqual([('end-to-end (mongo)', 'db_operations_per_commit', 10.0, None)],
+                         [(comparison['benchmark'], comparison['metric'], comparison['baseline'], comparison['value'])
+                          for comparison in comparisons])
+        self.assertIn('missing', format_comparisons(comparisons)[1])
+
+        # A metric, which no benchmark of the baseline has, can not be enforced and is reported
+        baseline = create_baseline(RepositorySpec(commits=100), 4, 'binary', [entry('parse (discard)')])
+        self.assertEqual([(None, 'db_operations_per_commit')],
+                         [(comparison['benchmark'], comparison['metric'])
+                          for comparison in compare(baseline, [entry('parse (discard)')]) if comparison['regressed']])
+
+    def test_parse_tolerances(self):
+        self.assertEqual({'peak_rss': 0.5}, parse_tolerances(['peak_rss=0.5']))
+        self.assertRaises(argparse.ArgumentTypeError, parse_tolerances, ['seconds=0.5'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pygit2
+
+from tests.repogen import RepositorySpec, generate_repository
+from pyvcsshark.parser.gitparser import GitParser
+
+
+class RepositoryGeneratorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.spec = RepositorySpec(commits=60, files=20, branches=3, tags=4, rename_rate=0.3, copy_rate=0.3,
+                                   binary_rate=0.3, huge_hunk_rate=0.1, huge_hunk_lines=100, merge_rate=0.2,
+                                   octopus_rate=0.2)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_deterministic(self):
+        first = generate_repository(os.path.join(self.path, 'first'), self.spec)
+        second = generate_repository(os.path.join(self.path, 'second'), self.spec)
+        self.assertDictEqual(dict(first, path=None), dict(second, path=None))
+        self.assertEqual(pygit2.Repository(first['path']).head.target, pygit2.Repository(second['path']).head.target)
+
+    def test_parser_reads_repository(self):
+        statistics = generate_repository(os.path.join(self.path, 'repository'), self.spec)
+        self.assertEqual(60, statistics['commits'])
+        self.assertEqual(4, statistics['tags'])
+
+        parser = GitParser()
+        self.assertTrue(parser.detect(statistics['path']))
+        parser.initialize()
+        self.assertEqual(60, parser.get_number_of_commits())
+        self.assertIn('origin/master', parser.branches)
+        self.assertTrue(parser.branches['origin/master']['is_origin_head'])
+
+        # The history contains octopus merges
+        repository = pygit2.Repository(statistics['path'])
+        self.assertTrue(any(len(repository[commit_hash].parents) > 2 for commit_hash in parser.commits_to_be_processed))
+
+
+if __name__ == "__main__":
+    unittest.main()
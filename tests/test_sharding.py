@@ -0,0 +1,199 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from tests.datastoremock import DiscardStore, create_config
+from tests.repogen import RepositorySpec, generate_repository
+from pyvcsshark.datastores.basestore import BaseStore
+from pyvcsshark.parser.gitparser import GitParser
+from pyvcsshark.sharding import ShardCoordinator, ShardDirectory, ShardWorker
+
+
+def claim_all(path, worker_name, number_of_shards, results):
+    directory = ShardDirectory(path)
+    results.put((worker_name, [shard_id for shard_id in range(number_of_shards)
+                               if directory.claim(shard_id, worker_name)]))
+
+
+class ShardStore(DiscardStore, BaseStore):
+    """ Datastore, which discards the commits. It fails in the worker processes, in which failing is set. """
+    failing = False
+
+    @property
+    def store_identifier(self):
+        return 'shardtest'
+
+    def initialize(self, config, repository_url, repository_type):
+        if ShardStore.failing:
+            raise Exception("Datastore failed")
+        DiscardStore.initialize(self, config, repository_url, repository_type)
+
+
+def claim_and_die(path):
+    """ Claims the first shard and dies without releasing or renewing it """
+    directory = ShardDirectory(path)
+    while directory.read_plan() is None:
+        time.sleep(0.05)
+    os._exit(0 if directory.claim(0, 'dying') else 1)
+
+
+def run_worker(config, worker_name, failing=False, delay=0):
+    ShardStore.failing = failing
+    time.sleep(delay)
+    ShardWorker(config, worker_name)
+
+
+class ShardDirectoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.directory = ShardDirectory(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_plan(self):
+        self.assertIsNone(self.directory.read_plan())
+
+        self.directory.write_plan({'project_url': 'local/test', 'repository_type': 'git',
+                                   'branch_names': ['origin/master']}, [{'a': {'branches': 1, 'tags': []}}, {}])
+        plan = self.directory.read_plan()
+        self.assertEqual(2, plan['shards'])
+        self.assertEqual(['origin/master'], plan['branch_names'])
+        self.assertDictEqual({'a': {'branches': 1, 'tags': []}}, self.directory.read_shard(0))
+
+        self.directory.clear()
+        self.assertIsNone(self.directory.read_plan())
+
+    def test_claim(self):
+        self.assertTrue(self.directory.claim(0, 'worker1'))
+        self.assertFalse(self.directory.claim(0, 'worker2'))
+
+        # A released shard can be claimed again, a done shard can not
+        self.directory.release(0)
+        self.assertTrue(self.directory.claim(0, 'worker2'))
+        self.directory.mark_done(0, {'worker': 'worker2', 'commits': 3, 'elapsed': 0.5})
+        self.directory.release(0)
+        self.assertFalse(self.directory.claim(0, 'worker1'))
+        self.assertDictEqual({0: {'worker': 'worker2', 'commits': 3, 'elapsed': 0.5}}, self.directory.reports())
+
+    def test_every_shard_is_claimed_once(self):
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=claim_all, args=(self.path, 'worker%d' % i, 50, results))
+                     for i in range(4)]
+        for process in processes:
+            process.start()
+        claimed = [results.get() for process in processes]
+        for process in processes:
+            process.join()
+
+        self.assertListEqual(list(range(50)), sorted(shard_id for worker, shards in claimed for shard_id in shards))
+
+    def test_lease(self):
+        self.assertTrue(self.directory.claim(0, 'worker1', lease=60))
+        self.assertTrue(self.directory.renew(0, 'worker1'))
+        self.assertFalse(self.directory.claim(0, 'worker2', lease=60))
+        self.assertEqual(1, self.directory.living_claims(1, lease=60))
+
+        # The claim of a dead worker, which is not renewed, expires
+        old = time.time() - 120
+        os.utime(self.directory.shard_file(0, 'claimed'), (old, old))
+        self.assertEqual(0, self.directory.living_claims(1, lease=60))
+        self.assertTrue(self.directory.claim(0, 'worker2', lease=60))
+        self.assertFalse(self.directory.renew(0, 'worker1'))
+
+        # A worker only releases its own claim
+        self.directory.release(0, 'worker1')
+        self.assertFalse(self.directory.claim(0, 'worker3', lease=60))
+
+
+class ShardedRunTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.repository = generate_repository(os.path.join(self.path, 'repository'),
+                                              RepositorySpec(commits=40, files=10))['path']
+        self.config = create_config(self.repository, 'shardtest', 2, 'binary')
+        self.config.shard_dir = os.path.join(self.path, 'shards')
+        self.config.shards = 4
+        self.config.shard_timeout = 30
+        self.config.shard_lease = 2
+        self.poll_intervals = ShardCoordinator.POLL_INTERVAL, ShardWorker.POLL_INTERVAL
+        ShardCoordinator.POLL_INTERVAL = ShardWorker.POLL_INTERVAL = 0.1
+
+    def tearDown(self):
+        ShardCoordinator.POLL_INTERVAL, ShardWorker.POLL_INTERVAL = self.poll_intervals
+        shutil.rmtree(self.path)
+
+    def start_worker(self, worker_name, failing=False, delay=0):
+        process = multiprocessing.Process(target=run_worker, args=(self.config, worker_name, failing, delay))
+        process.start()
+        self.addCleanup(process.join)
+        return process
+
+    def test_run_with_failing_worker(self):
+        # The failing worker claims the first shard, before the other workers start
+        workers = [self.start_worker('failing', failing=True), self.start_worker('worker1', delay=0.5),
+                   self.start_worker('worker2', delay=0.5)]
+        coordinator = ShardCoordinator(self.config)
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual([1, 0, 0], [worker.exitcode for worker in workers])
+        self.assertListEqual([0, 1, 2, 3], sorted(coordinator.reports))
+        self.assertEqual(40, sum(report['commits'] for report in coordinator.reports.values()))
+        self.assertEqual({'worker1', 'worker2'}, set(report['worker'] for report in coordinator.reports.values()))
+
+    def test_expired_claim_of_dead_worker(self):
+        dying_worker = multiprocessing.Process(target=claim_and_die, args=(self.config.shard_dir,))
+        dying_worker.start()
+        self.addCleanup(dying_worker.join)
+        worker = self.start_worker('worker1', delay=1)
+        coordinator = ShardCoordinator(self.config)
+        worker.join()
+        dying_worker.join()
+
+        # The worker took over the shard of the dying worker after its claim expired
+        self.assertEqual(0, dying_worker.exitcode)
+        self.assertEqual(0, worker.exitcode)
+        self.assertListEqual([0, 1, 2, 3], sorted(coordinator.reports))
+        self.assertEqual({'worker1'}, set(report['worker'] for report in coordinator.reports.values()))
+
+    def test_timeout_without_workers(self):
+        self.config.shard_timeout = 1
+        with self.assertRaises(Exception):
+            ShardCoordinator(self.config)
+
+
+class GitParserShardTest(unittest.TestCase):
+
+    def test_split_and_load_shard(self):
+        parser = GitParser()
+        branches = parser.branch_registry.get_bit('origin/master') | parser.branch_registry.get_bit('origin/feature')
+        for i in range(10):
+            parser.add_branch('%040d' % i, 'origin/master')
+
+        shards = parser.split(3)
+        self.assertListEqual([3, 3, 4], [len(shard) for shard in shards])
+        self.assertListEqual(['%040d' % i for i in range(10)], [commit for shard in shards for commit in shard])
+        self.assertDictEqual({}, parser.commits_to_be_processed)
+
+        worker_parser = GitParser()
+        worker_parser.load_shard(['origin/master', 'origin/feature'], shards[1])
+        self.assertEqual(branches, worker_parser.branch_registry.get_bit('origin/master') |
+                         worker_parser.branch_registry.get_bit('origin/feature'))
+        self.assertEqual(3, worker_parser.commit_queue.qsize())
+        self.assertEqual(['origin/master'], worker_parser.branch_registry.names(
+            worker_parser.commits_to_be_processed['%040d' % 3]['branches']))
+
+    def test_split_into_more_shards_than_commits(self):
+        parser = GitParser()
+        parser.add_branch('%040d' % 0, 'origin/master')
+        self.assertEqual(1, len(parser.split(4)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyvcsshark import slowcommits
+from pyvcsshark.parser.models import CommitModel, FileModel, Hunk, PeopleModel
+from pyvcsshark.pipeline import WorkerPool
+
+
+def create_commit(revision_hash, files, hunks_per_file=1):
+    changed_files = []
+    for i in range(files):
+        changed_file = FileModel('file%d.py' % i, 10, 0, 10, False, 'R' if i == 0 else 'M')
+        changed_file.hunks = [Hunk(1, 0, 1, 10, '+line\n' * 10) for j in range(hunks_per_file)]
+        changed_files.append(changed_file)
+    people = PeopleModel('Author', 'author@example.com')
+    return CommitModel(revision_hash, 1, [], ['0' * 40], people, people, 'message', changed_files, 0, 0, 0, 0)
+
+
+class ParsingWorker(multiprocessing.Process):
+
+    def __init__(self, offset):
+        multiprocessing.Process.__init__(self)
+        self.offset = offset
+
+    def run(self):
+        for i in range(5):
+            commit = create_commit('commit%d' % (self.offset + i), i + 1)
+            slowcommits.record('parse', commit.id, self.offset + i, lambda: slowcommits.commit_features(commit))
+
+
+class SlowCommitsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_keeps_slowest(self):
+        computed = []
+
+        def features():
+            computed.append(True)
+            return {}
+
+        slow_commits = slowcommits.SlowCommits(top=3)
+        for seconds in [5, 1, 7, 3, 2, 9, 4]:
+            slow_commits.record('parse', 'commit%d' % seconds, seconds, features)
+
+        self.assertEqual([9, 7, 5], [commit['seconds'] for commit in slow_commits.summary()['parse']])
+        # The size of commits, which are faster than the slowest ones, is not computed
+        self.assertEqual(5, len(computed))
+
+    def test_commit_features(self):
+        features = slowcommits.commit_features(create_commit('a' * 40, 3, hunks_per_file=2))
+        self.assertEqual({'parents': 1, 'files': 3, 'hunks': 6, 'hunk_size': 360, 'renames': 1,
+                          'rename_detection': True}, features)
+
+    def test_catalogue(self):
+        catalogue = slowcommits.SlowCommitCatalogue(os.path.join(self.directory, 'slow.json'), top=4)
+        catalogue.start()
+        worker_pool = WorkerPool()
+        worker_pool.wrappers.append(catalogue.wrap)
+        for offset in (0, 10):
+            worker_pool.start('diff', ParsingWorker(offset))
+        worker_pool.join('diff')
+        stages = catalogue.stop()
+
+        self.assertEqual(['commit14', 'commit13', 'commit12', 'commit11'],
+                         [commit['revision_hash'] for commit in stages['parse']])
+        self.assertEqual(5, stages['parse'][0]['files'])
+
+        with open(catalogue.path, 'r') as f:
+            report = json.load(f)
+        self.assertEqual(4, report['top'])
+        self.assertEqual(stages['parse'], report['stages']['parse'])
+
+        # Without a catalogue, the commits are not recorded
+        slowcommits.record('parse', 'commit', 1, lambda: self.fail('features computed'))
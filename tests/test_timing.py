@@ -0,0 +1,82 @@
+import multiprocessing
+import threading
+import unittest
+
+from pyvcsshark import timing
+from pyvcsshark.pipeline import WorkerPool
+
+
+class TimedWorker(multiprocessing.Process):
+
+    def run(self):
+        for i in range(10):
+            timing.record('worker.step', 0.002)
+
+
+class TimingTest(unittest.TestCase):
+
+    def setUp(self):
+        timing.reset()
+
+    def test_histogram(self):
+        histogram = timing.Histogram()
+        for seconds in [0.0000001, 0.001, 0.001, 0.003, 1.5]:
+            histogram.add(seconds)
+
+        self.assertEqual(5, histogram.count)
+        self.assertAlmostEqual(1.5050001, histogram.total)
+        self.assertEqual(1.5, histogram.maximum)
+        self.assertEqual(1, histogram.buckets[0])
+
+        # The percentiles are the upper bounds of their buckets, but never above the maximum
+        self.assertEqual(1024 / 1000000.0, histogram.percentile(0.5))
+        self.assertEqual(1.5, histogram.percentile(0.99))
+
+        other = timing.Histogram()
+        other.add(2.0)
+        histogram.merge(other)
+        self.assertEqual(6, histogram.count)
+        self.assertEqual(2.0, histogram.maximum)
+
+    def test_snapshot_merges_threads(self):
+        with timing.timed('main.step'):
+            pass
+        thread = threading.Thread(target=timing.record, args=('main.step', 0.5))
+        thread.start()
+        thread.join()
+
+        histograms = timing.snapshot()
+        self.assertEqual(['main.step'], list(histograms))
+        self.assertEqual(2, histograms['main.step'].count)
+        self.assertEqual(0.5, histograms['main.step'].maximum)
+
+    def test_timed_lock(self):
+        lock = timing.TimedLock(threading.Lock(), 'lock_wait')
+        with lock:
+            self.assertTrue(lock.lock.locked())
+        self.assertFalse(lock.lock.locked())
+        self.assertEqual(1, timing.snapshot()['lock_wait'].count)
+
+    def test_collector(self):
+        # Timers of the main process before the collector starts belong to another run
+        timing.record('before.run', 1.0)
+        collector = timing.TimingCollector()
+        collector.start()
+        timing.record('main.step', 0.001)
+
+        worker_pool = WorkerPool()
+        for i in range(3):
+            worker_pool.start('work', TimedWorker())
+        worker_pool.join('work')
+
+        histograms = collector.stop()
+        self.assertEqual(3, collector.reports)
+        self.assertEqual({'main.step', 'worker.step'}, set(histograms))
+        self.assertEqual(30, histograms['worker.step'].count)
+        # The workers do not report the timers, which they inherited from the main process
+        self.assertEqual(1, histograms['main.step'].count)
+
+        report = timing.format_report(histograms, 2.0)
+        self.assertEqual("Execution time: 2.00000 s", report[0])
+        self.assertEqual(4, len(report))
+        self.assertTrue(report[3].startswith('worker.step'))
@@ -0,0 +1,94 @@
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyvcsshark import tracing
+from pyvcsshark.pipeline import WorkerPool
+
+
+def command(name, request_id, collection='commit', duration_micros=1000):
+    return argparse.Namespace(command_name=name, command={name: collection}, connection_id=('localhost', 27017),
+                              request_id=request_id, duration_micros=duration_micros)
+
+
+def send(listener, name, request_id, collection='commit'):
+    event = command(name, request_id, collection)
+    listener.started(event)
+    listener.succeeded(event)
+
+
+class StoringWorker(multiprocessing.Process):
+
+    def run(self):
+        listener = tracing.CommandTracer()
+        for i in range(3):
+            tracing.start_commit('commit%d' % i)
+            for j in range(i + 1):
+                send(listener, 'insert', j, 'hunk')
+            tracing.end_commit()
+
+
+class TracingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_recorder(self):
+        recorder = tracing.CommandRecorder(threshold=2)
+        recorder.start_commit('a' * 40)
+        for i, (name, collection) in enumerate([('find', 'commit'), ('insert', 'file'), ('insert', 'file'),
+                                                ('createIndexes', 'file')]):
+            event = command(name, i, collection)
+            recorder.command_started(event)
+            recorder.command_ended(event)
+        recorder.end_commit()
+
+        # Commands outside of a commit are only counted per collection
+        event = command('update', 10, 'branch')
+        recorder.command_started(event)
+        recorder.command_ended(event)
+
+        summary = recorder.summary()
+        self.assertEqual([2, 0.002], summary['commands'][('insert', 'file')])
+        self.assertEqual(1, summary['commands'][('update', 'branch')][0])
+        self.assertEqual(1, summary['commits'])
+        self.assertEqual({3: 1}, summary['operations_per_commit'])
+        self.assertEqual([('a' * 40, 3, 0.003, {'commit': 1, 'file': 2})], summary['flagged'])
+
+    def test_get_more_collection(self):
+        recorder = tracing.CommandRecorder(threshold=10)
+        event = argparse.Namespace(command_name='getMore', command={'getMore': 123, 'collection': 'hunk'},
+                                   connection_id=1, request_id=1, duration_micros=10)
+        recorder.command_started(event)
+        recorder.command_ended(event)
+        self.assertIn(('getMore', 'hunk'), recorder.summary()['commands'])
+
+    def test_tracer(self):
+        tracer = tracing.DatabaseTracer(os.path.join(self.directory, 'trace.txt'), threshold=2)
+        tracer.start()
+        worker_pool = WorkerPool()
+        worker_pool.wrappers.append(tracer.wrap)
+        for i in range(2):
+            worker_pool.start('write', StoringWorker())
+        worker_pool.join('write')
+        summary = tracer.stop()
+
+        self.assertEqual(6, summary['commits'])
+        self.assertEqual([12, 0.012], summary['commands'][('insert', 'hunk')])
+        self.assertEqual({1: 2, 2: 2, 3: 2}, summary['operations_per_commit'])
+        self.assertEqual(3, tracing.max_operations_per_commit(summary))
+        self.assertEqual(['commit2', 'commit2'], [commit[0] for commit in summary['flagged']])
+
+        with open(tracer.path, 'r') as f:
+            report = f.read()
+        self.assertIn('2 commits with more than 2 operations:', report)
+
+        # Without a tracer, the commits are not recorded
+        tracing.start_commit('commit')
+        tracing.end_commit()
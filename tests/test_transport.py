@@ -0,0 +1,93 @@
+import multiprocessing
+import os
+import unittest
+
+from pyvcsshark.transport import TRANSPORTS, create_transport
+
+
+def produce(transport, producer_id, count):
+    for i in range(count):
+        # Sizes vary, so that the ring buffer needs to wrap around, some items do not fit into it at all
+        transport.put(('%d-%d;' % (producer_id, i) * (i % 7 * 120 + 1)).encode('ascii'))
+
+
+def consume(transport, results):
+    while True:
+        data = transport.get()
+        if data is None:
+            transport.task_done()
+            break
+        results.put(bytes(data).split(b';')[0].decode('ascii'))
+        transport.release()
+        transport.task_done()
+
+
+def consume_and_die(transport):
+    transport.get()
+    os._exit(1)
+
+
+class TransportTest(unittest.TestCase):
+
+    def run_transport(self, transport, producers=3, consumers=2, count=200):
+        results = multiprocessing.Queue()
+        consumer_processes = [multiprocessing.Process(target=consume, args=(transport, results))
+                              for i in range(consumers)]
+        producer_processes = [multiprocessing.Process(target=produce, args=(transport, i, count))
+                              for i in range(producers)]
+        for process in consumer_processes + producer_processes:
+            process.start()
+        for process in producer_processes:
+            process.join()
+        for i in range(consumers):
+            transport.put(None)
+
+        transport.join()
+        received = [results.get(timeout=10) for i in range(producers * count)]
+        for process in consumer_processes:
+            process.join()
+
+        self.assertEqual(0, transport.qsize())
+        self.assertSetEqual({'%d-%d' % (p, i) for p in range(producers) for i in range(count)}, set(received))
+        self.assertEqual(producers * count, len(received))
+
+    def test_queue_transport(self):
+        transport = create_transport('queue')
+        self.run_transport(transport)
+        transport.close()
+
+    @unittest.skipUnless('shm' in TRANSPORTS, 'shared memory needs python 3.8')
+    def test_shared_memory_transport(self):
+        transport = create_transport('shm', 4096)
+        self.run_transport(transport)
+        transport.close()
+
+    @unittest.skipUnless('shm' in TRANSPORTS, 'shared memory needs python 3.8')
+    def test_reclaim_of_dead_consumer(self):
+        transport = create_transport('shm', 4096)
+        transport.put(b'x' * 2000)
+        transport.put(b'y' * 100)
+        consumer = multiprocessing.Process(target=consume_and_die, args=(transport,))
+        consumer.start()
+        consumer.join()
+
+        # The first record is still held by the dead consumer, therefore the released second one can not be freed
+        self.assertEqual(b'y' * 100, bytes(transport.get()))
+        transport.release()
+        self.assertEqual(0, transport._get(transport._FREE_POSITION))
+
+        transport.reclaim(consumer.pid)
+        self.assertEqual(transport._get(transport._READ_POSITION), transport._get(transport._FREE_POSITION))
+        # Without the reclaimed space, the producer would wait forever
+        transport.put(b'z' * 2000)
+        self.assertEqual(b'z' * 2000, bytes(transport.get()))
+        transport.release()
+        transport.close()
+
+    def test_unknown_transport(self):
+        with self.assertRaises(Exception):
+            create_transport('nonsense')
+
+
+if __name__ == "__main__":
+    unittest.main()